@@ -1,12 +1,11 @@
 """
 These methods are responsible for generation of pairs of nodes for which we will be calculating
 and summing the flow.
+
+Pairs are structured arrays of pair_dtype, with the ids (or matrix indexes) of the two nodes and
+the mean of their weights.
 """
-from itertools import combinations, repeat, product, cycle
-from copy import copy
-import random
-from typing import Union, List, Tuple
-import collections.abc
+from typing import Union, List, Tuple, Iterator
 import numpy as np
 
 from bioflow.utils.log_behavior import get_logger
@@ -14,6 +13,8 @@ from bioflow.utils.general_utils import _is_int
 
 log = get_logger(__name__)
 
+pair_dtype = np.dtype([('i', np.int64), ('j', np.int64), ('mean_weight', np.float64)])
+
 
 def reduce_and_deduplicate_sample(sample: Union[List[int], List[Tuple[int, float]]]) \
         -> List[Tuple[int, float]]:
@@ -29,23 +30,53 @@ def reduce_and_deduplicate_sample(sample: Union[List[int], List[Tuple[int, float
     if _is_int(sample[0]):
         sample = [(node_id, 1) for node_id in sample]
 
-
     np_sample = np.array(sample).astype(float)
-    u, c = np.unique(np_sample[:, 0], return_counts=True)
-    dup = u[c > 1]
+    u, first_occurrence, inverse, c = np.unique(np_sample[:, 0], return_index=True,
+                                                return_inverse=True, return_counts=True)
+
+    if np.any(c > 1):
+        # weights of the duplicates are summed on their first occurrence
+        summed_weights = np.bincount(inverse.ravel(), weights=np_sample[:, 1])
+        order = np.argsort(first_occurrence)
+        sample = [(node_id, _value) for node_id, _value
+                  in zip(u[order].tolist(), summed_weights[order].tolist()) if _value > 0]
 
-    if len(dup) > 0:
+    return sample
 
-        for dup_id in dup:
-            _mask = np_sample[:, 0] == dup_id
-            sum_weight = np.sum(np_sample[_mask, 1])
-            np_sample[_mask, 1] = 0
-            np_sample[_mask[0], 1] = sum_weight
 
-        sample = np_sample.tolist()
-        sample = [(node_id, _value) for node_id, _value in sample if _value > 0]
+def as_pair_array(pairs: Union[np.ndarray,
+                               List[Tuple[Tuple[int, float], Tuple[int, float]]]]) -> np.ndarray:
+    """
+    Converts pairs to a structured array of pair_dtype, in case they were provided as a list of
+    ((id, weight), (id, weight)) tuples
 
-    return sample
+    :param pairs: pairs of nodes
+    :return: structured array of pair_dtype
+    """
+    if isinstance(pairs, np.ndarray) and pairs.dtype == pair_dtype:
+        return pairs
+
+    pair_array = np.empty(len(pairs), dtype=pair_dtype)
+
+    if len(pairs) > 0:
+        flat_pairs = np.array([(i[0], j[0], i[1], j[1]) for i, j in pairs], dtype=np.float64)
+        pair_array['i'] = flat_pairs[:, 0]
+        pair_array['j'] = flat_pairs[:, 1]
+        pair_array['mean_weight'] = (flat_pairs[:, 2] + flat_pairs[:, 3]) / 2.
+
+    return pair_array
+
+
+def iterate_pair_chunks(pairs: np.ndarray, chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    Iterates over consecutive chunks of pairs
+
+    :param pairs: structured array of pair_dtype
+    :param chunk_size: max number of pairs in a chunk
+    :return: iterator over the chunks
+    """
+    for chunk_start in range(0, pairs.shape[0], chunk_size):
+        yield pairs[chunk_start:chunk_start + chunk_size]
 
 
 def evaluate_ops(prim_len: int, sec_len: int,
@@ -104,50 +135,149 @@ def reduce_ops(prim_len, sec_len, max_ops) -> int:
             return max(max_ops // prim_len, 5)
 
 
-def general_flow(sample: Union[List[int], List[Tuple[int, float]]],
-                 secondary_sample: Union[List[int], List[Tuple[int, float]], None] = None,
-                 sparse_rounds: int = -1) -> List[Tuple[Tuple[int, float], Tuple[int, float]]]:
+def _build_pairs(ids_1: np.ndarray, weights_1: np.ndarray,
+                 ids_2: np.ndarray, weights_2: np.ndarray,
+                 positions_1: np.ndarray, positions_2: np.ndarray) -> np.ndarray:
+    pairs = np.empty(positions_1.shape[0], dtype=pair_dtype)
+    pairs['i'] = ids_1[positions_1]
+    pairs['j'] = ids_2[positions_2]
+    pairs['mean_weight'] = (weights_1[positions_1] + weights_2[positions_2]) / 2.
+
+    return pairs
+
+
+def _triangle_positions(items: int, linear_positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Performs the information flow computation best matching the provided parameters.
+    Maps the linear positions of the pairs in the (row-major) upper triangle of an items x items
+    matrix to their row and column
+    """
+    row_starts = np.arange(items) * items - np.arange(items) * (np.arange(items) + 1) // 2
+    rows = np.searchsorted(row_starts, linear_positions, side='right') - 1
+    columns = linear_positions - row_starts[rows] + rows + 1
+
+    return rows, columns
+
+
+def general_flow_chunks(sample: Union[List[int], List[Tuple[int, float]]],
+                        secondary_sample: Union[List[int], List[Tuple[int, float]], None] = None,
+                        sparse_rounds: int = -1,
+                        chunk_size: int = 65536) -> Iterator[np.ndarray]:
+    """
+    Generates the pairs of nodes for the information flow computation best matching the
+    provided parameters lazily, in chunks, so that all the pairs are never held at once.
 
     :param sample: primary sample of nodes
     :param secondary_sample: secondary sample of nodes
     :param sparse_rounds: sparse rounds, in case samples are too big
-    :return:
+    :param chunk_size: max number of pairs in a chunk. Sparse rounds are never split
+    :return: iterator over structured arrays of pair_dtype
     """
 
     # TODO: what if we have an overlap between the items in the primary and the secondary
     #  samples?
 
-    sample = reduce_and_deduplicate_sample(sample)
+    sample = np.array(reduce_and_deduplicate_sample(sample), dtype=np.float64).reshape(-1, 2)
+    ids_1, weights_1 = sample[:, 0].astype(np.int64), sample[:, 1]
 
     if secondary_sample is None:  # connex flow
+        items = ids_1.shape[0]
 
         if sparse_rounds > 0:
-            list_of_pairs = []
-            for _ in repeat(None, sparse_rounds):
-                idx_list_c = copy(sample)
-                random.shuffle(idx_list_c)
-                list_of_pairs += list(zip(idx_list_c[:len(idx_list_c) // 2],
-                                     idx_list_c[len(idx_list_c) // 2:]))
+            half = items // 2
+            rounds_per_chunk = max(1, chunk_size // max(half, 1))
+
+            for round_start in range(0, sparse_rounds, rounds_per_chunk):
+                rounds = min(rounds_per_chunk, sparse_rounds - round_start)
+                shuffles = np.argsort(np.random.random_sample((rounds, items)), axis=1)
+                yield _build_pairs(ids_1, weights_1, ids_1, weights_1,
+                                   shuffles[:, :half].ravel(), shuffles[:, half:2 * half].ravel())
+
         else:
-            list_of_pairs = [(i, j) for i, j in combinations(set(sample), 2)]
+            total_pairs = items * (items - 1) // 2
+
+            for chunk_start in range(0, total_pairs, chunk_size):
+                rows, columns = _triangle_positions(
+                    items, np.arange(chunk_start, min(chunk_start + chunk_size, total_pairs)))
+                yield _build_pairs(ids_1, weights_1, ids_1, weights_1, rows, columns)
 
     else:
 
-        secondary_sample = reduce_and_deduplicate_sample(secondary_sample)
+        secondary_sample = np.array(reduce_and_deduplicate_sample(secondary_sample),
+                                    dtype=np.float64).reshape(-1, 2)
+        ids_2, weights_2 = secondary_sample[:, 0].astype(np.int64), secondary_sample[:, 1]
 
         if sparse_rounds > 0:
-            list_of_pairs = []
-            for _ in range(sparse_rounds):
-                idx_list_1 = copy(sample)
-                idx_list_2 = copy(secondary_sample)
-                random.shuffle(idx_list_1)
-                random.shuffle(idx_list_2)
-                list_of_pairs += list(zip(idx_list_1, cycle(idx_list_2)))
+            rounds_per_chunk = max(1, chunk_size // max(ids_1.shape[0], 1))
+            # the primary sample is paired with the cycled secondary sample
+            cycled = np.arange(ids_1.shape[0]) % ids_2.shape[0]
+
+            for round_start in range(0, sparse_rounds, rounds_per_chunk):
+                rounds = min(rounds_per_chunk, sparse_rounds - round_start)
+                shuffles_1 = np.argsort(np.random.random_sample((rounds, ids_1.shape[0])), axis=1)
+                shuffles_2 = np.argsort(np.random.random_sample((rounds, ids_2.shape[0])), axis=1)
+                yield _build_pairs(ids_1, weights_1, ids_2, weights_2,
+                                   shuffles_1.ravel(), shuffles_2[:, cycled].ravel())
 
         else:
-            list_of_pairs = [(i, j) for i, j in product(sample, secondary_sample)]
+            total_pairs = ids_1.shape[0] * ids_2.shape[0]
+
+            for chunk_start in range(0, total_pairs, chunk_size):
+                rows, columns = np.divmod(
+                    np.arange(chunk_start, min(chunk_start + chunk_size, total_pairs)),
+                    ids_2.shape[0])
+                yield _build_pairs(ids_1, weights_1, ids_2, weights_2, rows, columns)
+
+
+def general_flow(sample: Union[List[int], List[Tuple[int, float]]],
+                 secondary_sample: Union[List[int], List[Tuple[int, float]], None] = None,
+                 sparse_rounds: int = -1) -> np.ndarray:
+    """
+    Performs the information flow computation best matching the provided parameters.
+
+    :param sample: primary sample of nodes
+    :param secondary_sample: secondary sample of nodes
+    :param sparse_rounds: sparse rounds, in case samples are too big
+    :return: structured array of pair_dtype: (id, id, mean weight) of each pair
+    """
+    return concatenate_pair_chunks(general_flow_chunks(sample, secondary_sample, sparse_rounds))
 
-    return list_of_pairs
 
+def concatenate_pair_chunks(pair_chunks: Iterator[np.ndarray]) -> np.ndarray:
+    """
+    Gathers chunks of pairs into a single array, for the engines that need all the pairs at once
+
+    :param pair_chunks: iterator over structured arrays of pair_dtype
+    :return: structured array of pair_dtype
+    """
+    chunks = list(pair_chunks)
+
+    if not chunks:
+        return np.empty(0, dtype=pair_dtype)
+
+    return np.concatenate(chunks)
+
+
+def flow_pair_chunks(flow_calculation_method,
+                     sample: Union[List[int], List[Tuple[int, float]]],
+                     secondary_sample: Union[List[int], List[Tuple[int, float]], None] = None,
+                     sparse_rounds: int = -1,
+                     chunk_size: int = 65536) -> Iterator[np.ndarray]:
+    """
+    Generates the pairs of nodes of a flow calculation method in chunks. Pairs of the
+    general_flow policy are generated lazily, those of other methods are generated at once and
+    then split.
+
+    :param flow_calculation_method: the function that converts the sample signature (sample,
+        secondary_sample, sparse_rounds) into pairs
+    :param sample: primary sample of nodes
+    :param secondary_sample: secondary sample of nodes
+    :param sparse_rounds: sparse rounds, in case samples are too big
+    :param chunk_size: max number of pairs in a chunk
+    :return: iterator over structured arrays of pair_dtype
+    """
+    if flow_calculation_method is general_flow:
+        return general_flow_chunks(sample, secondary_sample, sparse_rounds, chunk_size)
+
+    return iterate_pair_chunks(
+        as_pair_array(flow_calculation_method(sample, secondary_sample, sparse_rounds)),
+        chunk_size)
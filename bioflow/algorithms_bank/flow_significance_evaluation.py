@@ -1,12 +1,18 @@
+import os
+import hashlib
 import numpy as np
 from scipy.stats import gumbel_r
-from typing import List
+from typing import List, Tuple, Union
 
 from bioflow.utils.log_behavior import get_logger
+from bioflow.configs.main_configs import Dumps
 
 
 log = get_logger(__name__)
 
+# fitted gumbel parameters: {(null model hash, degree): (mu, beta)}
+_gumbel_fit_cache = {}
+
 
 def get_neighboring_degrees(degree: int,
                             max_array: np.array,
@@ -71,3 +77,400 @@ def get_p_val_by_gumbel(entry: np.array,
     p_vals = 1 - frozen_gumbel.cdf(entry)
 
     return p_vals
+
+
+
+def _gumbel_fit_location(null_model_hash: str) -> str:
+    return os.path.join(Dumps.gumbel_fit_cache, '%s.npy' % null_model_hash)
+
+
+def _load_gumbel_fits(null_model_hash: str):
+    location = _gumbel_fit_location(null_model_hash)
+
+    if not os.path.isfile(location):
+        return
+
+    try:
+        fits = np.load(location, allow_pickle=False)
+    except (OSError, ValueError) as error:
+        log.warning('gumbel fit cache: failed to load fits from %s: %s', location, error)
+        return
+
+    for degree, mu, beta in fits.tolist():
+        _gumbel_fit_cache[(null_model_hash, degree)] = (mu, beta)
+
+
+def _save_gumbel_fits(null_model_hash: str):
+    if not os.path.isdir(Dumps.gumbel_fit_cache):
+        os.makedirs(Dumps.gumbel_fit_cache)
+
+    fits = np.array([(key[1], mu, beta)
+                     for key, (mu, beta) in _gumbel_fit_cache.items()
+                     if key[0] == null_model_hash])
+    temporary_location = _gumbel_fit_location(null_model_hash) + '.%s.tmp.npy' % os.getpid()
+    np.save(temporary_location, fits)
+    os.replace(temporary_location, _gumbel_fit_location(null_model_hash))
+
+
+def fit_gumbel(max_set: np.ndarray) -> Tuple[float, float]:
+    """
+    Fits a gumbel distribution by maximum likelihood, starting from the method of moments
+    estimate, which is close to the optimum for the per-run maxima
+
+    :param max_set: background set of maximum values achieved during blanc sampling runs
+    :return: mu, beta
+    """
+    beta_0 = max(np.std(max_set) * np.sqrt(6) / np.pi, np.finfo(np.float64).eps)
+    mu_0 = np.mean(max_set) - np.euler_gamma * beta_0
+
+    mu, beta = gumbel_r.fit(max_set, loc=mu_0, scale=beta_0)
+
+    return mu, beta
+
+
+class GumbelSignificanceEngine(object):
+    """
+    Evaluates the significance of the flow through the nodes against the maxima of the flow
+    through the nodes of the same (or neighbouring) degree achieved in each random sample.
+    Equivalent to calling get_neighboring_degrees and get_p_val_by_gumbel for each degree, but
+    the maxima are indexed by degree once and the gumbel fits are cached for each null model.
+    """
+
+    def __init__(self, max_array: np.ndarray, min_nodes: int = 10, persistent: bool = True):
+        """
+        :param max_array: maximum nodes for a given degree in each run,
+            [[max current, degree], ...].T
+        :param min_nodes: the minimum number of maxima on which a gumbel is fitted. The degree
+            window is widened until that many are found
+        :param persistent: if False, the fits are kept on the engine only and are neither
+            loaded from nor saved to the gumbel fit cache (e.g. for the transient null models
+            of the intermediate adaptive sampling rounds), so that they are dropped with it
+        """
+        order = np.lexsort((max_array[0, :], max_array[1, :]))
+        self.maxima = np.ascontiguousarray(max_array[0, order], dtype=np.float64)
+        self.degrees = np.ascontiguousarray(max_array[1, order], dtype=np.float64)
+        self.min_nodes = min_nodes
+        self.persistent = persistent
+        self._fits = _gumbel_fit_cache if persistent else {}
+
+        self.null_model_hash = hashlib.md5(
+            self.maxima.tobytes() + self.degrees.tobytes() + str(min_nodes).encode()
+        ).hexdigest()
+
+    def neighbor_windows(self, degrees: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds, for each degree, the smallest window of degree +/- an integer containing at least
+        min_nodes maxima
+
+        :param degrees: degrees of the nodes
+        :return: starts, stops of the windows in the degree-sorted maxima
+        """
+        degrees = np.asarray(degrees, dtype=np.float64)
+
+        def window(half_width):
+            return (np.searchsorted(self.degrees, degrees - half_width, side='left'),
+                    np.searchsorted(self.degrees, degrees + half_width, side='right'))
+
+        if self.degrees.shape[0] < self.min_nodes:
+            log.warning('only %d maxima in the null model, while %d are needed for a gumbel fit'
+                        % (self.degrees.shape[0], self.min_nodes))
+
+        if self.degrees.shape[0] == 0:
+            return window(0.)
+
+        low = np.zeros_like(degrees)
+        high = np.ceil(np.maximum(np.abs(degrees - self.degrees[0]),
+                                  np.abs(self.degrees[-1] - degrees)))
+
+        # bisection on the integer half-width, for all the degrees at once
+        while np.any(low < high):
+            middle = np.floor((low + high) / 2)
+            starts, stops = window(middle)
+            enough = stops - starts >= self.min_nodes
+            high = np.where(enough, middle, high)
+            low = np.where(enough, low, np.minimum(middle + 1, high))
+
+        return window(high)
+
+    def gumbel_parameters(self, degrees: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Recovers the gumbel parameters fitted on the maxima of the neighbouring degrees of each
+        degree, fitting only the ones that were not fitted already for this null model
+
+        :param degrees: degrees of the nodes
+        :return: mu, beta for each degree
+        """
+        degrees = np.asarray(degrees, dtype=np.float64)
+        unique_degrees, inverse = np.unique(degrees, return_inverse=True)
+
+        if self.persistent and not any((self.null_model_hash, degree) in self._fits
+                                       for degree in unique_degrees.tolist()):
+            _load_gumbel_fits(self.null_model_hash)
+
+        missing = [degree for degree in unique_degrees.tolist()
+                   if (self.null_model_hash, degree) not in self._fits]
+
+        if missing:
+            starts, stops = self.neighbor_windows(np.array(missing))
+            window_fits = {}
+
+            for degree, start, stop in zip(missing, starts.tolist(), stops.tolist()):
+                if (start, stop) not in window_fits:
+                    window_fits[(start, stop)] = fit_gumbel(self.maxima[start:stop])
+                mu, beta = window_fits[(start, stop)]
+
+                log.debug('deg: %s, gumbel_r fit: mu %.2f, beta: %.2f, on %d maxima'
+                          % (degree, mu, beta, stop - start))
+                self._fits[(self.null_model_hash, degree)] = (mu, beta)
+
+            log.info('gumbel fits: %d degrees fitted on %d windows, %d re-used'
+                     % (len(missing), len(window_fits), unique_degrees.shape[0] - len(missing)))
+            if self.persistent:
+                _save_gumbel_fits(self.null_model_hash)
+
+        fits = np.array([self._fits[(self.null_model_hash, degree)]
+                         for degree in unique_degrees.tolist()]).reshape(-1, 2)
+
+        return fits[inverse, 0], fits[inverse, 1]
+
+    def p_values(self, entries: np.ndarray, degrees: np.ndarray) -> np.ndarray:
+        """
+        Recovers the statistical significance (p-value equivalent) of the values achieved by
+        the nodes in the real hits information flow computation
+
+        :param entries: values achieved by the nodes
+        :param degrees: degrees of the nodes
+        :return: p-values
+        """
+        mu, beta = self.gumbel_parameters(degrees)
+
+        return gumbel_r.sf(np.asarray(entries, dtype=np.float64), loc=mu, scale=beta)
+
+
+
+def p_values_settled(p_values: np.ndarray,
+                     previous_p_values: Union[np.ndarray, None],
+                     samples: int,
+                     p_val_cutoff: float,
+                     confidence: float = 1.96) -> bool:
+    """
+    Decides if the null model is deep enough for the significance of the nodes: the nodes whose
+    p-value is within the confidence bound of the cutoff must have p-values that moved by less
+    than that bound since the previous sampling round. The bound is the standard error of an
+    empirical p-value estimated on the same number of samples, times the confidence factor.
+
+    :param p_values: p-values of the nodes against the current null model
+    :param previous_p_values: p-values of the nodes against the null model of the previous round,
+        None if there was none
+    :param samples: number of random samples in the current null model
+    :param p_val_cutoff: cutoff p-value for the significance of the nodes
+    :param confidence: confidence factor (in standard errors)
+    :return: True if more samples are unlikely to change which nodes are significant
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    bound = confidence * np.sqrt(p_values * (1 - p_values) / samples)
+    near_cutoff = np.abs(p_values - p_val_cutoff) <= bound
+
+    log.info('null model with %d samples: %d nodes within the confidence bound of the cutoff'
+             % (samples, near_cutoff.sum()))
+
+    if not near_cutoff.any():
+        return True
+
+    if previous_p_values is None:
+        return False
+
+    drift = np.abs(p_values - np.asarray(previous_p_values, dtype=np.float64))
+
+    return bool(np.all(drift[near_cutoff] <= bound[near_cutoff]))
+
+class NullModelAccumulator(object):
+    """
+    Streaming aggregate of the node currents of the random samples, so that the null model
+    is built without holding every sample in memory. Keeps, for each run, the max current
+    for each group of nodes (nodes of the same degree), the count, sum and sum of squares of
+    currents for each window key (node degree or informativity), a running histogram of the
+    currents and a bounded uniform subsample of (current, window key) points for plotting.
+    """
+
+    def __init__(self,
+                 max_keys: np.ndarray,
+                 window_keys: np.ndarray,
+                 node_indexes: Union[np.ndarray, None] = None,
+                 limit: float = 0.,
+                 histogram_bins: int = 256,
+                 scatter_points: int = 50000):
+        """
+        :param max_keys: key of the group of each node, for the per-run maxima (node degree)
+        :param window_keys: key of each node for the windowed statistics and the scatter plot
+        :param node_indexes: matrix indexes of the nodes in the current vectors. All if None
+        :param limit: fraction of the max current of a run below which the nodes are ignored
+        :param histogram_bins: number of bins of the running current histogram
+        :param scatter_points: max number of background points kept for plotting
+        """
+        self.node_indexes = node_indexes
+        self.limit = limit
+        self.max_keys, self._max_codes = np.unique(np.asarray(max_keys, dtype=np.float64),
+                                                   return_inverse=True)
+        self.window_keys, self._window_codes = np.unique(
+            np.asarray(window_keys, dtype=np.float64), return_inverse=True)
+        self._node_window_keys = self.window_keys[self._window_codes]
+
+        self.runs = 0
+        self._run_maxima = []
+
+        self.window_counts = np.zeros(self.window_keys.shape[0])
+        self.window_sums = np.zeros(self.window_keys.shape[0])
+        self.window_squares = np.zeros(self.window_keys.shape[0])
+
+        self.histogram_counts = np.zeros(histogram_bins)
+        self.histogram_upper = 0.
+
+        self.scatter_points = scatter_points
+        self._scatter = np.zeros((2, 0))
+        self._scatter_priorities = np.zeros(0)
+
+    def _select(self, currents: np.ndarray) -> np.ndarray:
+        """
+        Selects the nodes above the current limit in each run, relaxing the limit for the runs
+        where fewer than two nodes pass it, as GeneOntologyInterface.format_node_props does.
+        """
+        run_max = currents.max(axis=1, initial=0.)[:, np.newaxis]
+        limit = self.limit
+        selected = currents > run_max * limit
+
+        while limit > 0:
+            relax = selected.sum(axis=1) < 2
+            if not relax.any():
+                break
+            limit /= 100.
+            if limit < np.finfo(np.float64).tiny:
+                limit = 0.
+            selected[relax] = currents[relax] > run_max[relax] * limit
+
+        return selected
+
+    def _extend_histogram(self, upper: float):
+        """
+        Doubles the histogram range, merging pairs of bins, until it covers upper
+        """
+        if self.histogram_upper == 0.:
+            self.histogram_upper = upper * (1 + 1e-9)
+            return
+
+        bins = self.histogram_counts.shape[0]
+        while self.histogram_upper <= upper:
+            merged = self.histogram_counts[::2] + self.histogram_counts[1::2]
+            self.histogram_counts = np.concatenate((merged, np.zeros(bins - merged.shape[0])))
+            self.histogram_upper *= 2
+
+    def add_samples(self, currents: np.ndarray):
+        """
+        Adds a chunk of random samples to the null model
+
+        :param currents: (samples, nodes) currents through the nodes in each random sample,
+            aligned to the matrix indexes
+        :return: None
+        """
+        currents = np.atleast_2d(np.asarray(currents, dtype=np.float64))
+        if self.node_indexes is not None:
+            currents = currents[:, self.node_indexes]
+
+        selected = self._select(currents)
+        non_empty = selected.any(axis=1)
+        if not non_empty.all():
+            log.info('%d random samples without any current ignored' % (~non_empty).sum())
+            currents, selected = currents[non_empty], selected[non_empty]
+        if currents.shape[0] == 0:
+            return
+
+        runs, nodes = np.nonzero(selected)
+        values = currents[runs, nodes]
+
+        run_maxima = np.full((currents.shape[0], self.max_keys.shape[0]), -np.inf)
+        np.maximum.at(run_maxima, (runs, self._max_codes[nodes]), values)
+        self._run_maxima.append(run_maxima)
+        self.runs += currents.shape[0]
+
+        window_codes = self._window_codes[nodes]
+        bins = self.window_keys.shape[0]
+        self.window_counts += np.bincount(window_codes, minlength=bins)
+        self.window_sums += np.bincount(window_codes, weights=values, minlength=bins)
+        self.window_squares += np.bincount(window_codes, weights=values**2, minlength=bins)
+
+        self._extend_histogram(values.max())
+        bins = self.histogram_counts.shape[0]
+        self.histogram_counts += np.bincount(
+            np.minimum((values / self.histogram_upper * bins).astype(np.int64), bins - 1),
+            minlength=bins)
+
+        # reservoir: keep the points with the lowest random priorities
+        priorities = np.concatenate((self._scatter_priorities,
+                                     np.random.random_sample(values.shape[0])))
+        scatter = np.hstack((self._scatter, np.vstack((values, self._node_window_keys[nodes]))))
+        if priorities.shape[0] > self.scatter_points:
+            kept = np.argpartition(priorities, self.scatter_points)[:self.scatter_points]
+            priorities, scatter = priorities[kept], scatter[:, kept]
+        self._scatter_priorities, self._scatter = priorities, scatter
+
+    def max_array(self) -> np.ndarray:
+        """
+        :return: [[max current, degree], ...].T for each degree present in each run, in the
+            format expected by get_neighboring_degrees
+        """
+        if not self._run_maxima:
+            return np.zeros((2, 0))
+
+        run_maxima = np.vstack(self._run_maxima)
+        runs, codes = np.nonzero(np.isfinite(run_maxima))
+
+        return np.vstack((run_maxima[runs, codes], self.max_keys[codes]))
+
+    def windowed_mean_std(self, keys: np.ndarray,
+                          window: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Mean and standard deviation of the background currents of the nodes whose window key
+        is within the relative window of each of the keys
+
+        :param keys: window keys of the query nodes
+        :param window: relative half-width of the window
+        :return: means, standard deviations
+        """
+        keys = np.asarray(keys, dtype=np.float64)
+
+        # window keys are sorted by np.unique, so that each window is a slice of the prefix sums
+        prefix_counts = np.concatenate(([0.], np.cumsum(self.window_counts)))
+        prefix_sums = np.concatenate(([0.], np.cumsum(self.window_sums)))
+        prefix_squares = np.concatenate(([0.], np.cumsum(self.window_squares)))
+
+        starts = np.searchsorted(self.window_keys, keys * (1 - window), side='right')
+        stops = np.maximum(np.searchsorted(self.window_keys, keys * (1 + window), side='left'),
+                           starts)
+
+        counts = prefix_counts[stops] - prefix_counts[starts]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, (prefix_sums[stops] - prefix_sums[starts]) / counts,
+                             np.nan)
+            square_means = np.where(counts > 0,
+                                    (prefix_squares[stops] - prefix_squares[starts]) / counts,
+                                    np.nan)
+
+        return means, np.sqrt(np.maximum(square_means - means**2, 0.))
+
+    def histogram(self, upper: float = 0.) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Running histogram of the background currents
+
+        :param upper: value the histogram range has to cover, for instance the max query current
+        :return: counts, bin edges
+        """
+        self._extend_histogram(upper)
+        edges = np.linspace(0., self.histogram_upper, self.histogram_counts.shape[0] + 1)
+
+        return self.histogram_counts, edges
+
+    def scatter(self) -> np.ndarray:
+        """
+        :return: [[current, window key], ...].T uniform subsample of the background points
+        """
+        return self._scatter
@@ -0,0 +1,299 @@
+"""
+Module containing the routines for the process-parallel computation of the flow between node
+pairs. The conductivity laplacian is shared with the worker processes through shared memory
+instead of being pickled, and each worker builds its own factorization of it. For the
+reach-limited annotome flow, the reach map is shared the same way and each worker factorizes
+the compact systems of its pairs.
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+from time import time
+import numpy as np
+import scipy.sparse as spmat
+from typing import Union, Tuple, List
+
+from bioflow.utils.log_behavior import get_logger
+from bioflow.algorithms_bank import conduction_routines as cr
+from bioflow.algorithms_bank.solver_caches import get_shared_solver
+from bioflow.algorithms_bank.flow_calculation_methods import as_pair_array
+from bioflow.configs.main_configs import flow_mode, flow_chunks_per_process
+
+log = get_logger(__name__)
+
+# state of the worker processes, set once by the pool initializer
+_worker_state = {}
+
+
+def share_csc_matrix(matrix: spmat.csc_matrix) -> Tuple[List[shared_memory.SharedMemory], dict]:
+    """
+    Copies the arrays of a csc matrix into shared memory blocks
+
+    :param matrix: matrix to share
+    :return: shared memory blocks (to be released by the caller), picklable descriptor that
+        allows the matrix to be re-attached in another process
+    """
+    matrix = spmat.csc_matrix(matrix)
+    handles = []
+    descriptor = {'shape': matrix.shape}
+
+    for field in ['data', 'indices', 'indptr']:
+        array = getattr(matrix, field)
+        handle = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=handle.buf)[:] = array
+        handles.append(handle)
+        descriptor[field] = (handle.name, array.shape, array.dtype.str)
+
+    return handles, descriptor
+
+
+def attach_csc_matrix(descriptor: dict) -> Tuple[spmat.csc_matrix,
+                                                 List[shared_memory.SharedMemory]]:
+    """
+    Re-attaches a csc matrix shared with share_csc_matrix. The matrix arrays are views into
+    the shared memory, so the returned blocks need to be kept alive as long as the matrix.
+
+    :param descriptor: descriptor returned by share_csc_matrix
+    :return: shared matrix, shared memory blocks backing it
+    """
+    handles = []
+    arrays = []
+
+    for field in ['data', 'indices', 'indptr']:
+        name, shape, dtype = descriptor[field]
+        handle = shared_memory.SharedMemory(name=name)
+        handles.append(handle)
+        arrays.append(np.ndarray(shape, dtype=np.dtype(dtype), buffer=handle.buf))
+
+    matrix = spmat.csc_matrix(tuple(arrays), shape=descriptor['shape'], copy=False)
+
+    return matrix, handles
+
+
+def release_shared_blocks(handles: List[shared_memory.SharedMemory], unlink: bool = False):
+    """
+    Closes shared memory blocks and, if requested, frees them
+
+    :param handles: shared memory blocks
+    :param unlink: if True, blocks are freed. Only the process that created them should do it
+    """
+    for handle in handles:
+        handle.close()
+        if unlink:
+            handle.unlink()
+
+
+def _init_flow_worker(descriptor: dict, system_hash: Union[str, None]):
+    """
+    Pool initializer: attaches the shared laplacian and factorizes it once per worker
+
+    :param descriptor: descriptor of the shared conductivity laplacian
+    :param system_hash: hash of the conduction system, to re-use the saved factor ordering
+    """
+    conductivity_laplacian, handles = attach_csc_matrix(descriptor)
+    _worker_state['handles'] = handles
+    _worker_state['laplacian'] = conductivity_laplacian
+    _worker_state['solver'] = get_shared_solver(conductivity_laplacian, system_hash)
+    _worker_state['accumulator'] = cr.EdgeCurrentAccumulator(conductivity_laplacian)
+
+
+def _flow_worker(payload) -> Tuple[np.ndarray, dict]:
+    """
+    Computes the flow for a chunk of pairs in a worker
+
+    :param payload: pairs chunk, potential_dominated, potential_diffs_remembered,
+        flow calculation mode, thread_hex
+    :return: edge currents over the laplacian edge list, potential differences between pairs
+    """
+    list_of_pairs, potential_dominated, potential_diffs_remembered, mode, thread_hex = payload
+
+    accumulator = _worker_state['accumulator']
+    accumulator.edge_currents[:] = 0
+
+    if mode == 'superposition':
+        engine = cr.superposition_flow_calc
+    else:
+        engine = cr.batched_flow_calc
+
+    _, up_pair_2_voltage = engine(_worker_state['laplacian'], list_of_pairs,
+                                  _worker_state['solver'],
+                                  potential_dominated=potential_dominated,
+                                  potential_diffs_remembered=potential_diffs_remembered,
+                                  thread_hex=thread_hex,
+                                  accumulator=accumulator)
+
+    return accumulator.edge_currents.copy(), up_pair_2_voltage
+
+
+def parallel_flow_calc(conductivity_laplacian: spmat.csc_matrix,
+                       list_of_pairs: Union[np.ndarray,
+                                            List[Tuple[Tuple[int, float], Tuple[int, float]]]],
+                       processes: int,
+                       potential_dominated: bool = True,
+                       potential_diffs_remembered: bool = False,
+                       flow_calculation_mode: Union[str, None] = None,
+                       thread_hex: str = '______',
+                       system_hash: Union[str, None] = None) -> Tuple[spmat.coo_matrix, dict]:
+    """
+    Splits the pairs between a pool of worker processes. The laplacian is shared through
+    shared memory, each worker factorizes it and returns the edge currents for its share of
+    the pairs, which are summed at the end.
+
+    Workers are started with the 'spawn' method, so that no cholmod state is inherited from
+    the parent through a fork.
+
+    :param conductivity_laplacian: conductivity laplacian
+    :param list_of_pairs: structured array of pair_dtype or ((index, weight), (index, weight))
+        pairs between which to calculate the flow
+    :param processes: number of worker processes
+    :param potential_dominated: if the total current is normalized to potential
+    :param potential_diffs_remembered: if the difference of potentials between nodes is remembered
+    :param flow_calculation_mode: 'pairwise' or 'superposition'. Defaults to configs value
+    :param thread_hex: debugging id of the thread in which the sampling is going on
+    :param system_hash: hash of the conduction system, used to retrieve cached factorizations
+    :return: upper triangular current accumulator (not normalized to the number of pairs),
+        potential differences between pairs
+    """
+    if flow_calculation_mode is None:
+        flow_calculation_mode = flow_mode
+
+    accumulator = cr.EdgeCurrentAccumulator(conductivity_laplacian)
+    up_pair_2_voltage = {}
+
+    list_of_pairs = as_pair_array(list_of_pairs)
+
+    # contiguous chunks keep pairs sharing a node together, which helps superposition mode
+    chunks_number = max(1, min(len(list_of_pairs), processes * flow_chunks_per_process))
+    chunk_bounds = np.linspace(0, len(list_of_pairs), chunks_number + 1).astype(int)
+    chunks = [list_of_pairs[start:stop] for start, stop in zip(chunk_bounds[:-1],
+                                                               chunk_bounds[1:])]
+
+    log.info('thread hex: %s; parallel flow over %s pairs in %s chunks on %s processes',
+             thread_hex, len(list_of_pairs), chunks_number, processes)
+
+    if system_hash is not None:
+        # computes and saves the ordering once, instead of in every worker
+        get_shared_solver(conductivity_laplacian, system_hash)
+
+    handles, descriptor = share_csc_matrix(conductivity_laplacian)
+    start_time = time()
+
+    try:
+        with multiprocessing.get_context('spawn').Pool(processes,
+                                                       initializer=_init_flow_worker,
+                                                       initargs=(descriptor,
+                                                                 system_hash)) as pool:
+            payloads = [(chunk, potential_dominated, potential_diffs_remembered,
+                         flow_calculation_mode, '%s-%s' % (thread_hex, _i))
+                        for _i, chunk in enumerate(chunks)]
+
+            for counter, (edge_currents, chunk_voltages) in \
+                    enumerate(pool.imap_unordered(_flow_worker, payloads)):
+                accumulator.add_edge_currents(edge_currents)
+                up_pair_2_voltage.update(chunk_voltages)
+                log.info('thread hex: %s; parallel flow progress: %s/%s chunks, %.2f s elapsed'
+                         % (thread_hex, counter + 1, chunks_number, time() - start_time))
+
+    finally:
+        release_shared_blocks(handles, unlink=True)
+
+    return accumulator.current_matrix(), up_pair_2_voltage
+
+
+def _init_reach_flow_worker(laplacian_descriptor: dict, reach_descriptor: dict):
+    """
+    Pool initializer: attaches the shared inflated laplacian and reach matrix
+
+    :param laplacian_descriptor: descriptor of the shared inflated laplacian
+    :param reach_descriptor: descriptor of the shared reach matrix
+    """
+    inflated_laplacian, laplacian_handles = attach_csc_matrix(laplacian_descriptor)
+    reach_matrix, reach_handles = attach_csc_matrix(reach_descriptor)
+    _worker_state['handles'] = laplacian_handles + reach_handles
+    _worker_state['laplacian'] = inflated_laplacian
+    _worker_state['reach'] = reach_matrix
+
+
+def _reach_flow_worker(payload) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """
+    Computes the reach-limited flow for a chunk of pairs in a worker
+
+    :param payload: pairs chunk, potential_dominated, reach_cache_key, thread_hex
+    :return: rows, columns and values of the edge currents, potential differences between pairs
+    """
+    index_pairs, potential_dominated, reach_cache_key, thread_hex = payload
+
+    return cr.reach_limited_flow_calc(_worker_state['laplacian'], index_pairs,
+                                      _worker_state['reach'],
+                                      potential_dominated=potential_dominated,
+                                      reach_cache_key=reach_cache_key,
+                                      thread_hex=thread_hex)
+
+
+def parallel_reach_limited_flow_calc(inflated_laplacian: spmat.csc_matrix,
+                                     index_pairs: np.ndarray,
+                                     reach_matrix: spmat.csc_matrix,
+                                     processes: int,
+                                     potential_dominated: bool = True,
+                                     reach_cache_key: Union[tuple, None] = None,
+                                     thread_hex: str = '______') \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """
+    Splits the pairs of the reach-limited annotome flow between a pool of worker processes.
+    The inflated laplacian and the reach matrix are shared through shared memory, each worker
+    returns the edge currents and potential differences for its share of the pairs.
+
+    :param inflated_laplacian: Laplacian containing the UP-GO relations in addition to
+        purely GO-GO relations
+    :param index_pairs: structured array of pair_dtype, with the matrix indexes of the nodes
+    :param reach_matrix: column k contains the indexes reachable from node k
+    :param processes: number of worker processes
+    :param potential_dominated: if the total current is normalized to potential
+    :param reach_cache_key: if provided, key of the system in the reach factor cache of each
+        worker
+    :param thread_hex: debugging id of the thread in which the sampling is going on
+    :return: rows, columns and values of the absolute edge currents (weighted and not
+        normalized to the number of pairs; may contain duplicates to be summed), potential
+        differences between pairs of indexes
+    """
+    current_rows, current_cols, current_values = [np.array([], dtype=int)], \
+        [np.array([], dtype=int)], [np.array([])]
+    index_pair_2_voltage = {}
+
+    # contiguous chunks keep pairs sharing a node, and hence part of their reach, together
+    chunks_number = max(1, min(index_pairs.shape[0], processes * flow_chunks_per_process))
+    chunk_bounds = np.linspace(0, index_pairs.shape[0], chunks_number + 1).astype(int)
+    chunks = [index_pairs[start:stop] for start, stop in zip(chunk_bounds[:-1],
+                                                             chunk_bounds[1:])]
+
+    log.info('thread hex: %s; parallel reach-limited flow over %s pairs in %s chunks on %s '
+             'processes', thread_hex, index_pairs.shape[0], chunks_number, processes)
+
+    laplacian_handles, laplacian_descriptor = share_csc_matrix(inflated_laplacian)
+    reach_handles, reach_descriptor = share_csc_matrix(reach_matrix)
+    start_time = time()
+
+    try:
+        with multiprocessing.get_context('spawn').Pool(processes,
+                                                       initializer=_init_reach_flow_worker,
+                                                       initargs=(laplacian_descriptor,
+                                                                 reach_descriptor)) as pool:
+            payloads = [(chunk, potential_dominated, reach_cache_key,
+                         '%s-%s' % (thread_hex, _i))
+                        for _i, chunk in enumerate(chunks)]
+
+            for counter, (rows, cols, values, chunk_voltages) in \
+                    enumerate(pool.imap_unordered(_reach_flow_worker, payloads)):
+                current_rows.append(rows)
+                current_cols.append(cols)
+                current_values.append(values)
+                index_pair_2_voltage.update(chunk_voltages)
+                log.info('thread hex: %s; parallel reach-limited flow progress: %s/%s chunks, '
+                         '%.2f s elapsed'
+                         % (thread_hex, counter + 1, chunks_number, time() - start_time))
+
+    finally:
+        release_shared_blocks(laplacian_handles + reach_handles, unlink=True)
+
+    return np.concatenate(current_rows), np.concatenate(current_cols), \
+        np.concatenate(current_values), index_pair_2_voltage
+
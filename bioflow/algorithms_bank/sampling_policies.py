@@ -38,13 +38,11 @@ def matched_sample_distribution(floats_arr: np.array, samples_no: int,
         floats_arr = np.log(floats_arr)   # will crash if any are 0
 
     hist, bin_edges = np.histogram(floats_arr, bins=granularity, density=True)
-    pad = np.arange(granularity)
-    locations = np.choice(pad, samples_no, p=hist)
+    bin_probabilities = hist * np.diff(bin_edges)
+    locations = np.random.choice(granularity, samples_no,
+                                 p=bin_probabilities / bin_probabilities.sum())
 
-    samples = []
-
-    for i in locations:
-        samples.append(np.random.uniform(bin_edges[i], bin_edges[i+1]))
+    samples = np.random.uniform(bin_edges[locations], bin_edges[locations + 1])
 
     if logmode:
         return np.exp(samples)
@@ -141,18 +139,84 @@ def _sample_floats(floats, float_sampling_method='exact', matched_distro_precisi
     parameter pass-through to the matched_sample_distribution)
     :return: sample of floats
     """
+    return _sample_floats_batch(floats, 1, float_sampling_method, matched_distro_precision)[0]
+
+
+def _sample_floats_batch(floats, batch_size: int, float_sampling_method='exact',
+                         matched_distro_precision: int = 100) -> np.ndarray:
+    """
+    Samples floats for a batch of random samples at once, according to a method
+
+    :param floats: floats to match
+    :param batch_size: number of random samples
+    :param float_sampling_method: exact (permutation of weights) | distro (trying to match the
+        empirical distribution) | logdistro (trying to match the empirical distribution in the log
+        space)
+    :param matched_distro_precision: how closely to try to match the distribution (granularity
+    parameter pass-through to the matched_sample_distribution)
+    :return: (batch_size, len(floats)) array, one sample of floats per row
+    """
+    floats = np.asarray(floats, dtype=np.float64)
 
     if float_sampling_method == 'exact':
-        ret_floats = floats.copy()
-        np.random.shuffle(ret_floats)
-        return ret_floats
+        permutations = np.argsort(np.random.random_sample((batch_size, floats.shape[0])), axis=1)
+        return floats[permutations]
 
     if float_sampling_method == 'distro':
-        return matched_sample_distribution(floats, len(floats), granularity=matched_distro_precision)
+        return matched_sample_distribution(floats, batch_size * floats.shape[0],
+                                           granularity=matched_distro_precision
+                                           ).reshape(batch_size, floats.shape[0])
 
     if float_sampling_method == 'logdistro':
-        return matched_sample_distribution(floats, len(floats),
-                                           granularity=matched_distro_precision, logmode=True)
+        return matched_sample_distribution(floats, batch_size * floats.shape[0],
+                                           granularity=matched_distro_precision, logmode=True
+                                           ).reshape(batch_size, floats.shape[0])
+
+    raise Exception('float sampling method %s is not supported. Supported methods: '
+                    'exact, distro, logdistro' % float_sampling_method)
+
+
+# max number of random keys drawn at once by the batched weighted sampling
+_max_batch_keys = 2**22
+
+
+def weighted_sampling_batch(weights: np.ndarray, sample_size: int,
+                            batch_size: int) -> np.ndarray:
+    """
+    Draws a batch of weighted samples without replacement at once, by keeping the sample_size
+    largest log(weight) + Gumbel noise keys in each row (Gumbel-top-k). The samples have the same
+    distribution as successive draws with np.random.choice(replace=False, p=weights).
+
+    :param weights: weights of the background items, not necessarily normalized
+    :param sample_size: number of items in each sample
+    :param batch_size: number of samples
+    :return: (batch_size, sample_size) indexes of the selected background items, in draw order
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+
+    if np.count_nonzero(weights) < sample_size:
+        raise ValueError('Fewer non-zero weights in the background (%d) than items in the sample '
+                         '(%d)' % (np.count_nonzero(weights), sample_size))
+
+    with np.errstate(divide='ignore'):
+        log_weights = np.log(weights)
+
+    rows_per_block = max(1, _max_batch_keys // max(weights.shape[0], 1))
+    selected = np.empty((batch_size, sample_size), dtype=np.int64)
+
+    for start in range(0, batch_size, rows_per_block):
+        stop = min(start + rows_per_block, batch_size)
+        keys = log_weights + np.random.gumbel(size=(stop - start, weights.shape[0]))
+
+        if sample_size < weights.shape[0]:
+            top_k = np.argpartition(-keys, sample_size - 1, axis=1)[:, :sample_size]
+        else:
+            top_k = np.tile(np.arange(weights.shape[0]), (stop - start, 1))
+
+        order = np.argsort(-np.take_along_axis(keys, top_k, axis=1), axis=1)
+        selected[start:stop] = np.take_along_axis(top_k, order, axis=1)
+
+    return selected
 
 
 def matched_sampling(sample, secondary_sample,
@@ -162,6 +226,8 @@ def matched_sampling(sample, secondary_sample,
     and secondary sample set and, if they are weighted, try to match the random sample weights
     according to the
 
+    All the random samples are drawn at once, as a (samples, sample size) index matrix, and
+    then yielded one by one.
 
     :param sample: primary sample set
     :param secondary_sample: secondary sample_set
@@ -192,48 +258,42 @@ def matched_sampling(sample, secondary_sample,
 
     background_whg /= np.sum(background_whg)
 
-    if secondary_sample is None:
+    sample_size = len(sample)
+    sec_sample_size = 0 if secondary_sample is None else len(secondary_sample)
 
-        if _is_int(sample[0]):  # it should never be an int, but for safety ...
-            for i in range(0, samples):
-                selected = np.random.choice(background_ids, len(sample), p=background_whg,
-                                            replace=False)
-                yield i, selected, None
+    selected = weighted_sampling_batch(background_whg, sample_size + sec_sample_size, samples)
 
-        else:
-            for i in range(0, samples):
-                id_loads = np.random.choice(background_ids, len(sample), p=background_whg,
-                                            replace=False)
-                float_part = _sample_floats(np.array(sample)[:, 1], float_sampling_method)
-                ids_and_floats = [(_id, _float) for _id, _float in zip(id_loads, float_part)]
-                yield i, ids_and_floats, None
+    if secondary_sample is not None:
+        # random split between the primary and the secondary sample
+        split = np.argsort(np.random.random_sample(selected.shape), axis=1)
+        selected = np.take_along_axis(selected, split, axis=1)
 
-    else:
+    selected = background_ids[selected]
 
-        if _is_int(sample[0]):
-            for i in range(0, samples):
-                selected = np.random.choice(background_ids,
-                                     len(sample)+len(secondary_sample),
-                                     p=background_whg, replace=False)
-                np.random.shuffle(selected)
-                yield i, selected[:len(sample)], selected[-len(secondary_sample):]
+    float_parts = None
+    sec_float_parts = None
 
-        else:
+    if not _is_int(sample[0]):
+        float_parts = _sample_floats_batch(np.array(sample)[:, 1], samples, float_sampling_method)
 
-            for i in range(0, samples):
-                selected = np.random.choice(background_ids,
-                                     len(sample)+len(secondary_sample),
-                                     p=background_whg, replace=False)
-                np.random.shuffle(selected)
+        if secondary_sample is not None:
+            sec_float_parts = _sample_floats_batch(np.array(secondary_sample)[:, 1], samples,
+                                                   float_sampling_method)
 
-                id_loads = selected[:len(sample)]
-                float_part = _sample_floats(np.array(sample)[:, 1], float_sampling_method)
-                ids_and_floats = [(_id, _float) for _id, _float in zip(id_loads, float_part)]
+    for i in range(0, samples):
+        id_loads = selected[i, :sample_size]
+        sec_id_loads = None if secondary_sample is None else selected[i, -sec_sample_size:]
 
+        if float_parts is None:
+            yield i, id_loads, sec_id_loads
 
-                sec_id_loads = selected[-len(secondary_sample):]
-                sec_float_part = _sample_floats(np.array(secondary_sample)[:, 1], float_sampling_method)
-                sec_ids_and_floats = [(_id, _float) for _id, _float
-                                      in zip(sec_id_loads, sec_float_part)]
+        else:
+            ids_and_floats = [(_id, _float) for _id, _float in zip(id_loads, float_parts[i])]
+
+            if sec_id_loads is None:
+                yield i, ids_and_floats, None
 
-                yield i, ids_and_floats, sec_ids_and_floats
\ No newline at end of file
+            else:
+                sec_ids_and_floats = [(_id, _float) for _id, _float
+                                      in zip(sec_id_loads, sec_float_parts[i])]
+                yield i, ids_and_floats, sec_ids_and_floats
@@ -0,0 +1,631 @@
+"""
+Module containing the caches of the laplacian factorizations, so that the solver for the same
+conduction system is not rebuilt for every sample and every new process, as well as the cache
+of single-node potentials re-used across samples and the cache of the factorizations of
+reach-limited compact laplacians re-used across annotome pairs.
+"""
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import scipy.sparse as spmat
+from scipy.sparse.csgraph import connected_components
+from scipy.linalg import lu_factor, lu_solve
+import scikits.sparse.cholmod as chmd
+from typing import Union
+
+from bioflow.utils.log_behavior import get_logger
+from bioflow.configs.main_configs import Dumps, line_loss, factor_cache_size, \
+    factor_cache_on_disk, low_rank_reweight, low_rank_max_nodes, potential_cache_bytes, \
+    reach_factor_cache_bytes
+
+log = get_logger(__name__)
+
+# in-memory factorizations, most recently used last
+_factor_cache = OrderedDict()
+
+
+class NodePotentialCache(object):
+    """
+    Memory-bounded LRU cache of the potentials induced by a unit current injected in a single
+    node of a grounded laplacian. Lives as long as the process, so that the random samples
+    drawn from the same background re-use the solves for the nodes they share.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: max total size of the cached potential vectors. 0 disables caching
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._potentials = OrderedDict()  # most recently used last
+
+    def get_block(self, system_key: tuple, node_indexes: np.ndarray, solve) -> np.ndarray:
+        """
+        Assembles the potentials for the nodes from the cache, solving only for the missing ones
+
+        :param system_key: key of the conduction system, as returned by system_key()
+        :param node_indexes: indexes of nodes in which the current is injected
+        :param solve: callable returning the (nodes, len(indexes)) potentials for an array of
+            node indexes
+        :return: (nodes, len(node_indexes)) array of potentials, one column per node
+        """
+        columns = []
+        missing = []
+
+        for position, node in enumerate(node_indexes.tolist()):
+            potentials = self._potentials.get((system_key, node))
+
+            if potentials is None:
+                missing.append(position)
+            else:
+                self._potentials.move_to_end((system_key, node))
+
+            columns.append(potentials)
+
+        self.hits += len(columns) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            solved = np.asarray(solve(node_indexes[missing]))
+
+            for column, position in enumerate(missing):
+                columns[position] = np.ascontiguousarray(solved[:, column])
+                self._store((system_key, int(node_indexes[position])), columns[position])
+
+        return np.column_stack(columns)
+
+    def _store(self, key: tuple, potentials: np.ndarray):
+        if potentials.nbytes > self.max_bytes:
+            return
+
+        self._potentials[key] = potentials
+        self.current_bytes += potentials.nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._potentials.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drops all the cached potentials, keeping the counters
+        """
+        self._potentials.clear()
+        self.current_bytes = 0
+
+    def report(self) -> str:
+        """
+        :return: summary of the cache counters and occupation, for logging
+        """
+        return 'potential cache: %s hits, %s misses, %s evictions, %.1f/%.1f MB in use' \
+               % (self.hits, self.misses, self.evictions,
+                  self.current_bytes / 2.**20, self.max_bytes / 2.**20)
+
+
+# single-node potentials, shared by all the samples computed in the process
+potential_cache = NodePotentialCache(potential_cache_bytes)
+
+
+class ReachFactorCache(object):
+    """
+    Memory-bounded LRU cache of the compact reach-limited laplacians and of their
+    factorizations, keyed by the conduction system and the signature of the sorted reach index
+    set. The reach cached is the GO reach union of a pair, without the pair nodes themselves,
+    which are added on top of its grounded factorization by a BorderedSolver. Lives as long as the process, so that the
+    pairs whose GO reach unions coincide, within a sample or across random samples, re-use the
+    factorization.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        :param max_bytes: max total size of the cached laplacians and factors. 0 disables caching
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._factors = OrderedDict()  # most recently used last
+
+    @staticmethod
+    def reach_signature(reach: np.ndarray) -> str:
+        """
+        :param reach: sorted reach indexes
+        :return: hex digest of the reach index set
+        """
+        return hashlib.md5(np.ascontiguousarray(reach, dtype=np.int64).tobytes()).hexdigest()
+
+    def get_factor(self, system_key: tuple, reach: np.ndarray, build) -> tuple:
+        """
+        Recovers the compact laplacian and factorization for the reach, building them if needed
+
+        :param system_key: key of the conduction system, as returned by system_key()
+        :param reach: sorted reach indexes
+        :param build: callable returning the (compact laplacian, solver) for the reach
+        :return: compact laplacian, solver
+        """
+        key = (system_key, self.reach_signature(reach))
+        entry = self._factors.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self._factors.move_to_end(key)
+            return entry[0], entry[1]
+
+        self.misses += 1
+        local_laplacian, solver = build()
+
+        if self.max_bytes > 0:
+            self._store(key, (local_laplacian, solver,
+                              _factor_bytes(local_laplacian, solver)))
+
+        return local_laplacian, solver
+
+    def _store(self, key: tuple, entry: tuple):
+        if entry[2] > self.max_bytes:
+            return
+
+        self._factors[key] = entry
+        self.current_bytes += entry[2]
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._factors.popitem(last=False)
+            self.current_bytes -= evicted[2]
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Drops all the cached factorizations, keeping the counters
+        """
+        self._factors.clear()
+        self.current_bytes = 0
+
+    def report(self) -> str:
+        """
+        :return: summary of the cache counters and occupation, for logging
+        """
+        requests = self.hits + self.misses
+        return 'reach factor cache: %s hits, %s misses (%.1f %% hit rate), %s evictions, ' \
+               '%.1f/%.1f MB in use' \
+               % (self.hits, self.misses, 100. * self.hits / requests if requests else 0.,
+                  self.evictions, self.current_bytes / 2.**20, self.max_bytes / 2.**20)
+
+
+def _factor_bytes(local_laplacian: spmat.csc_matrix, solver) -> int:
+    """
+    Estimates the memory held by a compact laplacian and its factorization
+    """
+    laplacian_bytes = local_laplacian.data.nbytes + local_laplacian.indices.nbytes + \
+        local_laplacian.indptr.nbytes
+
+    try:
+        factor_bytes = solver.L().nnz * 12
+    except (AttributeError, TypeError):
+        factor_bytes = local_laplacian.shape[0] ** 2 * 8
+
+    return laplacian_bytes + factor_bytes
+
+
+# reach-limited factorizations, shared by all the annotome samples computed in the process
+reach_factor_cache = ReachFactorCache(reach_factor_cache_bytes)
+
+
+class PermutedFactor(object):
+    """
+    Solver wrapping a factorization of the symmetrically permuted laplacian, computed with a
+    fill-reducing ordering loaded from disk instead of recomputed. Can be called the same way
+    as a cholmod Factor.
+    """
+
+    def __init__(self, factor, permutation: np.ndarray):
+        """
+        :param factor: factor of the permuted laplacian, computed with natural ordering
+        :param permutation: fill-reducing permutation of the laplacian
+        """
+        self.factor = factor
+        self.permutation = permutation
+        self.inverse_permutation = np.argsort(permutation)
+
+    def __call__(self, rhs):
+        solution = self.factor(rhs[self.permutation])
+        return solution[self.inverse_permutation]
+
+    def P(self) -> np.ndarray:
+        return self.permutation
+
+
+class LowRankUpdatedSolver(object):
+    """
+    Solver for a laplacian that differs from a base laplacian only in the rows and columns of
+    a few nodes, re-using the base factorization through a Woodbury correction.
+
+    With S the modified nodes, E_S the matching columns of the identity and R = (new - base)[S, :],
+    the modification is U M U^T, where U = [E_S, R^T] and M = [[-R_SS, I], [I, 0]]. Hence:
+    (A + U M U^T)^-1 = A^-1 - Z K^-1 U^T A^-1, with Z = A^-1 U and K = M^-1 + U^T Z, where
+    M^-1 = [[0, I], [I, R_SS]].
+    """
+
+    def __init__(self, base_solver, modified_nodes: np.ndarray,
+                 modification_rows: spmat.csr_matrix):
+        """
+        :param base_solver: factorization of the base laplacian
+        :param modified_nodes: indexes of nodes whose rows and columns are modified
+        :param modification_rows: (new - base)[modified_nodes, :]
+        """
+        self.base_solver = base_solver
+        self.modified_nodes = modified_nodes
+        _k = modified_nodes.shape[0]
+        _n = modification_rows.shape[1]
+
+        selector = spmat.csc_matrix((np.ones(_k), (modified_nodes, np.arange(_k))),
+                                    shape=(_n, _k))
+        self.update_basis = spmat.hstack([selector, modification_rows.T]).tocsc()
+
+        self.base_solution = np.asarray(
+            _dense(base_solver(self.update_basis.toarray())))
+
+        r_ss = modification_rows[:, modified_nodes].toarray()
+        inverse_middle = np.block([[np.zeros((_k, _k)), np.eye(_k)],
+                                   [np.eye(_k), r_ss]])
+        capacitance = inverse_middle + self.update_basis.T.dot(self.base_solution)
+        self.capacitance_factor = lu_factor(capacitance)
+
+    def __call__(self, rhs):
+        solution = _dense(self.base_solver(rhs))
+        correction = self.base_solution.dot(
+            lu_solve(self.capacitance_factor, self.update_basis.T.dot(solution)))
+        solution = solution - correction
+
+        if spmat.issparse(rhs):
+            return spmat.csc_matrix(solution)
+
+        return solution
+
+
+class GroundedFactor(object):
+    """
+    Factorization of a laplacian in which one root node of each connected component is grounded
+    by an extra conductance to the ground. Unlike the laplacian with only the line loss, the
+    grounded laplacian is well-conditioned, so that low-rank corrections can be applied on top
+    of it without losing precision. Can be called the same way as a cholmod Factor.
+    """
+
+    def __init__(self, laplacian: spmat.csc_matrix):
+        """
+        :param laplacian: conductivity laplacian
+        """
+        _, self.components = connected_components(laplacian, directed=False)
+        self.roots = np.unique(self.components, return_index=True)[1]
+        diagonal = laplacian.diagonal()
+        self.grounds = np.where(diagonal[self.roots] > 0, diagonal[self.roots], 1.)
+
+        grounding = spmat.csc_matrix((self.grounds, (self.roots, self.roots)),
+                                     shape=laplacian.shape)
+        self.factor = chmd.cholesky(spmat.csc_matrix(laplacian + grounding), line_loss)
+
+    def __call__(self, rhs):
+        return self.factor(rhs)
+
+    def L(self):
+        return self.factor.L()
+
+
+class BorderedSolver(object):
+    """
+    Solver for a laplacian made of a base laplacian bordered by a few extra nodes, re-using the
+    grounded factorization of the base laplacian. The border nodes only add their edges to the
+    base nodes, hence modify the base block of the laplacian by a diagonal D, non-null on the
+    neighbours of the border, while the grounds of the components they touch are removed.
+
+    With S the nodes whose diagonal is modified by p, the base block is solved with a Woodbury
+    correction: (A + E_S p E_S^T)^-1 = A^-1 - Z (p^-1 + Z_S)^-1 E_S^T A^-1, with Z = A^-1 E_S,
+    and the border nodes with the Schur complement M_bb - M_bG M_GG^-1 M_Gb.
+
+    Components of the base laplacian not touching the border keep their ground, which is exact
+    as long as the right-hand side is null on them, as for a current between border nodes.
+
+    If the border nodes are not connected through the base laplacian, the potentials between
+    them are only set by the line loss and the Schur complement is too ill-conditioned to be
+    computed by difference: the bordered laplacian is then factorized directly.
+    """
+
+    def __init__(self, base_solver: GroundedFactor, base_laplacian: spmat.csc_matrix,
+                 laplacian: spmat.csc_matrix, border: np.ndarray):
+        """
+        :param base_solver: grounded factorization of the base laplacian
+        :param base_laplacian: compact laplacian of the base nodes
+        :param laplacian: compact laplacian of the base and border nodes, whose rows and columns
+            of the base nodes are ordered as in the base laplacian
+        :param border: indexes of the border nodes in the laplacian
+        """
+        self.base_solver = base_solver
+        self.border = np.asarray(border)
+        self.inner = np.setdiff1d(np.arange(laplacian.shape[0]), self.border)
+        self.system = spmat.csc_matrix(laplacian + spmat.eye(laplacian.shape[0]) * line_loss)
+
+        self.coupling = laplacian[:, self.border].toarray()[self.inner]  # M_Gb
+        self.direct_solver = None
+
+        if not self._border_connected(base_solver, laplacian):
+            self.direct_solver = chmd.cholesky(laplacian, line_loss)
+            return
+
+        perturbation = laplacian.diagonal()[self.inner] - base_laplacian.diagonal()
+        touched = np.isin(base_solver.components[base_solver.roots],
+                          base_solver.components[np.nonzero(perturbation)[0]])
+        perturbation[base_solver.roots[touched]] -= base_solver.grounds[touched]
+
+        self.perturbed = np.nonzero(perturbation)[0]
+        _k = self.perturbed.shape[0]
+
+        selector = np.zeros((self.inner.shape[0], _k))
+        selector[self.perturbed, np.arange(_k)] = 1.
+        self.base_solution = np.asarray(_dense(base_solver(selector))).reshape(-1, _k)
+        capacitance = np.diag(1. / perturbation[self.perturbed]) + \
+            self.base_solution[self.perturbed, :]
+        self.capacitance_factor = lu_factor(capacitance) if _k else None
+
+        self.border_solution = self._inner_solve(self.coupling)  # M_GG^-1 M_Gb
+        schur = self.system[:, self.border].toarray()[self.border] - \
+            self.coupling.T.dot(self.border_solution)
+        self.schur_factor = lu_factor(schur)
+
+    def _border_connected(self, base_solver: GroundedFactor,
+                          laplacian: spmat.csc_matrix) -> bool:
+        # graph of the border nodes and of the base components they are adjacent to
+        _b = self.border.shape[0]
+        border_rows, inner_rows = np.nonzero(self.coupling.T)
+        border_block = spmat.coo_matrix(laplacian[:, self.border].toarray()[self.border])
+        rows = np.concatenate((border_rows, border_block.row))
+        cols = np.concatenate((base_solver.components[inner_rows] + _b, border_block.col))
+        adjacency = spmat.csr_matrix((np.ones(rows.shape[0]), (rows, cols)),
+                                     shape=(_b + base_solver.roots.shape[0],) * 2)
+        components = connected_components(adjacency, directed=False)[1]
+
+        return np.unique(components[:_b]).shape[0] == 1
+
+    def _inner_solve(self, rhs: np.ndarray) -> np.ndarray:
+        solution = np.asarray(_dense(self.base_solver(rhs))).reshape(rhs.shape)
+
+        if self.capacitance_factor is not None:
+            solution = solution - self.base_solution.dot(
+                lu_solve(self.capacitance_factor, solution[self.perturbed]))
+
+        return solution
+
+    def __call__(self, rhs):
+        if self.direct_solver is not None:
+            return self.direct_solver(rhs)
+
+        dense_rhs = _dense(rhs).astype(np.float64)
+
+        inner_solution = self._inner_solve(dense_rhs[self.inner])
+        border_solution = lu_solve(self.schur_factor,
+                                   dense_rhs[self.border] - self.coupling.T.dot(inner_solution))
+
+        solution = np.empty_like(dense_rhs)
+        solution[self.border] = border_solution
+        solution[self.inner] = inner_solution - self.border_solution.dot(border_solution)
+
+        if spmat.issparse(rhs):
+            return spmat.csc_matrix(solution)
+
+        return solution
+
+
+def _dense(array) -> np.ndarray:
+    if spmat.issparse(array):
+        return array.toarray()
+    return np.asarray(array)
+
+
+def laplacian_fingerprint(conductivity_laplacian: spmat.csc_matrix,
+                          structure_only: bool = False) -> str:
+    """
+    Computes a hash of the laplacian values and structure, so that reweighted laplacians of the
+    same system do not share a factorization
+
+    :param conductivity_laplacian: conductivity laplacian with sorted indices
+    :param structure_only: if True, only the sparsity structure is hashed, which is all the
+        fill-reducing ordering depends on
+    :return: hex digest
+    """
+    hasher = hashlib.md5()
+    hasher.update(np.array(conductivity_laplacian.shape, dtype=np.int64).tobytes())
+    hasher.update(np.ascontiguousarray(conductivity_laplacian.indptr, dtype=np.int64).tobytes())
+    hasher.update(np.ascontiguousarray(conductivity_laplacian.indices, dtype=np.int64).tobytes())
+
+    if not structure_only:
+        hasher.update(np.ascontiguousarray(conductivity_laplacian.data).tobytes())
+        hasher.update(repr(line_loss).encode('utf-8'))
+
+    return hasher.hexdigest()
+
+
+def system_key(conductivity_laplacian: spmat.csc_matrix,
+               system_hash: Union[str, None] = None) -> tuple:
+    """
+    Computes the key identifying a conduction system and its exact laplacian values, under
+    which its factorization and potentials are cached
+
+    :param conductivity_laplacian: conductivity laplacian with sorted indices
+    :param system_hash: hash of the conduction system (e.g. InteractomeInterface.md5_hash())
+    :return: key tuple
+    """
+    return system_hash, line_loss, laplacian_fingerprint(conductivity_laplacian)
+
+
+def _ordering_location(system_hash: str) -> str:
+    return os.path.join(Dumps.factor_cache, '%s_%s.npy' % (system_hash, repr(line_loss)))
+
+
+def _load_ordering(system_hash: str, fingerprint: str) -> Union[np.ndarray, None]:
+    location = _ordering_location(system_hash)
+
+    if not os.path.isfile(location):
+        return None
+
+    try:
+        payload = np.load(location, allow_pickle=False)
+    except (OSError, ValueError) as error:
+        log.warning('factor cache: failed to load ordering from %s: %s', location, error)
+        return None
+
+    # first two int64 words are the structure hash, the rest is the permutation
+    if payload[:2].tobytes() != bytes.fromhex(fingerprint):
+        return None
+
+    return payload[2:]
+
+
+def _save_ordering(system_hash: str, fingerprint: str, permutation: np.ndarray):
+    if not os.path.isdir(Dumps.factor_cache):
+        os.makedirs(Dumps.factor_cache)
+
+    payload = np.concatenate((np.frombuffer(bytes.fromhex(fingerprint), dtype=np.int64),
+                              np.asarray(permutation, dtype=np.int64)))
+    temporary_location = _ordering_location(system_hash) + '.%s.tmp.npy' % os.getpid()
+    np.save(temporary_location, payload)
+    os.replace(temporary_location, _ordering_location(system_hash))
+
+
+def _factorize(conductivity_laplacian: spmat.csc_matrix, system_hash: Union[str, None]):
+    """
+    Factorizes the laplacian, re-using the ordering saved on disk if there is one
+
+    :return: callable solver
+    """
+    if system_hash is None or not factor_cache_on_disk:
+        return chmd.cholesky(conductivity_laplacian, line_loss)
+
+    structure_fingerprint = laplacian_fingerprint(conductivity_laplacian, structure_only=True)
+    permutation = _load_ordering(system_hash, structure_fingerprint)
+
+    if permutation is not None:
+        log.debug('factor cache: on-disk ordering hit for %s', system_hash)
+        permuted_laplacian = conductivity_laplacian[permutation, :][:, permutation]
+        return PermutedFactor(chmd.cholesky(spmat.csc_matrix(permuted_laplacian), line_loss,
+                                            ordering_method='natural'),
+                              permutation)
+
+    log.debug('factor cache: miss for %s', system_hash)
+    solver = chmd.cholesky(conductivity_laplacian, line_loss)
+    _save_ordering(system_hash, structure_fingerprint, solver.P())
+
+    return solver
+
+
+def _modification_cover(modification: spmat.csr_matrix) -> np.ndarray:
+    """
+    Greedily picks a set of nodes covering all the non-null entries of a symmetric modification,
+    i.e. such that each entry is in the row or the column of one of them. A node reweight
+    modifies the row and column of the node, which is then the only node needed.
+
+    Stops as soon as the cover exceeds low_rank_max_nodes.
+
+    :param modification: symmetric modification of the laplacian
+    :return: sorted indexes of the covering nodes
+    """
+    modification_coo = modification.tocoo()
+    nodes, entry_nodes = np.unique(np.concatenate((modification_coo.row, modification_coo.col)),
+                                   return_inverse=True)
+    rows, cols = entry_nodes[:modification_coo.nnz], entry_nodes[modification_coo.nnz:]
+    uncovered = np.ones(modification_coo.nnz, dtype=bool)
+    cover = []
+
+    while uncovered.any() and len(cover) <= low_rank_max_nodes:
+        node = np.bincount(rows[uncovered], minlength=nodes.shape[0]).argmax()
+        cover.append(node)
+        uncovered &= (rows != node) & (cols != node)
+
+    return np.sort(nodes[cover])
+
+
+def _low_rank_solver(conductivity_laplacian: spmat.csc_matrix,
+                     base_laplacian: spmat.csc_matrix,
+                     system_hash: Union[str, None]) -> Union[LowRankUpdatedSolver, None]:
+    """
+    Builds a low-rank updated solver if the laplacian differs from the base one in the rows
+    and columns of few enough nodes, in a symmetric way
+
+    :return: solver or None if a low-rank update is not applicable
+    """
+    if base_laplacian.shape != conductivity_laplacian.shape:
+        return None
+
+    modification = (conductivity_laplacian - spmat.csc_matrix(base_laplacian)).tocsr()
+    modification.eliminate_zeros()
+
+    if modification.nnz == 0:
+        return None
+
+    if abs(modification - modification.T).max() > 0:
+        log.debug('low-rank update: modification is not symmetric, refactorizing')
+        return None
+
+    modified_nodes = _modification_cover(modification)
+
+    if modified_nodes.shape[0] > low_rank_max_nodes:
+        log.debug('low-rank update: more than %s nodes needed to cover the modification, '
+                  'refactorizing', low_rank_max_nodes)
+        return None
+
+    log.debug('low-rank update: re-using base factor for %s modified nodes',
+              modified_nodes.shape[0])
+
+    return LowRankUpdatedSolver(get_shared_solver(base_laplacian, system_hash),
+                                modified_nodes, modification[modified_nodes, :])
+
+
+def get_shared_solver(conductivity_laplacian: spmat.csc_matrix,
+                      system_hash: Union[str, None] = None,
+                      base_laplacian: Union[spmat.csc_matrix, None] = None):
+    """
+    Recovers a solver for the conductivity laplacian, reusing the in-memory factorization of the
+    same laplacian if there is one. Otherwise, if the system hash is known, re-uses the
+    fill-reducing ordering from a previous factorization of the same system saved on disk,
+    which allows to skip the ordering computation. CHOLMOD factors themselves can't be
+    serialized, so the numerical factorization is still performed.
+
+    If a base laplacian is provided and the laplacian differs from it only for a few nodes
+    (e.g. after InteractomeInterface.apply_reweight_dict), the factorization of the base
+    laplacian is re-used with a low-rank correction.
+
+    :param conductivity_laplacian: conductivity laplacian
+    :param system_hash: hash of the conduction system (e.g. InteractomeInterface.md5_hash())
+    :param base_laplacian: laplacian from which the conductivity laplacian was derived
+    :return: callable solver
+    """
+    conductivity_laplacian = spmat.csc_matrix(conductivity_laplacian)
+    conductivity_laplacian.sort_indices()
+    key = system_key(conductivity_laplacian, system_hash)
+
+    if key in _factor_cache:
+        log.debug('factor cache: in-memory hit for %s', system_hash)
+        _factor_cache.move_to_end(key)
+        return _factor_cache[key]
+
+    solver = None
+    if base_laplacian is not None and low_rank_reweight:
+        solver = _low_rank_solver(conductivity_laplacian, base_laplacian, system_hash)
+
+    if solver is None:
+        solver = _factorize(conductivity_laplacian, system_hash)
+
+    if factor_cache_size > 0:
+        _factor_cache[key] = solver
+        while len(_factor_cache) > factor_cache_size:
+            _factor_cache.popitem(last=False)
+
+    return solver
+
+
+def clear_factor_cache():
+    """
+    Drops all the in-memory factorizations
+    """
+    _factor_cache.clear()
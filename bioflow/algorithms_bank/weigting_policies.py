@@ -1,6 +1,7 @@
 """
 Module containing functions that perform weighting policies
 """
+import numpy as np
 from bioflow.utils.log_behavior import get_logger
 import bioflow.configs.main_configs as confs
 from random import uniform
@@ -70,5 +71,158 @@ def default_adj_source_x_type_policy(start_node, end_node, edge) -> float:
                                 confs.adjacency_default_type_edge_weighting)
 
 
+def build_edge_table(node_dict: dict, edge_list: list, node_id_2_mat_idx: dict) -> dict:
+    """
+    Converts an edge list into a columnar edge table, on which the array policies operate
+
+    :param node_dict: dictionary mapping node id to node objects
+    :param edge_list: list of edges that exist in the database
+    :param node_id_2_mat_idx: node id to matrix index map
+    :return: dict of arrays: 'start_idx', 'end_idx', 'type', 'source', 'confidence' (nan if
+        not defined), 'start_degree', 'end_degree', as well as the 'start_nodes', 'end_nodes'
+        and 'edges' objects lists, used by the scalar policies fallback
+    """
+    start_nodes = [node_dict[_edge.start_node.id] for _edge in edge_list]
+    end_nodes = [node_dict[_edge.end_node.id] for _edge in edge_list]
+
+    edge_table = {
+        'start_idx': np.array([node_id_2_mat_idx[_edge.start_node.id] for _edge in edge_list],
+                              dtype=np.int64),
+        'end_idx': np.array([node_id_2_mat_idx[_edge.end_node.id] for _edge in edge_list],
+                            dtype=np.int64),
+        'type': np.array([_edge.type for _edge in edge_list], dtype=object),
+        'source': np.array([_edge.get('source') for _edge in edge_list], dtype=object),
+        'confidence': np.array([_edge.get('confidence', np.nan) for _edge in edge_list],
+                               dtype=float),
+        'start_nodes': start_nodes,
+        'end_nodes': end_nodes,
+        'edges': edge_list,
+    }
+
+    degrees = np.bincount(np.concatenate((edge_table['start_idx'], edge_table['end_idx'])),
+                          minlength=len(node_id_2_mat_idx))
+    edge_table['start_degree'] = degrees[edge_table['start_idx']]
+    edge_table['end_degree'] = degrees[edge_table['end_idx']]
+
+    return edge_table
+
+
+def _map_categories(categories: np.ndarray, weights: dict) -> np.ndarray:
+    """
+    Maps a categorical array to weights, looking up each distinct category only once. The
+    categories are looked up as they are (e.g. None for a missing source), as the scalar
+    policies do
+
+    :param categories: array of categories
+    :param weights: category to weight map
+    :return: array of weights
+    """
+    if categories.shape[0] == 0:
+        return np.zeros(0)
+
+    _, first, inverse = np.unique(np.array([repr(_category) for _category in categories]),
+                                  return_index=True, return_inverse=True)
+    return np.array([weights[categories[_i]] for _i in first.tolist()], dtype=float)[inverse]
+
+
+def flat_array_policy(edge_table: dict) -> np.ndarray:
+    """
+    Array version of the flat_policy
+
+    :param edge_table: columnar edge table, as built by build_edge_table
+    :return: array of ones
+    """
+    return np.ones(edge_table['start_idx'].shape[0])
+
+
+def source_x_type_array_policy(edge_table: dict, source_weights, type_weights,
+                               drop_chance=confs.fraction_edges_dropped_in_laplacian) \
+        -> np.ndarray:
+    """
+    Array version of the source_x_type_policy
+
+    :param edge_table: columnar edge table, as built by build_edge_table
+    :param source_weights:
+    :param type_weights:
+    :param drop_chance:
+    :return: array of weights
+    """
+    weights = _map_categories(edge_table['type'], type_weights) * \
+        _map_categories(edge_table['source'], source_weights)
+
+    if drop_chance > 0.0001:
+        weights[np.random.uniform(0.0, 1.0, weights.shape[0]) < drop_chance] = 0
+
+    return weights
+
+
+def default_lapl_source_x_type_array_policy(edge_table: dict) -> np.ndarray:
+    """
+    Array version of the default_lapl_source_x_type_policy
+
+    :param edge_table: columnar edge table, as built by build_edge_table
+    :return: array of weights
+    """
+    return source_x_type_array_policy(edge_table,
+                                      confs.laplacian_default_source_edge_weighting,
+                                      confs.laplacian_default_type_edge_weighting)
+
+
+def default_adj_source_x_type_array_policy(edge_table: dict) -> np.ndarray:
+    """
+    Array version of the default_adj_source_x_type_policy
+
+    :param edge_table: columnar edge table, as built by build_edge_table
+    :return: array of weights
+    """
+    return source_x_type_array_policy(edge_table,
+                                      confs.adjacecency_default_source_edge_weighting,
+                                      confs.adjacency_default_type_edge_weighting)
+
+
+# scalar policy -> array policy
+_array_policies = {
+    flat_policy: flat_array_policy,
+    default_lapl_source_x_type_policy: default_lapl_source_x_type_array_policy,
+    default_adj_source_x_type_policy: default_adj_source_x_type_array_policy,
+}
+
+
+def register_array_policy(scalar_policy, array_policy):
+    """
+    Registers the array version of a scalar policy, to be used for the matrix construction
+
+    :param scalar_policy: (start_node, end_node, edge) -> weight function
+    :param array_policy: edge table -> weights array function
+    """
+    _array_policies[scalar_policy] = array_policy
+
+
+def get_array_policy(policy):
+    """
+    Recovers the array version of a policy. Array policies are returned as is, and scalar
+    policies without a registered array version are wrapped to be applied edge by edge
+
+    :param policy: scalar or array policy
+    :return: edge table -> weights array function
+    """
+    if policy in _array_policies:
+        return _array_policies[policy]
+
+    if policy in _array_policies.values():
+        return policy
+
+    log.debug('no array version for policy %s, falling back to per-edge application',
+              getattr(policy, '__name__', policy))
+
+    def scalar_fallback(edge_table: dict) -> np.ndarray:
+        return np.array([policy(_start, _end, _edge) for _start, _end, _edge
+                         in zip(edge_table['start_nodes'], edge_table['end_nodes'],
+                                edge_table['edges'])],
+                        dtype=float)
+
+    return scalar_fallback
+
+
 active_default_lapl_weighting_policy = default_lapl_source_x_type_policy
 active_default_adj_weighting_policy = default_adj_source_x_type_policy
\ No newline at end of file
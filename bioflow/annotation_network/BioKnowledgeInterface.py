@@ -8,12 +8,11 @@ import pickle
 import random
 import string
 import math
-import datetime
 from collections import defaultdict
 from copy import copy
 from random import shuffle, sample
 from csv import reader
-from itertools import combinations, chain
+from itertools import chain
 from pprint import PrettyPrinter
 from random import shuffle
 from time import time
@@ -21,13 +20,14 @@ import traceback, sys
 from typing import Union, Tuple, List
 
 import numpy as np
-from scipy.sparse import lil_matrix, triu
-from scipy.sparse.csgraph import shortest_path
+from scipy.sparse import lil_matrix, csr_matrix, csc_matrix, coo_matrix, diags, triu
 
 from bioflow.algorithms_bank import conduction_routines as cr
+from bioflow.algorithms_bank.solver_caches import reach_factor_cache, system_key
 from bioflow.configs import main_configs as confs
 from bioflow.configs.main_configs import Dumps, NewOutputs
-from bioflow.sample_storage.mongodb import insert_annotome_rand_samp
+from bioflow.sample_storage.sample_store import insert_annotome_rand_samp
+from bioflow.sample_storage.sample_schema import encode_rand_sample
 from bioflow.molecular_network.InteractomeInterface import InteractomeInterface
 from bioflow.neo4j_db.GraphDeclarator import DatabaseGraph
 from bioflow.utils.gdfExportInterface import GdfExportInterface
@@ -35,7 +35,8 @@ from bioflow.utils.io_routines import dump_object, undump_object, get_background
 from bioflow.utils.log_behavior import get_logger
 from bioflow.algorithms_bank import sampling_policies
 from bioflow.algorithms_bank.flow_calculation_methods import general_flow,\
-    reduce_and_deduplicate_sample, evaluate_ops, reduce_ops
+    reduce_and_deduplicate_sample, evaluate_ops, reduce_ops, flow_pair_chunks, \
+    concatenate_pair_chunks
 from bioflow.algorithms_bank.sampling_policies import characterize_flow_parameters, _is_int
 
 
@@ -444,21 +445,8 @@ class GeneOntologyInterface(object):
 
             # link annotations between them:
             else:  # el_obj['parse_type'] == 'annotation_relationship':
-                # for that we actually will need to build a more complicated
-                # OPTIMIZE: to match the previous way it functioned we would have needed to
-                #  more up only, not down/sideways. Basically find all the UPs and run the cycle
-                #  of rel>GO>rel>GO>rel>GO maps until we are out of Uniprots.
-                # OPTIMIZE: that would also allow us to eliminate the overly complex
-                #  self.get_go_reach
-                #  That would define:
-                #   - self._limiter_go_2_up_reachable_nodes
-                #   - self._limiter_go_2_up_step_reachable_nodes
-                #   - self._limiter_up_2_go_reachable_nodes
-                #   - self._limiter_up_2_go_step_reachable_nodes
-                #   - GO2_Pure_Inf
-                #   - _limiter_go_2_weighted_ent
-                # The final decision is that to save the time we will stick with what
-                #  there was already before.
+                # get_go_reach then propagates the UPs up the GO terms along the relationships,
+                #  one step at a time, until no new UP is reached.
                 if rel_obj.type in self._go_up_types:
                     self._limiter_reachable_nodes_dict[start_id][0].add(end_id)
                     self._limiter_reachable_nodes_dict[end_id][2].add(start_id)
@@ -556,32 +544,61 @@ class GeneOntologyInterface(object):
                    math.log(1 / float(number), 2), self.correction_factor[1])
 
 
-    # REFACTOR: [Maintenability]: method is excessively complex (cyc. complexity ~ 18).
     def get_go_reach(self):
         """
         Recovers by how many different uniprots each GO term is reached, both in
         distance-agnostic and distance-specific terms.
-
-        :raise Exception: if the reaches are not equivalent
-        :raise Exception: if null section in a non-nul patch
         """
 
-        def verify_equivalence_of_reaches(step_reach, reach):
+        def propagate_step_reach():
             """
+            Propagates the UPs annotated by each GO term to all the more general terms, one
+            relationship step at a time, as a sparse breadth-first search from all the
+            annotated terms at once. Unlike all-pairs shortest paths, no dense term x term
+            matrix is built, and cycles introduced by the regulation relationships are
+            supported.
 
-            :param step_reach:
-            :param reach:
-            :raise Exception: if the reaches are not equivalent
+            :return: rows (GO matrix indexes), UP ids and min number of steps of each reach
             """
-            dict_len = {key: [len(val), len(list(step_reach[key].keys()))]
-                        for key, val in reach.items()}
-
-            for key, val in dict_len.items():
-                if val[1] != val[0]:
-                    log.critical(
-                        'Reach exploration results not equivalent! Please report the error.')
-                    raise Exception(
-                        'Reach exploration results not equivalent! Please report the error.')
+            up_ids = sorted(set(chain.from_iterable(self.term_2_entities_neo4j_ids.values())))
+            up_2_col = dict((up_id, col) for col, up_id in enumerate(up_ids))
+
+            rows, cols = [], []
+            for term, ups in self.term_2_entities_neo4j_ids.items():
+                if term in self.node_id_2_mat_idx:
+                    rows += [self.node_id_2_mat_idx[term]] * len(ups)
+                    cols += [up_2_col[up_id] for up_id in ups]
+
+            frontier = csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                  shape=(self.dir_adj_matrix.shape[0], len(up_ids)))
+            frontier.data[:] = 1
+
+            # dir_adj_matrix[i, j] is set if j is more general than i
+            propagation = csr_matrix(self.dir_adj_matrix).transpose().tocsr()
+            propagation.data[:] = 1
+
+            reached = frontier.copy()
+            reach_rows, reach_cols, reach_steps = [np.array([], dtype=int)], \
+                [np.array([], dtype=int)], [np.array([])]
+            step = 0
+
+            while frontier.nnz:
+                step += 1
+                candidates = propagation.dot(frontier)
+                candidates.data[:] = 1
+                frontier = candidates - candidates.multiply(reached)
+                frontier.eliminate_zeros()
+                reached = reached + frontier
+
+                _rows, _cols = frontier.nonzero()
+                reach_rows.append(_rows)
+                reach_cols.append(_cols)
+                reach_steps.append(np.full(_rows.shape[0], float(step)))
+
+            log.debug('GO reach propagated in %s steps', step)
+
+            return np.concatenate(reach_rows), np.array(up_ids)[np.concatenate(reach_cols)], \
+                np.concatenate(reach_steps)
 
         def special_sum(_val_dict, filter_function=lambda x: x + 1.0):
             """
@@ -596,48 +613,19 @@ class GeneOntologyInterface(object):
                 summer += filter_function(key) * len(val_list)
             return summer
 
-        dir_reg_path = shortest_path(self.dir_adj_matrix, directed=True, method='D')
-        dir_reg_path[np.isinf(dir_reg_path)] = 0.0   # potential problem from pycharm
-        dir_reg_path = lil_matrix(dir_reg_path)
-
-        # Load all the GOs that can potentially be reached
-        self._limiter_go_2_up_reachable_nodes = dict((el, []) for el in list(self._limiter_reachable_nodes_dict.keys()))
-        # Load all the UPs that are reached directly from the GO nodes.
-        self._limiter_go_2_up_reachable_nodes.update(self.term_2_entities_neo4j_ids)
-
-        pre_go2up_step_reachable_nodes = dict((key, dict((v, 0) for v in val))
-                                                for key, val in self._limiter_go_2_up_reachable_nodes.items())
-        # when called on possibly un-encoutenred items, anticipate a default
-        # value of 100 000
-
-        # Now just scan vertical columns and add UP terms attached
-        for idx1, idx2 in zip(list(dir_reg_path.nonzero()[0]),
-                              list(dir_reg_path.nonzero()[1])):
-            # add UPs annotated by a node to all more general terms.
-            self._limiter_go_2_up_reachable_nodes[self.mat_idx_2_note_id[idx2]] +=\
-                self._limiter_go_2_up_reachable_nodes[self.mat_idx_2_note_id[idx1]]
-
-            if dir_reg_path[idx1, idx2] < 1.0:
-                log.critical("null in non-null patch")
-                raise Exception("null in non-null patch")
-
-            step_reach_upgrade = dict(
-                (key, val + dir_reg_path[idx1, idx2])
-                for key, val in pre_go2up_step_reachable_nodes[self.mat_idx_2_note_id[idx1]].items())
-
-            for k, v in step_reach_upgrade.items():
-                pre_go2up_step_reachable_nodes[
-                    self.mat_idx_2_note_id[idx2]][k] = min(
-                    pre_go2up_step_reachable_nodes[
-                        self.mat_idx_2_note_id[idx2]].setdefault(
-                        k, 100000), v)
-
-        for key, val in self._limiter_go_2_up_reachable_nodes.items():
-            self._limiter_go_2_up_reachable_nodes[key] = list(set(val))
-
-        verify_equivalence_of_reaches(
-            pre_go2up_step_reachable_nodes,
-            self._limiter_go_2_up_reachable_nodes)
+        # Load all the GOs that can potentially be reached, with the UPs they annotate directly
+        pre_go2up_step_reachable_nodes = dict((el, {}) for el in
+                                              list(self._limiter_reachable_nodes_dict.keys()))
+        pre_go2up_step_reachable_nodes.update(
+            dict((key, dict((v, 0) for v in val))
+                 for key, val in self.term_2_entities_neo4j_ids.items()))
+
+        # add UPs annotated by a node to all more general terms.
+        for idx, up_id, step in zip(*[_array.tolist() for _array in propagate_step_reach()]):
+            pre_go2up_step_reachable_nodes[self.mat_idx_2_note_id[idx]][up_id] = step
+
+        self._limiter_go_2_up_reachable_nodes = dict(
+            (key, list(val_dict.keys())) for key, val_dict in pre_go2up_step_reachable_nodes.items())
 
         # Now we need to invert the reach to get the set of all the primary and
         # derived GO terms that describe a UP
@@ -672,22 +660,29 @@ class GeneOntologyInterface(object):
         if has been done in the adjunction matrix computation
 
         """
-        base_matrix = -copy(self.dir_adj_matrix)
-        nz_list = copy(
-            list(zip(list(base_matrix.nonzero()[0]), list(base_matrix.nonzero()[1]))))
+        from_indexes, to_indexes = self.dir_adj_matrix.nonzero()
+
+        node_informativity = np.zeros(self.dir_adj_matrix.shape[0])
+        for idx in np.unique(np.concatenate((from_indexes, to_indexes))).tolist():
+            node_informativity[idx] = self.GO2_Pure_Inf[self.mat_idx_2_note_id[idx]]
 
         # REFACTOR: [Better weights]: change that to a version using a function to calculate the
         #  weights (weigting policy)
-        for idx1, idx2 in nz_list:
-            min_inf = min(
-                self.GO2_Pure_Inf[self.mat_idx_2_note_id[idx1]],
-                self.GO2_Pure_Inf[self.mat_idx_2_note_id[idx2]])
-            base_matrix[idx1, idx2] = -min_inf
-            base_matrix[idx2, idx1] = -min_inf
-            base_matrix[idx2, idx2] += min_inf
-            base_matrix[idx1, idx1] += min_inf
-
-        self.laplacian_matrix = base_matrix
+        min_inf = np.minimum(node_informativity[from_indexes], node_informativity[to_indexes])
+
+        # an edge conductance is set once even if the terms are related in both directions,
+        # whereas the diagonal is incremented for every relation
+        pairs, first_occurrence = np.unique(np.sort(np.column_stack((from_indexes, to_indexes)),
+                                                    axis=1),
+                                            axis=0, return_index=True)
+        pair_inf = min_inf[first_occurrence]
+        off_diagonal = pairs[:, 0] != pairs[:, 1]
+
+        self.laplacian_matrix = coo_matrix(
+            (np.concatenate((-pair_inf, -pair_inf[off_diagonal], min_inf, min_inf)),
+             (np.concatenate((pairs[:, 0], pairs[off_diagonal, 1], from_indexes, to_indexes)),
+              np.concatenate((pairs[:, 1], pairs[off_diagonal, 0], from_indexes, to_indexes)))),
+            shape=self.dir_adj_matrix.shape).tocsc()
 
     def compute_uniprot_dict(self):
         """
@@ -912,23 +907,23 @@ class GeneOntologyInterface(object):
                        for Idx, UP in enumerate(self.known_up_ids))
         idx2ups = dict((Idx, UP) for UP, Idx in up2idxs.items())
 
-        self.inflated_laplacian = lil_matrix(
-            (self.laplacian_matrix.shape[0] + len(self.known_up_ids),
-             self.laplacian_matrix.shape[1] + len(self.known_up_ids)))
-
-        self.inflated_laplacian[:self.laplacian_matrix.shape[0], :self.laplacian_matrix.shape[1]] =\
-            self.laplacian_matrix
-
+        up_indexes, go_indexes = [], []
         for uniprot in self.known_up_ids:
-            for go_term in self.entity_2_terms_neo4j_ids.get(uniprot, []):  # should never hit the [] though
-                self.inflated_laplacian[
-                    up2idxs[uniprot], up2idxs[uniprot]] += self.binding_intensity
-                self.inflated_laplacian[
-                    self.node_id_2_mat_idx[go_term], self.node_id_2_mat_idx[go_term]] += self.binding_intensity
-                self.inflated_laplacian[
-                    self.node_id_2_mat_idx[go_term], up2idxs[uniprot]] -= self.binding_intensity
-                self.inflated_laplacian[
-                    up2idxs[uniprot], self.node_id_2_mat_idx[go_term]] -= self.binding_intensity
+            go_terms = self.entity_2_terms_neo4j_ids.get(uniprot, [])  # should never hit the []
+            up_indexes += [up2idxs[uniprot]] * len(go_terms)
+            go_indexes += [self.node_id_2_mat_idx[go_term] for go_term in go_terms]
+
+        up_indexes = np.array(up_indexes, dtype=int)
+        go_indexes = np.array(go_indexes, dtype=int)
+        bindings = np.full(up_indexes.shape[0], self.binding_intensity)
+        go_laplacian = coo_matrix(self.laplacian_matrix)
+
+        self.inflated_laplacian = coo_matrix(
+            (np.concatenate((go_laplacian.data, bindings, bindings, -bindings, -bindings)),
+             (np.concatenate((go_laplacian.row, up_indexes, go_indexes, go_indexes, up_indexes)),
+              np.concatenate((go_laplacian.col, up_indexes, go_indexes, up_indexes, go_indexes)))),
+            shape=(self.laplacian_matrix.shape[0] + len(self.known_up_ids),
+                   self.laplacian_matrix.shape[1] + len(self.known_up_ids))).tocsc()
 
         self.inflated_lbl2idx = copy(self.node_id_2_mat_idx)
         self.inflated_lbl2idx.update(up2idxs)
@@ -961,7 +956,8 @@ class GeneOntologyInterface(object):
             # resume the sampling
             cancellation: bool = False,
             sparse_rounds: int = -1,
-            potential_dominated: bool = True):
+            potential_dominated: bool = True,
+            processes: Union[int, None] = None):
         """
         Builds a conduction matrix that integrates uniprots, in order to allow an easier
         knowledge flow analysis
@@ -977,6 +973,8 @@ class GeneOntologyInterface(object):
         not dense, i.e. instead of computation for each node pair, only an estimation will be
         made, equal to computing sparse sampling association with other randomly chosen nodes
         :param potential_dominated: if the total current is normalized to potential
+        :param processes: number of worker processes the pairs are split between. Defaults to
+            the `flow_processes` config value
         :return: adjusted conduction system
         """
 
@@ -985,59 +983,93 @@ class GeneOntologyInterface(object):
             self.UP2UP_voltages = {}
             self.uniprots_2_voltage = {}
 
-        weighted_up_pairs = self._flow_calculation_method(self._active_weighted_sample,
-                                                          self._secondary_weighted_sample,
-                                                          sparse_rounds)
-        # pairs in the list of pairs are now guaranteed to be weighted
+        # pairs are streamed in chunks and are guaranteed to be weighted
+        weighted_up_pair_chunks = flow_pair_chunks(self._flow_calculation_method,
+                                                   self._active_weighted_sample,
+                                                   self._secondary_weighted_sample,
+                                                   sparse_rounds)
+
+        inflated_laplacian = self.inflated_laplacian.tocsc()
+        inflated_laplacian.sort_indices()
+        # factorizations of reaches already encountered, in this sample or before, are re-used
+        reach_cache_key = system_key(inflated_laplacian, self.md5_hash())
+
+        def _index_pairs(weighted_up_pairs):
+            # pairs are passed to the flow engines as matrix indexes
+            index_pairs = weighted_up_pairs.copy()
+            for field in ['i', 'j']:
+                index_pairs[field] = [self.inflated_lbl2idx[up_id]
+                                      for up_id in weighted_up_pairs[field].tolist()]
+            return index_pairs
+
+        # reaches are built for all the sampled UPs, before any pair is drawn
+        sampled_up_ids = [up_id for up_id, _ in self._active_weighted_sample]
+        if self._secondary_weighted_sample is not None:
+            sampled_up_ids += [up_id for up_id, _ in self._secondary_weighted_sample]
+
+        reach_rows, reach_cols = [], []
+        for up_id in np.unique(np.array(sampled_up_ids, dtype=int)).tolist():
+            reach = [self.inflated_lbl2idx[label]
+                     for label in self._limiter_up_2_go_reachable_nodes[up_id]]
+            reach_rows += reach
+            reach_cols += [self.inflated_lbl2idx[up_id]] * len(reach)
 
-        total_pairs = len(weighted_up_pairs)
-        breakpoints = 300
-        previous_time = time()
+        reach_matrix = csc_matrix((np.ones(len(reach_rows)), (reach_rows, reach_cols)),
+                                  shape=inflated_laplacian.shape)
 
-        for counter, (up_w_id_1, up_w_id_2) in enumerate(weighted_up_pairs):
+        if processes is None:
+            processes = confs.flow_processes
 
-            up_id_1, w_1 = up_w_id_1
-            up_id_2, w_2 = up_w_id_2
-            mean_weight = (w_1 + w_2) / 2.
+        if processes > 1:
+            # imported here to avoid a circular import
+            from bioflow.algorithms_bank.parallel_conduction_routines import \
+                parallel_reach_limited_flow_calc
 
-            idx1, idx2 = (self.inflated_lbl2idx[up_id_1], self.inflated_lbl2idx[up_id_2])
+            # the pairs are split between the workers, hence need to be known in advance
+            index_pairs = _index_pairs(concatenate_pair_chunks(weighted_up_pair_chunks))
+            total_pairs = index_pairs.shape[0]
 
-            pre_reach = self._limiter_up_2_go_reachable_nodes[up_id_1] + \
-                        self._limiter_up_2_go_reachable_nodes[up_id_2] + \
-                        [up_id_1] + [up_id_2]
+            current_rows, current_cols, current_values, index_pair_2_voltage = \
+                parallel_reach_limited_flow_calc(inflated_laplacian, index_pairs, reach_matrix,
+                                                 processes,
+                                                 potential_dominated=potential_dominated,
+                                                 reach_cache_key=reach_cache_key,
+                                                 thread_hex=self.thread_hex)
 
-            reach = [self.inflated_lbl2idx[label] for label in pre_reach]
+        else:
+            total_pairs = 0
+            current_rows, current_cols, current_values = [], [], []
+            index_pair_2_voltage = {}
 
-            current_upper, potential_diff = cr.group_edge_current_with_limitations(
-                inflated_laplacian=self.inflated_laplacian,
-                idx_pair=(idx1, idx2),
-                reach_limiter=reach)
+            for weighted_up_pairs in weighted_up_pair_chunks:
+                total_pairs += weighted_up_pairs.shape[0]
 
-            self.UP2UP_voltages[tuple(sorted((up_id_1, up_id_2)))] = potential_diff
+                chunk_rows, chunk_cols, chunk_values, chunk_pair_2_voltage = \
+                    cr.reach_limited_flow_calc(inflated_laplacian, _index_pairs(weighted_up_pairs),
+                                               reach_matrix,
+                                               potential_dominated=potential_dominated,
+                                               reach_cache_key=reach_cache_key,
+                                               thread_hex=self.thread_hex)
 
-            if potential_dominated:
-                if potential_diff != 0:
-                    current_upper = current_upper / potential_diff
+                current_rows.append(chunk_rows)
+                current_cols.append(chunk_cols)
+                current_values.append(chunk_values)
+                index_pair_2_voltage.update(chunk_pair_2_voltage)
 
-                else:
-                    log.warning('pairwise flow. On indexes %s %s potential difference is null. %s',
-                                up_id_1, up_id_2, 'Tension-normalization was aborted')
+            current_rows = np.concatenate(current_rows) if current_rows else np.array([], int)
+            current_cols = np.concatenate(current_cols) if current_cols else np.array([], int)
+            current_values = np.concatenate(current_values) if current_values else np.array([])
 
-            self.current_accumulator = self.current_accumulator + \
-                                       cr.sparse_abs(current_upper) * mean_weight
+            log.info('thread hex: %s; %s', self.thread_hex, reach_factor_cache.report())
 
-            if counter % breakpoints == 0 and counter > 1:
-                # TODO: [load bar] the internal loop load bar goes here
-                compops = float(breakpoints) / (time() - previous_time)
-                mins_before_termination = (total_pairs - counter) / compops // 60
-                finish_time = datetime.datetime.now() + datetime.timedelta(minutes=mins_before_termination)
-                log.info("thread hex: %s; progress: %s/%s, current speed: %.2f compop/s, "
-                         "time remaining: "
-                         "%.0f "
-                         "min, finishing: %s "
-                         % (self.thread_hex, counter, total_pairs, compops, mins_before_termination,
-                            finish_time.strftime("%m/%d/%Y, %H:%M:%S")))
-                previous_time = time()
+        for (idx_1, idx_2), potential_diff in index_pair_2_voltage.items():
+            self.UP2UP_voltages[tuple(sorted((self.inflated_idx2lbl[idx_1],
+                                              self.inflated_idx2lbl[idx_2])))] = potential_diff
+
+        # reach-limited currents are small: they are gathered and summed up once at the end
+        self.current_accumulator = self.current_accumulator + coo_matrix(
+            (current_values, (current_rows, current_cols)),
+            shape=self.current_accumulator.shape).tocsc()
 
         self.current_accumulator = triu(self.current_accumulator)
 
@@ -1239,7 +1271,10 @@ class GeneOntologyInterface(object):
 
             # TODO: [fast resurrection] fast resurrection is impossible (memoized is false,
             #  but pipeline is broken)
-            self.compute_current_and_potentials(memoized=False, sparse_rounds=sparse_rounds)
+            # random samplers already run in a pool of their own, whose processes can't have
+            # children, hence the single process
+            self.compute_current_and_potentials(memoized=False, sparse_rounds=sparse_rounds,
+                                                processes=1)
 
             sample_ids_md5 = hashlib.md5(
                 json.dumps(
@@ -1257,7 +1292,7 @@ class GeneOntologyInterface(object):
                             sparse_rounds, sampling_policy.__name__, optional_sampling_param,
                             np.sum(self.current_accumulator)))
 
-            insert_annotome_rand_samp(
+            insert_annotome_rand_samp(encode_rand_sample(
                         {
                             'UP_hash': sample_ids_md5,
                             'sys_hash': self.md5_hash(),
@@ -1265,32 +1300,79 @@ class GeneOntologyInterface(object):
                             'target_sample_hash': super_hash,
                             'sampling_policy': sampling_policy.__name__,
                             'sampling_policy_options': optional_sampling_param,
-                            'sparse_rounds': sparse_rounds,
-                            'UPs': pickle.dumps(self._active_up_sample),
-                            'sample': pickle.dumps(self._active_weighted_sample),
-                            'sec_sample': pickle.dumps(self._secondary_weighted_sample),
-                            'currents': pickle.dumps(
-                                (self.current_accumulator,
-                                 self.node_current)),
-                            'voltages': pickle.dumps(
-                                self.UP2UP_voltages)})
+                            'sparse_rounds': sparse_rounds},
+                        self._active_up_sample,
+                        self._active_weighted_sample,
+                        self._secondary_weighted_sample,
+                        node_currents=[self.node_current[self.inflated_idx2lbl[_idx]]
+                                       for _idx in range(len(self.inflated_idx2lbl))],
+                        voltage_indexes=[(self.inflated_lbl2idx[_id_1], self.inflated_lbl2idx[_id_2])
+                                         for _id_1, _id_2 in self.UP2UP_voltages.keys()],
+                        voltage_values=list(self.UP2UP_voltages.values()),
+                        current_matrix=self.current_accumulator))
 
         self._active_weighted_sample = preserved_sample
         self._secondary_weighted_sample = preserved_sec_sample
 
-    def get_independent_linear_groups(self):
+    def get_independent_linear_groups(self, top_k: Union[int, None] = None,
+                                      block_size: int = 4096):
         """
         Recovers independent linear groups of the GO terms. Independent linear groups are
         those that share a significant amount of reached_uniprots_neo4j_id_list in common
+
+        The co-occurrences of the GO terms are computed as the product of the UP x GO reach
+        incidence matrix with itself, one block of GO terms at a time, and converted into a
+        laplacian.
+
+        :param top_k: if set, only the top_k co-occurrences of each GO term are kept (an edge is
+            kept if it is in the top_k of either term), to bound memory
+        :param block_size: number of GO terms whose co-occurrences are computed at once
         """
-        self.indep_lapl = lil_matrix((len(self.all_nodes_neo4j_ids), len(self.all_nodes_neo4j_ids)))
-        for GO_list in self._limiter_up_2_go_reachable_nodes.values():
-            for GO1, GO2 in combinations(GO_list, 2):
-                idx1, idx2 = (self.node_id_2_mat_idx[GO1], self.node_id_2_mat_idx[GO2])
-                self.indep_lapl[idx1, idx2] += -1
-                self.indep_lapl[idx2, idx1] += -1
-                self.indep_lapl[idx2, idx2] += 1
-                self.indep_lapl[idx1, idx1] += 1
+        go_count = len(self.all_nodes_neo4j_ids)
+
+        up_indexes, go_indexes = [], []
+        for up_index, GO_list in enumerate(self._limiter_up_2_go_reachable_nodes.values()):
+            up_indexes += [up_index] * len(GO_list)
+            go_indexes += [self.node_id_2_mat_idx[GO] for GO in GO_list]
+
+        incidence = csc_matrix((np.ones(len(up_indexes)), (up_indexes, go_indexes)),
+                               shape=(len(self._limiter_up_2_go_reachable_nodes), go_count))
+        incidence.data[:] = 1
+        incidence_t = incidence.transpose().tocsr()
+
+        rows, cols, values = [np.array([], dtype=int)], [np.array([], dtype=int)], [np.array([])]
+
+        for block_start in range(0, go_count, block_size):
+            co_occurrence = incidence_t.dot(
+                incidence[:, block_start:block_start + block_size]).tocoo()
+            block_cols = co_occurrence.col + block_start
+            off_diagonal = co_occurrence.row != block_cols
+            block_rows, block_cols, block_values = co_occurrence.row[off_diagonal], \
+                block_cols[off_diagonal], co_occurrence.data[off_diagonal]
+
+            if top_k is not None:
+                # ranks of the co-occurrences within each term, largest first
+                order = np.lexsort((-block_values, block_cols))
+                block_rows, block_cols, block_values = block_rows[order], block_cols[order], \
+                    block_values[order]
+                term_starts = np.searchsorted(block_cols, block_cols, side='left')
+                kept = np.arange(block_cols.shape[0]) - term_starts < top_k
+                block_rows, block_cols, block_values = block_rows[kept], block_cols[kept], \
+                    block_values[kept]
+
+            rows.append(block_rows)
+            cols.append(block_cols)
+            values.append(block_values)
+
+        co_occurrence = csc_matrix((np.concatenate(values),
+                                    (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(go_count, go_count))
+
+        if top_k is not None:
+            co_occurrence = co_occurrence.maximum(co_occurrence.transpose()).tocsc()
+
+        self.indep_lapl = (diags(np.asarray(co_occurrence.sum(axis=1)).ravel(), 0, format='csc')
+                           - co_occurrence).tocsc()
 
 
 if __name__ == '__main__':
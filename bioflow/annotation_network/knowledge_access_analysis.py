@@ -1,7 +1,6 @@
 """
 Set of methods responsible for knowledge analysis
 """
-import pickle
 from multiprocessing import Pool
 import traceback
 import psutil
@@ -15,13 +14,16 @@ from typing import Any, Union, TypeVar, NewType, Tuple, List
 
 from bioflow.annotation_network.BioKnowledgeInterface import GeneOntologyInterface
 from bioflow.configs.main_configs import estimated_comp_ops, NewOutputs, sparse_analysis_threshold, \
-    implicitely_threaded, default_p_val_cutoff, min_nodes_for_p_val, default_background_samples
-from bioflow.sample_storage.mongodb import find_annotome_rand_samp, count_annotome_rand_samp
-from bioflow.utils.dataviz import kde_compute
+    implicitely_threaded, default_p_val_cutoff, min_nodes_for_p_val, default_background_samples, \
+    null_model_chunk_size, adaptive_background_sampling, adaptive_sampling_round, \
+    adaptive_sampling_confidence
+from bioflow.sample_storage.sample_store import find_annotome_rand_samp, count_annotome_rand_samp
+from bioflow.sample_storage.sample_schema import decode_voltages, node_current_chunks, \
+    node_currents_fields, voltages_fields
 from bioflow.utils.io_routines import get_source_bulbs_ids
 from bioflow.utils.log_behavior import get_logger
-from bioflow.algorithms_bank.flow_significance_evaluation import get_neighboring_degrees, \
-    get_p_val_by_gumbel
+from bioflow.algorithms_bank.flow_significance_evaluation import \
+    GumbelSignificanceEngine, NullModelAccumulator, p_values_settled
 from bioflow.algorithms_bank.clustering_routines import compute_tension_clustering
 import bioflow.algorithms_bank.sampling_policies as sampling_policies
 
@@ -87,6 +89,47 @@ def _spawn_sampler(args_puck):
     )
 
 
+def _map_samplers(pool, payload_list):
+    """
+    Maps the samplers to the processes of a pool, re-raising their errors with the original
+    traceback
+
+    :param pool: pool of processes
+    :param payload_list: argument pucks of the samplers, one per process
+    """
+    try:
+        pool.map(_spawn_sampler, payload_list)
+    except Exception as e:
+        msg = "{}\n\nOriginal {}".format(e, traceback.format_exc())
+        raise type(e)(msg)
+
+
+# attributes set by compute_current_and_potentials, sent back from the pool process
+_real_sample_flow_attributes = ('current_accumulator', 'UP2UP_voltages', 'uniprots_2_voltage',
+                                'node_current')
+
+
+def _real_sample_flow(args_puck):
+    """
+    Computes and memoizes the currents for the real hits list, in a process of the sampler pool
+    when there is one, so that nothing is factorized in the process that keeps the pool
+
+    :param args_puck: GO interface with loaded real hits list, sparse rounds
+    :return: [[current, informativity, confusion potential], ...].T for the GO terms;
+        {attribute: value} of the computed flow, to be set on the GO interface of the parent
+        process
+    """
+    go_interface_instance, sparse_rounds = args_puck
+
+    # processes of a pool can't have children of their own
+    go_interface_instance.compute_current_and_potentials(sparse_rounds=sparse_rounds,
+                                                         processes=1)
+    _, query_array, _ = _query_node_properties(go_interface_instance)
+
+    return query_array, dict((attribute, getattr(go_interface_instance, attribute))
+                             for attribute in _real_sample_flow_attributes)
+
+
 def _spawn_sampler_pool(
         pool_size,
         sample_sets_to_match,
@@ -95,7 +138,8 @@ def _spawn_sampler_pool(
         background_set,
         forced_go_interface,
         sampling_policy,
-        sampling_options):
+        sampling_options,
+        pool=None):
     """
     Spawns a pool of samplers of the information flow within the GO system
 
@@ -108,6 +152,8 @@ def _spawn_sampler_pool(
     :param forced_go_interface: a provided BioKnowledgeInterface that contains sets to imitate
     :param sampling_policy: sampling policy to be employed
     :param sampling_options: options to the sampling policy
+    :param pool: if provided, running pool of pool_size processes the samplers are mapped to,
+        instead of spawning a new one
     """
     global implicitely_threaded
 
@@ -131,16 +177,16 @@ def _spawn_sampler_pool(
     payload_list = [list(item)+[i] for i, item in enumerate(payload_list)]  # prepare the payload
 
     # log.info('Spawning sampler for %s %s' % (payload[0][0], payload[0][1]))
-    if not implicitely_threaded:
+    if not implicitely_threaded and pool is not None:
+        log.debug('mapping the sampler to the running pool with payload %s', payload)
+        _map_samplers(pool, payload_list)
+
+    elif not implicitely_threaded:
         with Pool(processes=pool_size) as pool:  # This is the object we are using to spawn a thread pool
-            try:
-                log.debug('spawning the sampler with payload %s', payload)
-                pool.map(_spawn_sampler, payload_list)  # This what we spawn as a sampler
-                # KNOWNBUG: hangs with no message upon a second start attempt in Interactome
-                #  analysis due to cholmod
-            except Exception as e:
-                msg = "{}\n\nOriginal {}".format(e, traceback.format_exc())
-                raise type(e)(msg)
+            log.debug('spawning the sampler with payload %s', payload)
+            _map_samplers(pool, payload_list)  # This what we spawn as a sampler
+            # KNOWNBUG: hangs with no message upon a second start attempt in Interactome
+            #  analysis due to cholmod
             # log.info('Last in-pool flag exiting')
             pool.terminate()  # potential solution to the issue
 
@@ -153,7 +199,8 @@ def _spawn_sampler_pool(
 
 
 def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array,
-                             save_path: str = None, p_values: np.array = None):
+                             save_path: str = None, p_values: np.array = None,
+                             background_histogram: Tuple[np.ndarray, np.ndarray] = None):
     """
     A general function that performs demonstration of an example of random samples of
      the same size as our sample and of our sample and conducts the statistical tests
@@ -165,6 +212,8 @@ def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array
     characteristics of the true sample. If none, nothing happens
     :param save_path: where the thing will be saved
     :param p_values: p-value map that will be used to save things after the analysis
+    :param background_histogram: (counts, bin edges) of the background currents, if they were
+        aggregated beforehand. In that case background_curr_deg_conf can be a subsample
     :return: None
     """
 
@@ -176,19 +225,24 @@ def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array
     plt.subplot(211)
     plt.title('current through nodes')
 
-    bins = np.linspace(
-        background_curr_deg_conf[0, :].min(),
-        background_curr_deg_conf[0, :].max(), 100)
+    if background_histogram is not None:
+        counts, bins = background_histogram
+        plt.hist(bins[:-1], bins=bins, weights=counts, histtype='step', log=True, color='b')
 
-    if true_sample_bi_corr_array is not None:
-        bins = np.linspace(min(background_curr_deg_conf[0, :].min(),
-                               true_sample_bi_corr_array[0, :].min()),
-                           max(background_curr_deg_conf[0, :].max(),
-                               true_sample_bi_corr_array[0, :].max()),
-                           100)
+    else:
+        bins = np.linspace(
+            background_curr_deg_conf[0, :].min(),
+            background_curr_deg_conf[0, :].max(), 100)
 
-    plt.hist(background_curr_deg_conf[0, :],
-             bins=bins, histtype='step', log=True, color='b')
+        if true_sample_bi_corr_array is not None:
+            bins = np.linspace(min(background_curr_deg_conf[0, :].min(),
+                                   true_sample_bi_corr_array[0, :].min()),
+                               max(background_curr_deg_conf[0, :].max(),
+                                   true_sample_bi_corr_array[0, :].max()),
+                               100)
+
+        plt.hist(background_curr_deg_conf[0, :],
+                 bins=bins, histtype='step', log=True, color='b')
 
     if true_sample_bi_corr_array is not None:
         plt.hist(true_sample_bi_corr_array[0, :],
@@ -280,11 +334,12 @@ def clustering_analysis_complement(go_interface_instance: GeneOntologyInterface,
                                           'active_sample_hash': active_sample_hash,
                                           'sys_hash': md5_hash,
                                           'sampling_policy': random_sampling_method.__name__,
-                                          'sampling_policy_options': random_sampling_option})
+                                          'sampling_policy_options': random_sampling_option},
+                                          projection=voltages_fields)
 
     for i, sample in enumerate(background_samples):
 
-        voltages = pickle.loads(sample['voltages'])
+        voltages = decode_voltages(sample, go_interface_instance.inflated_idx2lbl)
 
         _, min_clust_inf_flow, clust_size = compute_tension_clustering(voltages, random_sample=True)
 
@@ -304,20 +359,8 @@ def clustering_analysis_complement(go_interface_instance: GeneOntologyInterface,
 
     query_array = np.vstack([min_clust_inf_flow, clust_size])
 
-    clust_sizes = np.unique(clust_size)
-
-    combined_p_vals = np.ones_like(min_clust_inf_flow)
-
-    for cluster_size in clust_sizes.tolist():
-        _filter = clust_size == cluster_size
-        entry = min_clust_inf_flow[_filter]
-
-        min_clust_inf_flow_per_run = get_neighboring_degrees(cluster_size,
-                                                             max_array,
-                                                             min_nodes=min_nodes_for_p_val)
-
-        p_vals = get_p_val_by_gumbel(entry, min_clust_inf_flow_per_run)
-        combined_p_vals[_filter] = p_vals
+    significance_engine = GumbelSignificanceEngine(max_array, min_nodes=min_nodes_for_p_val)
+    combined_p_vals = significance_engine.p_values(min_clust_inf_flow, clust_size)
 
     samples_scatter_and_hist(background_array, query_array,
                              save_path=output_destination.knowledge_clusters_scatterplot,
@@ -352,52 +395,52 @@ def clustering_analysis_complement(go_interface_instance: GeneOntologyInterface,
     return cluster_entries
 
 
-def compare_to_blank(
-        go_interface_instance: GeneOntologyInterface,
-        p_value_cutoff: float = 0.05,
-        sparse_rounds: int = -1,
-        output_destination: NewOutputs = None,
-        random_sampling_method=sampling_policies.matched_sampling,
-        random_sampling_option='exact',
-        ) -> Tuple[list, dict]:
+def _query_node_properties(go_interface_instance: GeneOntologyInterface) -> \
+        Tuple[np.ndarray, np.ndarray, dict]:
     """
-    Recovers the statistics on the circulation nodes and shows the visual of a circulation system
+    Formats the currents through the GO terms computed for the real hits list
 
-    :param go_interface_instance:
-    :param p_value_cutoff: desired p_value for the returned terms
-    :param sparse_rounds: if set to a number, sparse computation technique would be used with
-        the number of rounds equal to the number
-    :param output_destination: configs object from main_configs, specifying where the results
-        will be saved
-    :param random_sampling_method: sampling policy used
-    :param random_sampling_option: sampling policy optional argument
-    :return: None if no significant nodes, the node and group characteristic dictionaries
-     otherwise
+    :param go_interface_instance: GO interface with computed currents
+    :return: GO term ids, [[current, informativity, confusion potential], ...].T,
+        {GO term id: [current, informativity, confusion potential]}
     """
+    node_currents = go_interface_instance.node_current
+    dict_system = go_interface_instance.format_node_props(node_currents)
 
-    def get_max_for_each_degree(sample_sub_arrray):
-        # this will work only if we are using confusion potential (which is the # of
-        #  nodes a term annotates)
-        # print('debug max_array_shape:', str(sample_sub_arrray.shape))
-        degrees = np.unique(sample_sub_arrray[2, :])
-        max_array = []
+    curr_inf_conf_tot = np.array([[int(key)] + list(val) for key, val in list(dict_system.items())]).T
 
-        for degree in degrees:
-            filter = sample_sub_arrray[2, :] == degree
-            max_array.append([sample_sub_arrray[0, filter].max(), degree])
+    go_node_ids, query_array = (curr_inf_conf_tot[0, :], curr_inf_conf_tot[(1, 2, 3), :])
 
-        m_arr = np.array(max_array)
-        return m_arr.T
+    return go_node_ids, query_array, dict_system
 
-    if go_interface_instance is None or go_interface_instance.node_current == {}:
-        raise Exception("tried to compare to blanc an empty interface instance")
 
+def _background_null_model(go_interface_instance: GeneOntologyInterface,
+                           sparse_rounds: int,
+                           random_sampling_method,
+                           random_sampling_option) -> NullModelAccumulator:
+    """
+    Aggregates the GO term currents of the random samples stored for the active sample of the
+    interface into a null model
+
+    :param go_interface_instance: GO interface with loaded real hits list
+    :param sparse_rounds: sparse rounds used for the sampling
+    :param random_sampling_method: sampling policy used
+    :param random_sampling_option: sampling policy optional argument
+    :return: null model
+    """
     md5_hash = go_interface_instance.md5_hash()
     active_sample_hash = go_interface_instance.active_sample_md5_hash(sparse_rounds)
 
-    background_sub_array_list = []
-    max_sub_array_list = []
-    count = 0
+    # this will work only if we are using confusion potential (which is the # of
+    #  nodes a term annotates)
+    go_terms = list(go_interface_instance.node_id_2_mat_idx.keys())
+    null_model = NullModelAccumulator(
+        max_keys=[len(go_interface_instance._limiter_go_2_up_reachable_nodes[go_term])
+                  for go_term in go_terms],
+        window_keys=[go_interface_instance.GO2_Pure_Inf[go_term] for go_term in go_terms],
+        node_indexes=np.array([go_interface_instance.node_id_2_mat_idx[go_term]
+                               for go_term in go_terms]),
+        limit=0.01)
 
     log.info("looking to test against:"
              "\t target_hash: %s \t sys_hash: %s \n"
@@ -421,89 +464,74 @@ def compare_to_blank(
                                           'active_sample_hash': active_sample_hash,
                                           'sys_hash': md5_hash,
                                           'sampling_policy': random_sampling_method.__name__,
-                                          'sampling_policy_options': random_sampling_option})
+                                          'sampling_policy_options': random_sampling_option},
+                                          projection=node_currents_fields)
 
-    for i, sample in enumerate(background_sample):
+    for currents_chunk in node_current_chunks(background_sample,
+                                              go_interface_instance.inflated_lbl2idx,
+                                              len(go_interface_instance.inflated_idx2lbl),
+                                              null_model_chunk_size):
+        null_model.add_samples(currents_chunk)
 
-        _, node_currents = pickle.loads(sample['currents'])
+    if null_model.runs == 0:
+        raise Exception('None of the random samples found had any current through nodes')
 
-        dict_system = go_interface_instance.format_node_props(node_currents)
-        background_sub_array = list(dict_system.values())
+    return null_model
 
-        if np.array(background_sub_array).T.shape[0] < 2:
-            log.info(background_sub_array)
-            continue
 
-        background_sub_array_list.append(np.array(background_sub_array).T)
-
-        max_arr = get_max_for_each_degree(np.array(background_sub_array).T)
-        max_sub_array_list.append(max_arr)
+def compare_to_blank(
+        go_interface_instance: GeneOntologyInterface,
+        p_value_cutoff: float = 0.05,
+        sparse_rounds: int = -1,
+        output_destination: NewOutputs = None,
+        random_sampling_method=sampling_policies.matched_sampling,
+        random_sampling_option='exact',
+        ) -> Tuple[list, dict]:
+    """
+    Recovers the statistics on the circulation nodes and shows the visual of a circulation system
 
-        count = i
+    :param go_interface_instance:
+    :param p_value_cutoff: desired p_value for the returned terms
+    :param sparse_rounds: if set to a number, sparse computation technique would be used with
+        the number of rounds equal to the number
+    :param output_destination: configs object from main_configs, specifying where the results
+        will be saved
+    :param random_sampling_method: sampling policy used
+    :param random_sampling_option: sampling policy optional argument
+    :return: None if no significant nodes, the node and group characteristic dictionaries
+     otherwise
+    """
 
-        if dict_system == {}:  # ?????
-            del background_sub_array_list[-1]
-            del max_sub_array_list[-1]
-            log.critical("exceptional state: nothing in dict_system. Attempting to ignore")
+    if go_interface_instance is None or go_interface_instance.node_current == {}:
+        raise Exception("tried to compare to blanc an empty interface instance")
 
-    # This part declares the pre-operators required for the verification of a
-    # real sample
+    null_model = _background_null_model(go_interface_instance, sparse_rounds,
+                                        random_sampling_method, random_sampling_option)
 
-    background_array = np.concatenate(tuple(background_sub_array_list), axis=1)
-    max_array = np.concatenate(tuple(max_sub_array_list), axis=1)
+    max_array = null_model.max_array()
 
     # final = np.concatenate(tuple(background_sub_array_list), axis=1)
     # final_mean_correlations = np.concatenate(tuple(mean_correlation_accumulator), axis=0).T
     # final_eigenvalues = np.concatenate(tuple(eigenvalues_accumulator), axis=0).T
 
-    node_currents = go_interface_instance.node_current
-    dict_system = go_interface_instance.format_node_props(node_currents)
+    go_node_ids, query_array, dict_system = _query_node_properties(go_interface_instance)
 
-    curr_inf_conf_tot = np.array([[int(key)] + list(val) for key, val in list(dict_system.items())]).T
-
-    go_node_ids, query_array = (curr_inf_conf_tot[0, :], curr_inf_conf_tot[(1, 2, 3), :])
-
-    log.info("stats on  %s samples" % count)
+    log.info("stats on  %s samples" % null_model.runs)
     # new p-values computation
-    background_density = kde_compute(background_array[(1, 0), :], 50, count)
-    base_bi_corr = background_array[(0, 1), :]
-
-    r_rels = []
-    r_std_nodes = []
 
-    degrees = np.unique(query_array[2, :])
+    significance_engine = GumbelSignificanceEngine(max_array, min_nodes=min_nodes_for_p_val)
+    combined_p_vals = significance_engine.p_values(query_array[0, :], query_array[2, :])
 
-    combined_p_vals = np.ones_like(query_array[2, :])
-
-    for degree in degrees.tolist():
-        _filter = query_array[2, :] == degree
-
-        entry = query_array[0, _filter]
-        background_set = background_array[:, background_array[2, :] == degree]
-
-        # REFACTOR: [maintenability] this part is too coupled. we should factor it out
-        max_current_per_run = get_neighboring_degrees(degree,
-                                                      max_array,
-                                                      min_nodes=min_nodes_for_p_val)
-
-        p_vals = get_p_val_by_gumbel(entry, max_current_per_run)
-        combined_p_vals[_filter] = p_vals
-
-    samples_scatter_and_hist(background_array, query_array,
+    samples_scatter_and_hist(null_model.scatter(), query_array,
                              save_path=output_destination.knowledge_network_scatterplot,
-                             p_values=combined_p_vals)
+                             p_values=combined_p_vals,
+                             background_histogram=null_model.histogram(query_array[0, :].max()))
 
-    r_nodes = background_density(query_array[(1, 0), :])  # legacy - unused now
     r_nodes = combined_p_vals
 
-    for point in query_array.T:
-        selector = np.logical_and(base_bi_corr[1, :] > point[1]*0.9, base_bi_corr[1, :] < point[1]*1.1)
-        r_rels.append(point[0] / np.mean(base_bi_corr[0, selector]))
-        r_std_nodes.append((point[0] - np.mean(base_bi_corr[0, selector])) / np.std(base_bi_corr[0,
-                                                                                              selector]))
-
-    r_rels = np.array(r_rels)
-    r_std_nodes = np.array(r_std_nodes)
+    background_means, background_stds = null_model.windowed_mean_std(query_array[1, :])
+    r_rels = query_array[0, :] / background_means
+    r_std_nodes = (query_array[0, :] - background_means) / background_stds
 
     not_random_nodes = [node_id for node_id in go_node_ids[r_nodes < p_value_cutoff].tolist()]
 
@@ -531,6 +559,93 @@ def compare_to_blank(
     return sorted(node_char_list, key=lambda x: x[5]), nodes_dict
 
 
+def _adaptive_sampler_pool(
+        go_interface_instance: GeneOntologyInterface,
+        pool_size,
+        sample_sets_to_match,
+        max_sample_depth,
+        sparse_rounds,
+        background_set,
+        forced_go_interface,
+        sampling_policy,
+        sampling_options,
+        p_value_cutoff):
+    """
+    Draws random samples in rounds, refitting the null model after each round, until the
+    p-values of the GO terms near the cutoff are stable or the max depth is reached
+
+    :param go_interface_instance: GO interface with loaded real hits list. Its currents are
+        computed in the sampler pool, not in this process, which forks the samplers, and are set
+        on it once the sampling is over
+    :param pool_size: number of processes that are performing the sample pooling and analyzing
+    :param sample_sets_to_match: size of the sample list
+    :param max_sample_depth: max number of new random samples to generate
+    :param sparse_rounds: number of sparse rounds to run (or False if sampling is dense)
+    :param background_set: set of node ids that are to be sampled from
+    :param forced_go_interface: a provided BioKnowledgeInterface that contains sets to imitate
+    :param sampling_policy: sampling policy to be employed
+    :param sampling_options: options to the sampling policy
+    :param p_value_cutoff: cutoff p-value for the significance of the GO terms
+    :return: number of new random samples generated
+    """
+    global implicitely_threaded
+
+    previous_p_values = None
+    sample_depth = 0
+
+    # a single pool is kept for all the rounds and forked before anything is factorized in this
+    # process: re-spawning pools after a cholmod factorization hangs the samplers
+    pool = None if implicitely_threaded else Pool(processes=pool_size)
+
+    try:
+        real_sample_args = (go_interface_instance, sparse_rounds)
+
+        if pool is None:
+            query_array, real_sample_flow = _real_sample_flow(real_sample_args)
+        else:
+            query_array, real_sample_flow = pool.apply(_real_sample_flow, (real_sample_args,))
+
+        while sample_depth < max_sample_depth:
+            round_depth = min(adaptive_sampling_round, max_sample_depth - sample_depth)
+
+            _spawn_sampler_pool(pool_size,
+                                sample_sets_to_match,
+                                round_depth,
+                                sparse_rounds=sparse_rounds,
+                                background_set=background_set,
+                                forced_go_interface=forced_go_interface,
+                                sampling_policy=sampling_policy,
+                                sampling_options=sampling_options,
+                                pool=pool)
+            sample_depth += round_depth
+
+            null_model = _background_null_model(go_interface_instance, sparse_rounds,
+                                                sampling_policy, sampling_options)
+            # fits of the intermediate null models are not worth saving to disk
+            p_values = GumbelSignificanceEngine(null_model.max_array(),
+                                                min_nodes=min_nodes_for_p_val,
+                                                persistent=False).p_values(
+                query_array[0, :], query_array[2, :])
+
+            if p_values_settled(p_values, previous_p_values, null_model.runs, p_value_cutoff,
+                                adaptive_sampling_confidence):
+                log.info('p-values settled after %d new random samples, out of at most %d'
+                         % (sample_depth, max_sample_depth))
+                break
+
+            previous_p_values = p_values
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    # set once the sampling is over, since samplers sharing the interface overwrite its currents
+    for attribute, value in real_sample_flow.items():
+        setattr(go_interface_instance, attribute, value)
+
+    return sample_depth
+
+
 def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                  secondary_source_list: List[Union[List[int], List[Tuple[int, float]], None]] = None,
                  output_destinations_list: Union[List[str], None] = None,
@@ -543,6 +658,7 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                  sampling_policy=sampling_policies.matched_sampling,
                  sampling_policy_options='exact',
                  explicit_interface=None,
+                 adaptive_sampling: bool = adaptive_background_sampling,
                  ) -> None:
     """
     Automatically analyzes the GO annotation of the experimental hit lists
@@ -563,6 +679,9 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
     :param sampling_policy_options: sampling policy optional argument
     :param explicit_interface: an explicit BioKnowledgeInterface instance in case any of the deep
         defaults (eg flow calculation function) are modified
+    :param adaptive_sampling: if set to true, random samples are drawn in rounds until the
+        p-values of the GO terms near the cutoff are stable, with random_samples_to_test_against
+        as the max depth
     :return:
     """
     # Multiple re-spawns of threaded processing are incompatible with scikits.sparse.cholmod
@@ -651,7 +770,21 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                      (in_storage, random_samples_to_test_against, random_samples_to_test_against - in_storage))
             random_samples_to_test_against = random_samples_to_test_against - in_storage
 
-        if not local_skip_sampling:
+        local_adaptive_sampling = adaptive_sampling and not local_skip_sampling
+
+        if local_adaptive_sampling:
+            _adaptive_sampler_pool(go_interface,
+                                   processors,
+                                   (hits_list, sec_list),
+                                   random_samples_to_test_against,
+                                   sparse_rounds=sparse_rounds,
+                                   background_set=background_list,
+                                   forced_go_interface=explicit_interface,
+                                   sampling_policy=sampling_policy,
+                                   sampling_options=sampling_policy_options,
+                                   p_value_cutoff=p_value_cutoff)
+
+        elif not local_skip_sampling:
             _spawn_sampler_pool(processors,
                                 (hits_list, sec_list),
                                 random_samples_to_test_against,
@@ -661,7 +794,9 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                                 sampling_policy=sampling_policy,
                                 sampling_options=sampling_policy_options)
 
-        go_interface.compute_current_and_potentials(sparse_rounds=sparse_rounds)
+        # in adaptive mode, the currents were computed in the sampler pool and set on the interface
+        if not local_adaptive_sampling:
+            go_interface.compute_current_and_potentials(sparse_rounds=sparse_rounds)
 
         nr_nodes, p_val_dict = compare_to_blank(
             go_interface,
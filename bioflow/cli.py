@@ -212,7 +212,8 @@ def rebuildlaplacians(smtplog):
 @click.option('--collection', type=click.Choice(['all', 'interactome', 'annotome']), default='all')
 def purgemongo(collection):
     """
-    purges the mongodb collection currently used to store all the information.
+    purges the sample storage collection (MongoDB or local, as configured) currently used to
+    store all the information.
     \f
 
     :param collection:
@@ -220,8 +221,8 @@ def purgemongo(collection):
     """
     click.confirm('Are you sure you want to purge the database of existing samples?', abort=True)
 
-    from bioflow.sample_storage.mongodb import drop_all_interactome_rand_samp
-    from bioflow.sample_storage.mongodb import drop_all_annotome_rand_samp
+    from bioflow.sample_storage.sample_store import drop_all_interactome_rand_samp
+    from bioflow.sample_storage.sample_store import drop_all_annotome_rand_samp
 
     if collection == 'all':
         drop_all_annotome_rand_samp()
@@ -52,6 +52,8 @@ with open(user_yaml_confs, 'r', encoding='utf8') as user_yaml_configs:
 
 # SERVERS CONFIGURATIONS
 mongo_db_url = os.getenv('MONGOURL', Servers['mongodb_server'])
+sample_storage_backend = os.getenv('SAMPLESTORAGE', Servers.get('sample_storage', 'mongodb'))
+sample_storage_location = os.path.join(internal_storage, 'samples')
 neo4j_server_url = os.getenv('NEO4URL', Servers['neo4j_server'])
 neo4j_user = 'neo4j'
 neo4j_user = os.getenv('NEO4USER', Servers['neo4j_user'])
@@ -122,6 +124,11 @@ class Dumps(object):
     InfoArray = os.path.join(prefix, 'sample_array.dump')
     Interactome_Analysis_memoized = os.path.join(prefix, 'Interactome_memoization.dump')
 
+    # versioned binary layouts (directories of memory-mappable .npy arrays)
+    interactome_binary_matrices = os.path.join(prefix, 'interactome_matrices')
+    interactome_binary_maps = os.path.join(prefix, 'interactome_maps')
+    interactome_binary_eigen = os.path.join(prefix, 'interactome_eigen')
+
     Up_dict_dump = os.path.join(prefix, 'Uniprot_dict.dump')
     GO_dump = os.path.join(prefix, 'GO.dump')
     GO_builder_stat = os.path.join(prefix, 'GO_builder_stats.dump')
@@ -138,6 +145,11 @@ class Dumps(object):
 
     RNA_seq_counts_compare = os.path.join(prefix, 'RNA_seq_compare.dump')
 
+    # fill-reducing orderings of the laplacian factorizations, one .npy per system
+    factor_cache = os.path.join(prefix, 'factor_cache')
+    # gumbel parameters fitted on the random samples maxima, one .npy per null model
+    gumbel_fit_cache = os.path.join(prefix, 'gumbel_fit_cache')
+
     # those are temporary storage of cast sets of IDs and backgrounds
     analysis_set_display_names = prefix + '/current_analysis_set_name_maps.txt'
     analysis_set_bulbs_ids = prefix + '/current_analysis_set_bulbs_id_list.csv'
@@ -245,6 +257,32 @@ share_solver = bool(user_settings['solver']['share_solver'])
 # switching this to False incurs approximately a 50-fold slowdown
 line_loss = float(user_settings['solver']['line_loss'])
 # This is the line loss for the approximate matrix inversion - basically the fudge for cholesky
+flow_batch_size = int(user_settings['solver'].get('flow_batch_size', 64))
+# number of node pairs solved for at once with the shared solver. 1 disables batching
+flow_mode = str(user_settings['solver'].get('flow_mode', 'pairwise'))
+# 'superposition' solves once per distinct sample node and gets pair potentials by subtraction
+max_cached_potentials = int(user_settings['solver'].get('max_cached_potentials', 512))
+# upper bound on the number of single-node potential vectors kept in memory at once
+potential_cache_bytes = int(user_settings['solver'].get('potential_cache_bytes', 268435456))
+# memory bound, in bytes, of the single-node potentials reused across samples in a process
+cross_sample_potentials = bool(user_settings['solver'].get('cross_sample_potentials', False))
+# if random samples share single-node potentials, at the cost of using the superposition engine
+reach_factor_cache_bytes = int(user_settings['solver'].get('reach_factor_cache_bytes', 268435456))
+# memory bound, in bytes, of the reach-limited annotome factorizations reused across pairs
+flow_processes = int(user_settings['solver'].get('flow_processes', 1))
+# number of worker processes among which pairs of a single flow computation are split
+flow_chunks_per_process = int(user_settings['solver'].get('flow_chunks_per_process', 4))
+# number of pair chunks handed out per worker process
+factor_cache_size = int(user_settings['solver'].get('factor_cache_size', 2))
+# number of laplacian factorizations kept in memory for reuse across samples. 0 disables it
+factor_cache_on_disk = bool(user_settings['solver'].get('factor_cache_on_disk', True))
+# if the factorization orderings are saved on disk for reuse by fresh processes
+binary_dumps = bool(user_settings['solver'].get('binary_dumps', True))
+# if the interactome is dumped as memory-mappable arrays rather than pickles
+low_rank_reweight = bool(user_settings['solver'].get('low_rank_reweight', True))
+# if reweighted laplacians re-use the base factorization through a low-rank correction
+low_rank_max_nodes = int(user_settings['solver'].get('low_rank_max_nodes', 64))
+# max number of reweighted nodes for which the low-rank correction is used over refactorization
 
 implicitely_threaded = bool(user_settings['debug_flags']['implicitely_threaded'])
 psutil_main_loop_memory_tracing = bool(user_settings['debug_flags']['psutil_main_loop_memory_tracing'])
@@ -259,6 +297,14 @@ sparse_analysis_threshold = int(user_settings['analysis']['sparse_analysis_thres
 default_background_samples = int(user_settings['analysis']['default_background_samples'])
 default_p_val_cutoff = float(user_settings['analysis']['default_p_val_cutoff'])
 min_nodes_for_p_val = int(user_settings['analysis']['min_nodes_for_p_val'])
+store_sample_current_matrices = bool(user_settings['analysis'].get('store_sample_current_matrices',
+                                                                  False))
+null_model_chunk_size = int(user_settings['analysis'].get('null_model_chunk_size', 64))
+adaptive_background_sampling = bool(user_settings['analysis'].get('adaptive_background_sampling',
+                                                                 False))
+adaptive_sampling_round = int(user_settings['analysis'].get('adaptive_sampling_round', 100))
+adaptive_sampling_confidence = float(user_settings['analysis'].get('adaptive_sampling_confidence',
+                                                                   1.96))
 
 neo4j_autobatch_threshold = int(configs_loaded['Servers'].get('neo4j_autobatch_threshold', 5000))
 
@@ -26,13 +26,16 @@ import traceback
 
 import bioflow.configs.main_configs as confs
 from bioflow.utils.gdfExportInterface import GdfExportInterface
-from bioflow.utils.io_routines import write_to_csv, dump_object, undump_object
+from bioflow.utils.io_routines import write_to_csv, dump_object, undump_object, dump_arrays, \
+    undump_arrays, sparse_matrix_to_arrays, arrays_to_sparse_matrix
 from bioflow.utils.log_behavior import get_logger
 
-from bioflow.sample_storage.mongodb import insert_interactome_rand_samp
+from bioflow.sample_storage.sample_store import insert_interactome_rand_samp
+from bioflow.sample_storage.sample_schema import encode_rand_sample
 from bioflow.configs.main_configs import internal_storage
 from bioflow.algorithms_bank import conduction_routines as cr
 from bioflow.algorithms_bank import weigting_policies as wp
+from bioflow.molecular_network.node_table import NodeTable
 from bioflow.neo4j_db.GraphDeclarator import DatabaseGraph
 from bioflow.algorithms_bank import sampling_policies
 from bioflow.algorithms_bank.flow_calculation_methods import general_flow,\
@@ -59,6 +62,7 @@ class InteractomeInterface(object):
         # This is just non-normalized laplacian matrix
         self.laplacian_matrix = np.zeros((4, 4))
         self.non_norm_laplacian_matrix = np.zeros((4, 4))
+        self._base_laplacian_matrix = None  # laplacian before apply_reweight_dict
 
         # REFACTOR: [structure analysis]: decouple into argument
         self.adj_eigenvects = np.zeros((4, 4))
@@ -66,13 +70,7 @@ class InteractomeInterface(object):
         self.cond_eigenvects = np.zeros((4, 4))
         self.cond_eigenvals = np.zeros((4, 4))
 
-        self.neo4j_id_2_matrix_index = {}
-        self.matrix_index_2_neo4j_id = {}
-        self.neo4j_id_2_display_name = {}
-        self.neo4j_id_2_legacy_id = {}
-        self.neo4j_id_2_node_type = {}
-        self.neo4j_id_2_localization = {}
-        self.known_neo4j_ids = []
+        self.node_table = NodeTable.from_columns([], [], [], [], [])
 
         self.maps_dumps_location = confs.Dumps.interactome_maps
         self.adjacency_dumps_location = confs.Dumps.interactome_adjacency_matrix
@@ -96,6 +94,35 @@ class InteractomeInterface(object):
         self._background = background_up_ids
         log.debug('_background set to %d' % len(background_up_ids))
 
+    # read-only views of the node table, in place of the former neo4j id dicts
+    @property
+    def neo4j_id_2_matrix_index(self):
+        return self.node_table.id_2_index
+
+    @property
+    def matrix_index_2_neo4j_id(self):
+        return self.node_table.index_2_id
+
+    @property
+    def neo4j_id_2_display_name(self):
+        return self.node_table.column_views['display_name']
+
+    @property
+    def neo4j_id_2_legacy_id(self):
+        return self.node_table.column_views['legacy_id']
+
+    @property
+    def neo4j_id_2_node_type(self):
+        return self.node_table.column_views['node_type']
+
+    @property
+    def neo4j_id_2_localization(self):
+        return self.node_table.column_views['localization']
+
+    @property
+    def known_neo4j_ids(self):
+        return self.node_table.id_2_index.keys()
+
     def pretty_time(self):
         """
         Times the execution
@@ -132,16 +159,42 @@ class InteractomeInterface(object):
         """
         dumps self.adjacency_matrix and self.laplacian_matrix
         """
+        if confs.binary_dumps:
+            arrays = sparse_matrix_to_arrays('adjacency', self.adjacency_matrix)
+            arrays.update(sparse_matrix_to_arrays('laplacian', self.laplacian_matrix))
+            dump_arrays(confs.Dumps.interactome_binary_matrices, arrays)
+            return
+
         dump_object(confs.Dumps.interactome_adjacency_matrix, self.adjacency_matrix)
         dump_object(confs.Dumps.interactome_laplacian_matrix, self.laplacian_matrix)
 
     def _undump_matrices(self):
         """
         undumps self.adjacency_matrix and self.laplacian_matrix
+
+        Binary dumps are memory-mapped, copy-on-write for the matrices that can be modified
+        in place and read-only for the non-normalized laplacian, so that processes loading the
+        same interactome share the pages.
         """
-        self.adjacency_matrix = undump_object(confs.Dumps.interactome_adjacency_matrix)
-        self.laplacian_matrix = undump_object(confs.Dumps.interactome_laplacian_matrix)
-        self.non_norm_laplacian_matrix = self.laplacian_matrix.copy()
+        payload = None
+        if confs.binary_dumps:
+            payload = undump_arrays(confs.Dumps.interactome_binary_matrices, mmap_mode='c')
+
+        if payload is not None:
+            arrays, _ = payload
+            self.adjacency_matrix = arrays_to_sparse_matrix(arrays, 'adjacency')
+            self.laplacian_matrix = arrays_to_sparse_matrix(arrays, 'laplacian')
+            read_only_arrays, _ = undump_arrays(confs.Dumps.interactome_binary_matrices,
+                                                mmap_mode='r')
+            self.non_norm_laplacian_matrix = arrays_to_sparse_matrix(read_only_arrays,
+                                                                     'laplacian')
+
+        else:
+            self.adjacency_matrix = undump_object(confs.Dumps.interactome_adjacency_matrix)
+            self.laplacian_matrix = undump_object(confs.Dumps.interactome_laplacian_matrix)
+            self.non_norm_laplacian_matrix = self.laplacian_matrix.copy()
+
+        self._base_laplacian_matrix = None
         # log.info('undump happening here. %s ' % traceback.extract_stack().format())
 
     def _dump_eigen(self):
@@ -150,6 +203,15 @@ class InteractomeInterface(object):
         """
         write_to_csv(confs.Dumps.eigen_VaMat, self.adj_eigenvals)
         write_to_csv(confs.Dumps.eigen_ConMat, self.cond_eigenvals)
+
+        if confs.binary_dumps:
+            dump_arrays(confs.Dumps.interactome_binary_eigen,
+                        {'adj_eigenvals': self.adj_eigenvals,
+                         'adj_eigenvects': self.adj_eigenvects,
+                         'cond_eigenvals': self.cond_eigenvals,
+                         'cond_eigenvects': self.cond_eigenvects})
+            return
+
         dump_object(confs.Dumps.val_eigen, (self.adj_eigenvals, self.adj_eigenvects))
         dump_object(
             confs.Dumps.cond_eigen,
@@ -160,6 +222,18 @@ class InteractomeInterface(object):
         """
         undumps self.adj_eigenvals and self.laplacian_matrix
         """
+        payload = None
+        if confs.binary_dumps:
+            payload = undump_arrays(confs.Dumps.interactome_binary_eigen)
+
+        if payload is not None:
+            arrays, _ = payload
+            self.adj_eigenvals, self.adj_eigenvects = \
+                arrays['adj_eigenvals'], arrays['adj_eigenvects']
+            self.cond_eigenvals, self.cond_eigenvects = \
+                arrays['cond_eigenvals'], arrays['cond_eigenvects']
+            return
+
         self.adj_eigenvals, self.adj_eigenvects = undump_object(
             confs.Dumps.val_eigen)
         self.cond_eigenvals, self.cond_eigenvects = undump_object(
@@ -171,16 +245,21 @@ class InteractomeInterface(object):
          of database entries and matrix columns
         """
         log.debug("pre-dump e_p_u_b_i length: %s", len(self._active_up_sample))
+        if confs.binary_dumps:
+            log.debug("dumping into: %s", confs.Dumps.interactome_binary_maps)
+            self._dump_binary_maps()
+            return
+
         log.debug("dumping into: %s", confs.Dumps.interactome_maps)
         dump_object(
             confs.Dumps.interactome_maps,
-            (self.neo4j_id_2_matrix_index,
-             self.matrix_index_2_neo4j_id,
-             self.neo4j_id_2_display_name,
-             self.neo4j_id_2_legacy_id,
-             self.neo4j_id_2_node_type,
-             self.neo4j_id_2_localization,
-             self.known_neo4j_ids,
+            (dict(self.neo4j_id_2_matrix_index),
+             dict(self.matrix_index_2_neo4j_id),
+             dict(self.neo4j_id_2_display_name),
+             dict(self.neo4j_id_2_legacy_id),
+             dict(self.neo4j_id_2_node_type),
+             dict(self.neo4j_id_2_localization),
+             list(self.known_neo4j_ids),
              self._active_up_sample))
 
     def _undump_maps(self):
@@ -188,14 +267,51 @@ class InteractomeInterface(object):
         undumps all the elements required for the mapping between the types and ids of
         database entries and matrix columns
         """
+        if confs.binary_dumps and self._undump_binary_maps():
+            log.debug("post-undump e_p_u_b_i length: %s", len(self._active_up_sample))
+            return
+
         log.debug("undumping from %s", confs.Dumps.interactome_maps)
-        self.neo4j_id_2_matrix_index, self.matrix_index_2_neo4j_id, \
-        self.neo4j_id_2_display_name, self.neo4j_id_2_legacy_id, self.neo4j_id_2_node_type, \
-        self.neo4j_id_2_localization, \
-        self.known_neo4j_ids, self._active_up_sample = \
+        _, matrix_index_2_neo4j_id, neo4j_id_2_display_name, neo4j_id_2_legacy_id, \
+        neo4j_id_2_node_type, neo4j_id_2_localization, _, self._active_up_sample = \
             undump_object(confs.Dumps.interactome_maps)
+        self.node_table = NodeTable.from_dicts(matrix_index_2_neo4j_id,
+                                               neo4j_id_2_display_name,
+                                               neo4j_id_2_legacy_id,
+                                               neo4j_id_2_node_type,
+                                               neo4j_id_2_localization)
         log.debug("post-undump e_p_u_b_i length: %s", len(self._active_up_sample))
 
+    def _dump_binary_maps(self):
+        """
+        dumps the node table arrays along with the active sample
+        """
+        arrays = self.node_table.to_arrays()
+        arrays['active_up_sample'] = np.array(self._active_up_sample, dtype=np.int64)
+
+        dump_arrays(confs.Dumps.interactome_binary_maps, arrays,
+                    metadata={'layout': NodeTable.layout})
+
+    def _undump_binary_maps(self) -> bool:
+        """
+        undumps the maps dumped by _dump_binary_maps. The node table stays memory-mapped, so
+        that it is shared between the processes loading it.
+
+        :return: False if there is no binary dump of maps
+        """
+        payload = undump_arrays(confs.Dumps.interactome_binary_maps)
+
+        if payload is None or (payload[1] or {}).get('layout') != NodeTable.layout:
+            return False
+
+        log.debug("undumping from %s", confs.Dumps.interactome_binary_maps)
+        arrays, _ = payload
+
+        self._active_up_sample = arrays.pop('active_up_sample').tolist()
+        self.node_table = NodeTable(arrays)
+
+        return True
+
     def _dump_memoized(self):    # TODO: [fast resurrection] add weighted samples chars
         """
         In a JSON, stores a dump of the following properties:
@@ -259,39 +375,29 @@ class InteractomeInterface(object):
 
         :param node_dict: dictionary mapping node id to node objects
         :param edge_list: list of edges that exist in the database
-        :param adj_weight_policy_function: adjacency matrix weight policy function
-        :param lapl_weight_policy_function: laplacian matrix weight policy function
+        :param adj_weight_policy_function: adjacency matrix weight policy function, scalar or
+            array (see weigting_policies.get_array_policy)
+        :param lapl_weight_policy_function: laplacian matrix weight policy function, scalar or
+            array
         :return: node_id to matrix idx map, matrix_idx to node_id map, adjacency matrix,
         laplacian matrix
         """
         log.debug('new val matrix: %dx%d' % (len(node_dict), len(node_dict)))
-        adjacency_matrix = lil_matrix((len(node_dict), len(node_dict)), dtype=float)
-        laplacian_matrix = lil_matrix((len(node_dict), len(node_dict)), dtype=float)
 
         node_id_2_mat_idx = {_id: _i for _i, _id in enumerate(node_dict.keys())}
         mat_idx_2_note_id = {_i: _id for _id, _i in node_id_2_mat_idx.items()}
 
-        for rel_obj in edge_list:
-            # we need to use ids because the node objects stored by the node are property-free
-            from_id = rel_obj.start_node.id
-            to_id = rel_obj.end_node.id
-
-            from_node = node_dict[from_id]
-            to_node = node_dict[to_id]
-
-            lapl_weight = lapl_weight_policy_function(from_node, to_node, rel_obj)
-            adj_weight = adj_weight_policy_function(from_node, to_node, rel_obj)
-
-            from_idx = node_id_2_mat_idx[from_id]
-            to_idx = node_id_2_mat_idx[to_id]
+        # we need to use ids because the node objects stored by the node are property-free
+        edge_table = wp.build_edge_table(node_dict, edge_list, node_id_2_mat_idx)
 
-            adjacency_matrix[from_idx, to_idx] += adj_weight
-            adjacency_matrix[to_idx, from_idx] += adj_weight
+        from_idxs = edge_table['start_idx']
+        to_idxs = edge_table['end_idx']
+        lapl_weights = wp.get_array_policy(lapl_weight_policy_function)(edge_table)
+        adj_weights = wp.get_array_policy(adj_weight_policy_function)(edge_table)
 
-            laplacian_matrix[from_idx, to_idx] -= lapl_weight
-            laplacian_matrix[to_idx, from_idx] -= lapl_weight
-            laplacian_matrix[from_idx, from_idx] += lapl_weight
-            laplacian_matrix[to_idx, to_idx] += lapl_weight
+        adjacency_matrix, laplacian_matrix = \
+            cr.build_adjacency_and_laplacian(len(node_dict), from_idxs, to_idxs,
+                                             adj_weights, lapl_weights)
 
         return node_id_2_mat_idx, mat_idx_2_note_id, adjacency_matrix, laplacian_matrix
 
@@ -346,7 +452,7 @@ class InteractomeInterface(object):
         # only giant component parsing
         nodes_dict, edges_list = DatabaseGraph.parse_physical_entity_net(main_connex_only=True)
 
-        node_id_2_mat_idx, mat_idx_2_note_id, adjacency_matrix, laplacian_matrix = \
+        _, mat_idx_2_note_id, adjacency_matrix, laplacian_matrix = \
             self.create_val_matrix(nodes_dict, edges_list,
                                    adj_weight_policy_function=adj_weight_policy_function,
                                    lapl_weight_policy_function=lapl_weight_policy_function)
@@ -355,37 +461,20 @@ class InteractomeInterface(object):
 
         self.adjacency_matrix = adjacency_matrix
         self.laplacian_matrix = laplacian_matrix
+        self._base_laplacian_matrix = None
 
         self.get_eigen_spectrum(100)
 
-        self.neo4j_id_2_matrix_index = node_id_2_mat_idx
-        self.matrix_index_2_neo4j_id = mat_idx_2_note_id
-
-        self.neo4j_id_2_display_name = {_id: _node['displayName']
-                                        for (_id, _node) in nodes_dict.items()}
-        self.neo4j_id_2_legacy_id = {_id: _node['legacyID']
-                                     for (_id, _node) in nodes_dict.items()}
-        self.neo4j_id_2_node_type = {_id: list(_node.labels)[0]
-                                     for (_id, _node) in nodes_dict.items()}
-        self.neo4j_id_2_localization = {_id: _node.get('localization', 'NA')
-                                        for (_id, _node) in nodes_dict.items()}
-
-        self.known_neo4j_ids = [_node_id for _node_id
-                                in self.neo4j_id_2_matrix_index.keys()]
+        self.node_table = NodeTable.from_dicts(
+            mat_idx_2_note_id,
+            {_id: _node['displayName'] for (_id, _node) in nodes_dict.items()},
+            {_id: _node['legacyID'] for (_id, _node) in nodes_dict.items()},
+            {_id: list(_node.labels)[0] for (_id, _node) in nodes_dict.items()},
+            {_id: _node.get('localization', 'NA') for (_id, _node) in nodes_dict.items()})
 
         self._active_up_sample = []
 
-        if self._background:
-            if _is_int(self._background[0]):
-                self._background = list(set(self.known_neo4j_ids).intersection(
-                    set(self._background)))
-            else:
-                self._background = [(_id, _weight)
-                                    for _id, _weight in self._background
-                                    if _id in self.known_neo4j_ids]
-
-        else:
-            self._background = list(set(self.known_neo4j_ids))
+        self._trim_background()
 
         self._dump_maps()  # DONE
         self._dump_matrices()  # DONE
@@ -433,17 +522,27 @@ class InteractomeInterface(object):
         self._undump_matrices()
         self._undump_eigen()
 
+        self._trim_background()
+
+    def _trim_background(self):
+        """
+        Trims the background provided upon construction down to the nodes known to the node
+        table. If no background was provided, all the known nodes are used.
+        """
         if self._background:
             if _is_int(self._background[0]):
-                self._background = list(set(self.known_neo4j_ids).intersection(
-                    set(self._background)))
+                background = np.unique(np.array(self._background, dtype=np.int64))
+                self._background = background[self.node_table.contains(background)].tolist()
             else:
+                background_ids = np.array([_id for _id, _ in self._background])
                 self._background = [(_id, _weight)
-                                    for _id, _weight in self._background
-                                    if _id in self.known_neo4j_ids]
+                                    for (_id, _weight), _known
+                                    in zip(self._background,
+                                           self.node_table.contains(background_ids))
+                                    if _known]
 
         else:
-            self._background = list(set(self.known_neo4j_ids))
+            self._background = self.node_table.neo4j_ids.tolist()
 
     def get_descriptor_for_index(self, index):
         """
@@ -455,7 +554,7 @@ class InteractomeInterface(object):
         :return: Type, displayName and if a localization is given, returns display name too.
         :rtype: tuple
         """
-        if self.matrix_index_2_neo4j_id[index] in list(self.neo4j_id_2_localization.keys()):
+        if self.matrix_index_2_neo4j_id[index] in self.neo4j_id_2_localization:
             return (self.neo4j_id_2_node_type[self.matrix_index_2_neo4j_id[index]],
                     self.neo4j_id_2_display_name[self.matrix_index_2_neo4j_id[index]],
                     self.neo4j_id_2_localization[self.matrix_index_2_neo4j_id[index]])
@@ -468,7 +567,7 @@ class InteractomeInterface(object):
         Return the MD hash of self to ensure that all the defining properties have been correctly
         defined before dump/retrieval
         """
-        sorted_initial_set = sorted(self.neo4j_id_2_matrix_index.keys())
+        sorted_initial_set = self.node_table.sorted_neo4j_ids.tolist()
 
         # REFACTOR: [environment registration] should involve database used for the build metadata
         data = [
@@ -567,18 +666,14 @@ class InteractomeInterface(object):
         def _verify_uniprot_ids(id_weight_vector: List[Tuple[int, float]]) \
                 -> List[Tuple[int, float]]:
 
-            uniprots = np.array(id_weight_vector)[:, 0].tolist()
+            uniprots = np.array(id_weight_vector)[:, 0]
+            _filter = self.node_table.contains(uniprots)
 
-            if not set(uniprots) <= set(self.known_neo4j_ids):
+            if not np.all(_filter):
 
                 log.warn('Following reached uniprots neo4j_ids were not retrieved upon the '
                          'circulation matrix construction: \n %s',
-                         (set(uniprots) - set(self.known_neo4j_ids)))
-
-            _filter = [True
-                       if uniprot in self.known_neo4j_ids
-                       else False
-                       for uniprot in uniprots]
+                         set(uniprots[~_filter].tolist()))
 
             pre_return = np.array(id_weight_vector)[_filter, :].tolist()
 
@@ -599,20 +694,30 @@ class InteractomeInterface(object):
         """
         Applies a weight update instruction array providec by laplacian reweeighting dictionary
 
+        The laplacian before the first reweight is kept, so that the flow computation can
+        re-use its factorization with a low-rank correction instead of refactorizing.
+
         :param lapl_reweight_dict: laplacian reweighting dictionary for instructions
         :return:
         """
+        if confs.low_rank_reweight and self._base_laplacian_matrix is None:
+            self._base_laplacian_matrix = self.laplacian_matrix.copy()
+
+        # the reweight is applied on a lil copy: assigning to the rows and columns of a csr
+        # laplacian would store explicit zeros for every entry of an ablated node
+        laplacian_matrix = self.laplacian_matrix.tolil()
+
         for _id_or_tuple, value in lapl_reweight_dict.items():
 
-            log.debug('Applying a reweight for %d to %f' % (_id_or_tuple, value))
+            log.debug('Applying a reweight for %s to %f' % (_id_or_tuple, value))
 
             if type(_id_or_tuple) == tuple:
                 log.debug('Tuple branch')
                 matrix_id_1 = self.neo4j_id_2_matrix_index[_id_or_tuple[0]]
                 matrix_id_2 = self.neo4j_id_2_matrix_index[_id_or_tuple[1]]
 
-                self.laplacian_matrix[matrix_id_1, matrix_id_2] = value
-                self.laplacian_matrix[matrix_id_2, matrix_id_1] = value
+                laplacian_matrix[matrix_id_1, matrix_id_2] = value
+                laplacian_matrix[matrix_id_2, matrix_id_1] = value
 
             else:
 
@@ -620,14 +725,15 @@ class InteractomeInterface(object):
                 log.debug('Node branch at matrix idx %d' % matrix_id)
 
                 if value == 0:
-                    self.laplacian_matrix[matrix_id, :] = value
-                    self.laplacian_matrix[:, matrix_id] = value
+                    laplacian_matrix[matrix_id, :] = value
+                    laplacian_matrix[:, matrix_id] = value
 
                 else:
-                    self.laplacian_matrix[matrix_id, :] *= value
-                    self.laplacian_matrix[:, matrix_id] *= value
-                    self.laplacian_matrix[matrix_id, matrix_id] /= value
+                    laplacian_matrix[matrix_id, :] *= value
+                    laplacian_matrix[:, matrix_id] *= value
+                    laplacian_matrix[matrix_id, matrix_id] /= value
 
+        self.laplacian_matrix = laplacian_matrix.asformat(self.laplacian_matrix.format)
 
     def evaluate_ops(self, sparse_rounds=-1):
         """
@@ -671,14 +777,16 @@ class InteractomeInterface(object):
         :raise Warning: if the uniprots were not present in the set of GOs for which
         we built the system or had no GO attached to them
         """
-        if not set(uniprots) <= set(self.known_neo4j_ids):
+        _filter = self.node_table.contains(np.array(uniprots))
+
+        if not np.all(_filter):
 
             log.warn('Following reached uniprots neo4j_ids were not retrieved upon the '
                      'circulation matrix construction: \n %s',
-                     (set(uniprots) - set(self.known_neo4j_ids)))
+                     set(np.array(uniprots)[~_filter].tolist()))
 
         self._active_up_sample = \
-            [uniprot for uniprot in uniprots if uniprot in self.known_neo4j_ids]
+            [uniprot for uniprot, _known in zip(uniprots, _filter) if _known]
 
     def compute_current_and_potentials(
             self,
@@ -687,7 +795,10 @@ class InteractomeInterface(object):
             # sampling
             cancellation: bool = True,
             sparse_rounds: int = -1,
-            fast_load: bool = False):  # REFACTOR: [fast resurrection] currently dead
+            fast_load: bool = False,  # REFACTOR: [fast resurrection] currently dead
+            flow_mode: Union[str, None] = None,
+            processes: Union[int, None] = None,
+            cache_potentials: bool = False):
         # this way.
         """
         Builds a conduction matrix that integrates uniprots, in order to allow an easier
@@ -703,6 +814,12 @@ class InteractomeInterface(object):
             dense,i.e. instead of computation for each node pair, only an estimation will be made,
             equal to computing sparse_rounds association with other randomly chosen nodes
         :param fast_load: if True, will try to lad a pre-saved instance
+        :param flow_mode: 'pairwise' or 'superposition' (one solve per sample node instead of
+            one per pair). If None, the `flow_mode` value from configs is used
+        :param processes: number of worker processes between which the pairs are split. If
+            None, the `flow_processes` value from configs is used
+        :param cache_potentials: if True, single-node potentials are kept in a process-wide
+            cache and re-used by the following calls on the same system
         :return: adjusted conduction system
         """
 
@@ -724,9 +841,7 @@ class InteractomeInterface(object):
             index_current = cr.get_current_through_nodes(self.current_accumulator)
             log.info('current accumulator shape %s', self.current_accumulator.shape)
 
-            self.node_current.update(
-                dict((self.matrix_index_2_neo4j_id[idx], val) for idx, val in
-                     enumerate(index_current)))
+            self.node_current.update(zip(self.node_table.neo4j_ids.tolist(), index_current))
 
             return None
 
@@ -735,12 +850,12 @@ class InteractomeInterface(object):
             self.UP2UP_voltages = {}
             self.node_current = defaultdict(float)
 
-        translated_active_weighted_sample = [(self.neo4j_id_2_matrix_index[UP], _w) for
-                                             UP, _w in self._active_weighted_sample]
+        translated_active_weighted_sample = \
+            self._translate_weighted_sample(self._active_weighted_sample)
 
         if self._secondary_weighted_sample is not None:
-            translated_secondary_weighted_sample = [(self.neo4j_id_2_matrix_index[UP], _w) for
-                                                    UP, _w in self._secondary_weighted_sample]
+            translated_secondary_weighted_sample = \
+                self._translate_weighted_sample(self._secondary_weighted_sample)
 
         else:
             translated_secondary_weighted_sample = None
@@ -753,12 +868,17 @@ class InteractomeInterface(object):
                                    sparse_rounds=sparse_rounds,
                                    potential_diffs_remembered=True,
                                    thread_hex=self.thread_hex,
-                                   flow_calculation_method=self._flow_calculation_method)
-
+                                   flow_calculation_method=self._flow_calculation_method,
+                                   flow_calculation_mode=flow_mode,
+                                   processes=processes,
+                                   system_hash=self.md5_hash(),
+                                   base_laplacian=self._base_laplacian_matrix,
+                                   cache_potentials=cache_potentials)
+
+        pair_ids = np.sort(self.node_table.indexes_to_ids(
+            np.array(list(up_pair_2_voltage.keys()), dtype=np.int64).reshape(-1, 2)), axis=1)
         self.UP2UP_voltages.update(
-            {tuple(sorted([self.matrix_index_2_neo4j_id[i],
-                           self.matrix_index_2_neo4j_id[j]])): voltage
-                          for (i, j), voltage in up_pair_2_voltage.items()})
+            zip(map(tuple, pair_ids.tolist()), up_pair_2_voltage.values()))
 
         if incremental:
             self.current_accumulator = self.current_accumulator + current_accumulator
@@ -767,12 +887,30 @@ class InteractomeInterface(object):
 
         index_current = cr.get_current_through_nodes(self.current_accumulator)
         log.info('current accumulator shape %s, sum %s', current_accumulator.shape, np.sum(current_accumulator))
-        self.node_current.update(
-            dict((self.matrix_index_2_neo4j_id[idx], val) for idx, val in enumerate(index_current)))
+        self.node_current.update(zip(self.node_table.neo4j_ids.tolist(), index_current))
 
         if memoized:
             self._dump_memoized()
 
+    def _translate_weighted_sample(self, weighted_sample: List[Tuple[int, float]]) \
+            -> List[Tuple[int, float]]:
+        """
+        Translates the neo4j ids of a weighted sample into matrix indexes
+
+        :param weighted_sample: [(neo4j id, weight)]
+        :return: [(matrix index, weight)]
+        """
+        matrix_indexes = self.node_table.ids_to_indexes(
+            np.array([_id for _id, _ in weighted_sample]))
+
+        return list(zip(matrix_indexes.tolist(), [_w for _, _w in weighted_sample]))
+
+    def node_current_vector(self) -> np.ndarray:
+        """
+        :return: current through each node, aligned to the matrix indexes
+        """
+        return np.array([self.node_current[_id] for _id in self.node_table.neo4j_ids.tolist()])
+
     def format_node_props(self, node_current, limit=0.01):
         """
         Formats the nodes for the analysis by in the knowledge_access_analysis module
@@ -839,7 +977,7 @@ class InteractomeInterface(object):
         for NodeID in self.node_current.keys():
             matrix_index = self.neo4j_id_2_matrix_index[NodeID]
 
-            if NodeID not in list(self.neo4j_id_2_display_name.keys()):
+            if NodeID not in self.neo4j_id_2_display_name:
                 log.warning('neo4j id %s does not seem to appear in the main import set', NodeID)
                 log.warning('corresponding matrix id is %s', matrix_index)
                 continue
@@ -847,7 +985,6 @@ class InteractomeInterface(object):
             if not self.neo4j_id_2_display_name[NodeID]:
                 log.warning('neo4j id %s maps to a display ID that is void', NodeID)
                 log.warning('corresponding matrix id is %s', matrix_index)
-                self.neo4j_id_2_display_name[NodeID] = "None"
                 continue
 
             if NodeID in self._active_up_sample:
@@ -971,7 +1108,13 @@ class InteractomeInterface(object):
 
             # KNOWNBUG: [fast resurrection] fast resurrection is impossible (memoized hard-coded to
             #  false, because the pipeline is broken)
-            self.compute_current_and_potentials(memoized=False, sparse_rounds=sparse_rounds)
+            # random samplers already run in a pool of their own, whose processes can't have
+            # children, hence the single process. Samples drawn from the same background share
+            # most of their nodes and can share their potentials if configured, although the
+            # null model is then computed by superposition, whatever the flow_mode
+            self.compute_current_and_potentials(
+                memoized=False, sparse_rounds=sparse_rounds, processes=1,
+                cache_potentials=confs.cross_sample_potentials)
 
             sample_ids_md5 = hashlib.md5(
                 json.dumps(
@@ -989,22 +1132,25 @@ class InteractomeInterface(object):
                             sparse_rounds, sampling_policy.__name__, optional_sampling_param,
                             np.sum(self.current_accumulator)))
 
-                insert_interactome_rand_samp({
+                voltage_ids = np.array(list(self.UP2UP_voltages.keys()),
+                                       dtype=np.int64).reshape(-1, 2)
+
+                insert_interactome_rand_samp(encode_rand_sample(
+                    {
                         'UP_hash': sample_ids_md5,  # specific retrieval, but inexact.
                         'sys_hash': self.md5_hash(),
                         'active_sample_hash': self.active_sample_md5_hash(sparse_rounds),
                         'target_sample_hash': super_hash,
                         'sampling_policy': sampling_policy.__name__,
                         'sampling_policy_options': optional_sampling_param,
-                        'sparse_rounds': sparse_rounds,
-                        'UPs': pickle.dumps(self._active_up_sample),
-                        'sample': pickle.dumps(self._active_weighted_sample),
-                        'sec_sample': pickle.dumps(self._secondary_weighted_sample),
-                        'currents': pickle.dumps(
-                            (self.current_accumulator,
-                             self.node_current)),
-                        'voltages': pickle.dumps(
-                            self.UP2UP_voltages)})
+                        'sparse_rounds': sparse_rounds},
+                    self._active_up_sample,
+                    self._active_weighted_sample,
+                    self._secondary_weighted_sample,
+                    node_currents=self.node_current_vector(),
+                    voltage_indexes=self.node_table.ids_to_indexes(voltage_ids),
+                    voltage_values=list(self.UP2UP_voltages.values()),
+                    current_matrix=self.current_accumulator))
 
             # if not sparse_rounds:
             #     log.info('Sampling thread %s: Thread hex: %s \t Sample size: %s \t iteration: %s\t compop/s: %s \t '
@@ -1,7 +1,6 @@
 """
 New analytical routines for the interactome
 """
-import pickle
 from csv import writer as csv_writer
 from multiprocessing import Pool
 from collections import defaultdict
@@ -14,15 +13,17 @@ from tabulate import tabulate
 
 from bioflow.configs.main_configs import NewOutputs, \
     sparse_analysis_threshold, default_p_val_cutoff, min_nodes_for_p_val, \
-    default_background_samples, implicitely_threaded
-from bioflow.sample_storage.mongodb import find_interactome_rand_samp, count_interactome_rand_samp
+    default_background_samples, implicitely_threaded, null_model_chunk_size, \
+    adaptive_background_sampling, adaptive_sampling_round, adaptive_sampling_confidence
+from bioflow.sample_storage.sample_store import find_interactome_rand_samp, count_interactome_rand_samp
+from bioflow.sample_storage.sample_schema import decode_voltages, node_current_chunks, \
+    node_currents_fields, voltages_fields
 from bioflow.molecular_network.InteractomeInterface import InteractomeInterface
-from bioflow.utils.dataviz import kde_compute
 from bioflow.utils.general_utils import _is_int
 from bioflow.utils.log_behavior import get_logger
 from bioflow.neo4j_db.db_io_routines import translate_reweight_dict
-from bioflow.algorithms_bank.flow_significance_evaluation import get_neighboring_degrees,\
-    get_p_val_by_gumbel
+from bioflow.algorithms_bank.flow_significance_evaluation import \
+    GumbelSignificanceEngine, NullModelAccumulator, p_values_settled
 from bioflow.algorithms_bank.clustering_routines import compute_tension_clustering
 import bioflow.algorithms_bank.sampling_policies as sampling_policies
 
@@ -81,6 +82,46 @@ def _spawn_sampler(args_puck):
     )
 
 
+def _map_samplers(pool, payload_list):
+    """
+    Maps the samplers to the processes of a pool, re-raising their errors with the original
+    traceback
+
+    :param pool: pool of processes
+    :param payload_list: argument pucks of the samplers, one per process
+    """
+    try:
+        pool.map(_spawn_sampler, payload_list)
+    except Exception as e:
+        msg = "{}\n\nOriginal {}".format(e, traceback.format_exc())
+        raise type(e)(msg)
+
+
+# attributes set by compute_current_and_potentials, sent back from the pool process
+_real_sample_flow_attributes = ('current_accumulator', 'UP2UP_voltages', 'node_current')
+
+
+def _real_sample_flow(args_puck):
+    """
+    Computes and memoizes the currents for the real hits list, in a process of the sampler pool
+    when there is one, so that nothing is factorized in the process that keeps the pool
+
+    :param args_puck: interactome interface with loaded real hits list, sparse rounds
+    :return: [[current, degree], ...].T for the nodes;
+        {attribute: value} of the computed flow, to be set on the interactome interface of the
+        parent process
+    """
+    interactome_interface_instance, sparse_rounds = args_puck
+
+    # processes of a pool can't have children of their own
+    interactome_interface_instance.compute_current_and_potentials(sparse_rounds=sparse_rounds,
+                                                                  processes=1)
+    _, query_array, _ = _query_node_properties(interactome_interface_instance)
+
+    return query_array, dict((attribute, getattr(interactome_interface_instance, attribute))
+                             for attribute in _real_sample_flow_attributes)
+
+
 def _spawn_sampler_pool(
         pool_size,
         sample_sets_to_match,
@@ -89,7 +130,8 @@ def _spawn_sampler_pool(
         background_set,
         forced_interactome_interface,
         sampling_policy,
-        sampling_options):
+        sampling_options,
+        pool=None):
     """
     Spawns a pool of samplers of the information flow within the GO system
 
@@ -103,6 +145,8 @@ def _spawn_sampler_pool(
         imitate
     :param sampling_policy: sampling policy to be employed
     :param sampling_options: options to the sampling policy
+    :param pool: if provided, running pool of pool_size processes the samplers are mapped to,
+        instead of spawning a new one
     """
     global implicitely_threaded
 
@@ -125,16 +169,16 @@ def _spawn_sampler_pool(
     payload_list = payload * pool_size
     payload_list = [list(item) + [i] for i, item in enumerate(payload_list)]  # prepare the payload
 
-    if not implicitely_threaded:
+    if not implicitely_threaded and pool is not None:
+        log.debug('mapping the sampler to the running pool with payload %s', payload)
+        _map_samplers(pool, payload_list)
+
+    elif not implicitely_threaded:
         with Pool(processes=pool_size) as pool:  # This is the object we are using to spawn a thread pool
-            try:
-                log.debug('spawning the sampler with payload %s', payload)
-                pool.map(_spawn_sampler, payload_list)  # This what we spawn as a sampler
-                # KNOWNBUG: hangs with no message upon a second start attempt in Interactome
-                #  analysis due to cholmod
-            except Exception as e:
-                msg = "{}\n\nOriginal {}".format(e, traceback.format_exc())
-                raise type(e)(msg)
+            log.debug('spawning the sampler with payload %s', payload)
+            _map_samplers(pool, payload_list)  # This what we spawn as a sampler
+            # KNOWNBUG: hangs with no message upon a second start attempt in Interactome
+            #  analysis due to cholmod
             # log.info('Last in-pool flag exiting')
             pool.terminate()
 
@@ -165,7 +209,8 @@ def local_indexed_select(bi_array, array_column, selection_span):
 
 
 def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array,
-                             save_path: str = None, p_values: np.array = None):
+                             save_path: str = None, p_values: np.array = None,
+                             background_histogram: Tuple[np.ndarray, np.ndarray] = None):
     """
     A general function that performs demonstration of an example of random samples of
      the same size as our sample and of our sample and conducts the statistical tests
@@ -177,6 +222,8 @@ def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array
     characteristics of the true sample. If none, nothing happens
     :param save_path: where the thing will be saved
     :param p_values: p-value map that will be used to save things after the analysis
+    :param background_histogram: (counts, bin edges) of the background currents, if they were
+        aggregated beforehand. In that case background_curr_deg_conf can be a subsample
     :return: None
     """
 
@@ -188,19 +235,24 @@ def samples_scatter_and_hist(background_curr_deg_conf, true_sample_bi_corr_array
     plt.subplot(211)
     plt.title('current through nodes')
 
-    bins = np.linspace(
-        background_curr_deg_conf[0, :].min(),
-        background_curr_deg_conf[0, :].max(), 100)
+    if background_histogram is not None:
+        counts, bins = background_histogram
+        plt.hist(bins[:-1], bins=bins, weights=counts, histtype='step', log=True, color='b')
 
-    if true_sample_bi_corr_array is not None:
-        bins = np.linspace(min(background_curr_deg_conf[0, :].min(),
-                               true_sample_bi_corr_array[0, :].min()),
-                           max(background_curr_deg_conf[0, :].max(),
-                               true_sample_bi_corr_array[0, :].max()),
-                           100)
+    else:
+        bins = np.linspace(
+            background_curr_deg_conf[0, :].min(),
+            background_curr_deg_conf[0, :].max(), 100)
 
-    plt.hist(background_curr_deg_conf[0, :],
-             bins=bins, histtype='step', log=True, color='b')
+        if true_sample_bi_corr_array is not None:
+            bins = np.linspace(min(background_curr_deg_conf[0, :].min(),
+                                   true_sample_bi_corr_array[0, :].min()),
+                               max(background_curr_deg_conf[0, :].max(),
+                                   true_sample_bi_corr_array[0, :].max()),
+                               100)
+
+        plt.hist(background_curr_deg_conf[0, :],
+                 bins=bins, histtype='step', log=True, color='b')
 
     if true_sample_bi_corr_array is not None:
         plt.hist(true_sample_bi_corr_array[0, :],
@@ -291,11 +343,12 @@ def clustering_analysis_complement(interactome_interface_instance: InteractomeIn
                                           'active_sample_hash': active_sample_hash,
                                           'sys_hash': md5_hash,
                                           'sampling_policy': random_sampling_method.__name__,
-                                          'sampling_policy_options': random_sampling_option})
+                                          'sampling_policy_options': random_sampling_option},
+                                          projection=voltages_fields)
 
     for i, sample in enumerate(background_samples):
 
-        voltages = pickle.loads(sample['voltages'])
+        voltages = decode_voltages(sample, interactome_interface_instance.node_table.neo4j_ids)
 
         _, min_clust_inf_flow, clust_size = compute_tension_clustering(voltages, random_sample=True)
 
@@ -315,20 +368,8 @@ def clustering_analysis_complement(interactome_interface_instance: InteractomeIn
 
     query_array = np.vstack([min_clust_inf_flow, clust_size])
 
-    clust_sizes = np.unique(clust_size)
-
-    combined_p_vals = np.ones_like(min_clust_inf_flow)
-
-    for cluster_size in clust_sizes.tolist():
-        _filter = clust_size == cluster_size
-        entry = min_clust_inf_flow[_filter]
-
-        min_clust_inf_flow_per_run = get_neighboring_degrees(cluster_size,
-                                                             max_array,
-                                                             min_nodes=min_nodes_for_p_val)
-
-        p_vals = get_p_val_by_gumbel(entry, min_clust_inf_flow_per_run)
-        combined_p_vals[_filter] = p_vals
+    significance_engine = GumbelSignificanceEngine(max_array, min_nodes=min_nodes_for_p_val)
+    combined_p_vals = significance_engine.p_values(min_clust_inf_flow, clust_size)
 
     samples_scatter_and_hist(background_array, query_array,
                              save_path=output_destination.interactome_clusters_scatterplot,
@@ -362,52 +403,43 @@ def clustering_analysis_complement(interactome_interface_instance: InteractomeIn
     return cluster_entries
 
 
-def compare_to_blank(interactome_interface_instance: InteractomeInterface,
-                     p_val_cutoff: float = 0.05,
-                     sparse_rounds: int = -1,
-                     output_destination: NewOutputs = None,
-                     random_sampling_method=sampling_policies.matched_sampling,
-                     random_sampling_option='exact',
-                     ) -> Tuple[list, dict]:
+def _query_node_properties(interactome_interface_instance: InteractomeInterface) -> \
+        Tuple[np.ndarray, np.ndarray, dict]:
     """
-    Recovers the statistics on the circulation nodes and shows the visual of a circulation system.
-    There is no issue with using the same interactome interface instance, because they are forked when
-    threads are generated and will not interfere.
+    Formats the currents through the nodes computed for the real hits list
 
-    :param p_val_cutoff: desired cutoff p_value for the returned terms
-    :param sparse_rounds: if set to a number, sparse computation technique would be used
-        with the number of rounds equal the integer value of that argument
-    :param interactome_interface_instance: Interactome interface with loaded real hits list to
-        analyse
-    :param output_destination: configs object from main_configs, specifying where the results
-        will be saved
-    :param random_sampling_method: sampling policy used
-    :param random_sampling_option: sampling policy optional argument
-    :return: None if no significant nodes, the node and group characteristic
-        dictionaries otherwise
+    :param interactome_interface_instance: Interactome interface with computed currents
+    :return: node ids, [[current, degree], ...].T, {node id: [current, degree]}
     """
-    def get_max_for_each_degree(sample_sub_arrray):
-        # print('debug max_array_shape:', str(sample_sub_arrray.shape))
-        degrees = np.unique(sample_sub_arrray[1, :])
-        max_array = []
+    node_currents = interactome_interface_instance.node_current
+    dict_system = interactome_interface_instance.format_node_props(node_currents)
 
-        for degree in degrees:
-            filter = sample_sub_arrray[1, :] == degree
-            max_array.append([sample_sub_arrray[0, filter].max(), degree])
+    curr_inf_conf_tot = np.array([[int(key)] + list(val) for key, val in list(dict_system.items())]).T
 
-        m_arr = np.array(max_array)
-        return m_arr.T
+    node_ids, query_array = (curr_inf_conf_tot[0, :], curr_inf_conf_tot[(1, 2), :])
 
-    if interactome_interface_instance is None or interactome_interface_instance.node_current == {}:
-        raise Exception("tried to compare to blanc an empty interface instance")
+    return node_ids, query_array, dict_system
 
+
+def _background_null_model(interactome_interface_instance: InteractomeInterface,
+                           sparse_rounds: int,
+                           random_sampling_method,
+                           random_sampling_option) -> NullModelAccumulator:
+    """
+    Aggregates the node currents of the random samples stored for the active sample of the
+    interface into a null model
+
+    :param interactome_interface_instance: Interactome interface with loaded real hits list
+    :param sparse_rounds: sparse rounds used for the sampling
+    :param random_sampling_method: sampling policy used
+    :param random_sampling_option: sampling policy optional argument
+    :return: null model
+    """
     md5_hash = interactome_interface_instance.md5_hash()
     active_sample_hash = interactome_interface_instance.active_sample_md5_hash(sparse_rounds)
 
-    background_sub_array_list = []
-    max_sub_array_list = []
-
-    count = 0
+    node_degrees = interactome_interface_instance.non_norm_laplacian_matrix.diagonal()
+    null_model = NullModelAccumulator(max_keys=node_degrees, window_keys=node_degrees)
 
     log.info("looking to test against:\n"
              "\t target_hash: %s \t sys_hash: %s \n"
@@ -431,81 +463,70 @@ def compare_to_blank(interactome_interface_instance: InteractomeInterface,
                                           'active_sample_hash': active_sample_hash,
                                           'sys_hash': md5_hash,
                                           'sampling_policy': random_sampling_method.__name__,
-                                          'sampling_policy_options': random_sampling_option})
-
-    for i, sample in enumerate(background_samples):
-
-        _, node_currents = pickle.loads(sample['currents'])
-
-        dict_system = interactome_interface_instance.format_node_props(node_currents, limit=0)
-        background_sub_array = list(dict_system.values())
-
-        if np.array(background_sub_array).T.shape[0] < 2:
-            log.info(background_sub_array)
-            continue
-
-        background_sub_array_list.append(np.array(background_sub_array).T)
-        # print(np.array(background_sub_array).T.shape)
-        # pprint(background_sub_array)
-        max_arr = get_max_for_each_degree(np.array(background_sub_array).T)
-        max_sub_array_list.append(max_arr)
-        count = i
-
-    # This part declares the pre-operators required for the verification of a
-    # real sample
-
-    background_array = np.concatenate(tuple(background_sub_array_list), axis=1)
-    max_array = np.concatenate(tuple(max_sub_array_list), axis=1)
-
-    node_currents = interactome_interface_instance.node_current
-    dict_system = interactome_interface_instance.format_node_props(node_currents)
+                                          'sampling_policy_options': random_sampling_option},
+                                          projection=node_currents_fields)
 
-    curr_inf_conf_tot = np.array([[int(key)] + list(val) for key, val in list(dict_system.items())]).T
-
-    node_ids, query_array = (curr_inf_conf_tot[0, :], curr_inf_conf_tot[(1, 2), :])
+    for currents_chunk in node_current_chunks(background_samples,
+                                              interactome_interface_instance.node_table.id_2_index,
+                                              len(interactome_interface_instance.node_table),
+                                              null_model_chunk_size):
+        null_model.add_samples(currents_chunk)
 
-    log.info("stats on  %s samples" % count)
+    if null_model.runs == 0:
+        raise Exception('None of the random samples found had any current through nodes')
 
-    background_density = kde_compute(background_array[(1, 0), :], 50, count)
-    base_bi_corr = background_array[(0, 1), :]
+    return null_model
 
-    r_rels = []
-    r_std_nodes = []
 
-    degrees = np.unique(query_array[1, :])
+def compare_to_blank(interactome_interface_instance: InteractomeInterface,
+                     p_val_cutoff: float = 0.05,
+                     sparse_rounds: int = -1,
+                     output_destination: NewOutputs = None,
+                     random_sampling_method=sampling_policies.matched_sampling,
+                     random_sampling_option='exact',
+                     ) -> Tuple[list, dict]:
+    """
+    Recovers the statistics on the circulation nodes and shows the visual of a circulation system.
+    There is no issue with using the same interactome interface instance, because they are forked when
+    threads are generated and will not interfere.
 
-    combined_p_vals = np.ones_like(query_array[1, :])
+    :param p_val_cutoff: desired cutoff p_value for the returned terms
+    :param sparse_rounds: if set to a number, sparse computation technique would be used
+        with the number of rounds equal the integer value of that argument
+    :param interactome_interface_instance: Interactome interface with loaded real hits list to
+        analyse
+    :param output_destination: configs object from main_configs, specifying where the results
+        will be saved
+    :param random_sampling_method: sampling policy used
+    :param random_sampling_option: sampling policy optional argument
+    :return: None if no significant nodes, the node and group characteristic
+        dictionaries otherwise
+    """
+    if interactome_interface_instance is None or interactome_interface_instance.node_current == {}:
+        raise Exception("tried to compare to blanc an empty interface instance")
 
-    for degree in degrees.tolist():
-        _filter = query_array[1, :] == degree
+    null_model = _background_null_model(interactome_interface_instance, sparse_rounds,
+                                        random_sampling_method, random_sampling_option)
+    max_array = null_model.max_array()
 
-        entry = query_array[0, _filter]
-        background_set = background_array[:, background_array[1, :] == degree]
+    node_ids, query_array, dict_system = _query_node_properties(interactome_interface_instance)
 
-        # REFACTOR: [MODULARITY] this part is too coupled. we should factor it out
-        max_current_per_run = get_neighboring_degrees(degree,
-                                                      max_array,
-                                                      min_nodes=min_nodes_for_p_val)
+    log.info("stats on  %s samples" % null_model.runs)
 
-        p_vals = get_p_val_by_gumbel(entry, max_current_per_run)
-        combined_p_vals[_filter] = p_vals
+    significance_engine = GumbelSignificanceEngine(max_array, min_nodes=min_nodes_for_p_val)
+    combined_p_vals = significance_engine.p_values(query_array[0, :], query_array[1, :])
 
-    samples_scatter_and_hist(background_array, query_array,
+    samples_scatter_and_hist(null_model.scatter(), query_array,
                              save_path=output_destination.interactome_network_scatterplot,
                              # to save
-                             p_values=combined_p_vals)
+                             p_values=combined_p_vals,
+                             background_histogram=null_model.histogram(query_array[0, :].max()))
 
-    r_nodes = background_density(query_array[(1, 0), :])  # legacy - unused now
     r_nodes = combined_p_vals
 
-    for point in query_array.T:
-        selector = np.logical_and(base_bi_corr[1, :] > point[1]*0.9, base_bi_corr[1, :] < point[1]*1.1)
-        r_rels.append(point[0] / np.mean(base_bi_corr[0, selector]))
-        r_std_nodes.append((point[0] - np.mean(base_bi_corr[0, selector])) / np.std(base_bi_corr[0,
-                                                                                              selector]))
-
-    r_rels = np.array(r_rels)
-    r_std_nodes = np.array(r_std_nodes)
+    background_means, background_stds = null_model.windowed_mean_std(query_array[1, :])
+    r_rels = query_array[0, :] / background_means
+    r_std_nodes = (query_array[0, :] - background_means) / background_stds
 
     not_random_nodes = [node_id for node_id in node_ids[r_nodes < p_val_cutoff].tolist()]
 
@@ -536,6 +557,94 @@ def compare_to_blank(interactome_interface_instance: InteractomeInterface,
     return sorted(node_char_list, key=lambda x: x[4]), nodes_dict
 
 
+def _adaptive_sampler_pool(
+        interactome_interface_instance: InteractomeInterface,
+        pool_size,
+        sample_sets_to_match,
+        max_sample_depth,
+        sparse_rounds,
+        background_set,
+        forced_interactome_interface,
+        sampling_policy,
+        sampling_options,
+        p_val_cutoff):
+    """
+    Draws random samples in rounds, refitting the null model after each round, until the
+    p-values of the nodes near the cutoff are stable or the max depth is reached
+
+    :param interactome_interface_instance: Interactome interface with loaded real hits list. Its
+        currents are computed in the sampler pool, not in this process, which forks the
+        samplers, and are set on it once the sampling is over
+    :param pool_size: number of processes that are performing the sample pooling and analyzing
+    :param sample_sets_to_match: size of the sample list
+    :param max_sample_depth: max number of new random samples to generate
+    :param sparse_rounds: number of sparse rounds to run (or False if sampling is dense)
+    :param background_set: set of node ids that are to be sampled from
+    :param forced_interactome_interface: a provided InteractomeInterface that contains sets to
+        imitate
+    :param sampling_policy: sampling policy to be employed
+    :param sampling_options: options to the sampling policy
+    :param p_val_cutoff: cutoff p-value for the significance of the nodes
+    :return: number of new random samples generated
+    """
+    global implicitely_threaded
+
+    previous_p_values = None
+    sample_depth = 0
+
+    # a single pool is kept for all the rounds and forked before anything is factorized in this
+    # process: re-spawning pools after a cholmod factorization hangs the samplers
+    pool = None if implicitely_threaded else Pool(processes=pool_size)
+
+    try:
+        real_sample_args = (interactome_interface_instance, sparse_rounds)
+
+        if pool is None:
+            query_array, real_sample_flow = _real_sample_flow(real_sample_args)
+        else:
+            query_array, real_sample_flow = pool.apply(_real_sample_flow, (real_sample_args,))
+
+        while sample_depth < max_sample_depth:
+            round_depth = min(adaptive_sampling_round, max_sample_depth - sample_depth)
+
+            _spawn_sampler_pool(pool_size,
+                                sample_sets_to_match,
+                                round_depth,
+                                sparse_rounds=sparse_rounds,
+                                background_set=background_set,
+                                forced_interactome_interface=forced_interactome_interface,
+                                sampling_policy=sampling_policy,
+                                sampling_options=sampling_options,
+                                pool=pool)
+            sample_depth += round_depth
+
+            null_model = _background_null_model(interactome_interface_instance, sparse_rounds,
+                                                sampling_policy, sampling_options)
+            # fits of the intermediate null models are not worth saving to disk
+            p_values = GumbelSignificanceEngine(null_model.max_array(),
+                                                min_nodes=min_nodes_for_p_val,
+                                                persistent=False).p_values(
+                query_array[0, :], query_array[1, :])
+
+            if p_values_settled(p_values, previous_p_values, null_model.runs, p_val_cutoff,
+                                adaptive_sampling_confidence):
+                log.info('p-values settled after %d new random samples, out of at most %d'
+                         % (sample_depth, max_sample_depth))
+                break
+
+            previous_p_values = p_values
+
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    # set once the sampling is over, since samplers sharing the interface overwrite its currents
+    for attribute, value in real_sample_flow.items():
+        setattr(interactome_interface_instance, attribute, value)
+
+    return sample_depth
+
+
 def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                  secondary_source_list: List[Union[List[int],
                                                    List[Tuple[int, float]],
@@ -551,6 +660,7 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                  sampling_policy_options='exact',
                  explicit_interface=None,
                  forced_lapl_reweight=None,
+                 adaptive_sampling: bool = adaptive_background_sampling,
                  ) -> None:
     """
     Automatically analyzes the interactome synergetic action of the experimental hit lists
@@ -574,6 +684,9 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
     :param forced_lapl_reweight: dictionary providing instructions for the modification of
         interactome laplacians weight edges will be set to a given value, nodes will have all the
         edges connecting to them multiplied by the value
+    :param adaptive_sampling: if set to true, random samples are drawn in rounds until the
+        p-values of the nodes near the cutoff are stable, with random_samples_to_test_against as
+        the max depth
     :return:
     """
     # Multiple re-spawns of threaded processing are incompatbile with scikits.sparse.cholmod
@@ -669,7 +782,32 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                      (in_storage, random_samples_to_test_against, random_samples_to_test_against - in_storage))
             random_samples_to_test_against = random_samples_to_test_against - in_storage
 
-        if not local_skip_sampling:
+        local_adaptive_sampling = adaptive_sampling and not local_skip_sampling
+
+        if local_adaptive_sampling and explicit_interface is not None \
+                and forced_lapl_reweight is not None:
+            log.warning('adaptive sampling is not possible when the explicit interface used for '
+                        'sampling is reweighted. Sampling %d' % random_samples_to_test_against)
+            local_adaptive_sampling = False
+
+        if local_adaptive_sampling:
+            # the samplers only share the interface if it is explicit, in which case it is not
+            # reweighted
+            if forced_lapl_reweight is not None:
+                interactome_interface.apply_reweight_dict(forced_lapl_reweight)
+
+            _adaptive_sampler_pool(interactome_interface,
+                                   processors,
+                                   (hits_list, sec_list),
+                                   random_samples_to_test_against,
+                                   sparse_rounds=sparse_rounds,
+                                   background_set=background_list,
+                                   forced_interactome_interface=explicit_interface,
+                                   sampling_policy=sampling_policy,
+                                   sampling_options=sampling_policy_options,
+                                   p_val_cutoff=p_value_cutoff)
+
+        elif not local_skip_sampling:
 
             _spawn_sampler_pool(processors,
                                 (hits_list, sec_list),
@@ -680,10 +818,12 @@ def auto_analyze(source_list: List[Union[List[int], List[Tuple[int, float]]]],
                                 sampling_policy=sampling_policy,
                                 sampling_options=sampling_policy_options)
 
-        if forced_lapl_reweight is not None:
+        if forced_lapl_reweight is not None and not local_adaptive_sampling:
             interactome_interface.apply_reweight_dict(forced_lapl_reweight)
 
-        interactome_interface.compute_current_and_potentials(sparse_rounds=sparse_rounds)
+        # in adaptive mode, the currents were computed in the sampler pool and set on the interface
+        if not local_adaptive_sampling:
+            interactome_interface.compute_current_and_potentials(sparse_rounds=sparse_rounds)
 
         nr_nodes, p_val_dict = compare_to_blank(
             interactome_interface,
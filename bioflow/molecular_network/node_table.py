@@ -0,0 +1,261 @@
+"""
+Module containing the compact table of the interactome nodes, that replaces the parallel
+neo4j id to property dictionaries. The ids are stored as a sorted int64 array searched with
+np.searchsorted, node types and localizations as categorical codes and names as offset-indexed
+utf-8 string pools, so that the table can be memory-mapped from the dumps and shared between
+sampling processes.
+"""
+import numbers
+from collections.abc import Mapping
+import numpy as np
+from typing import Union, List, Iterable, Tuple
+
+from bioflow.utils.io_routines import string_table_to_arrays, arrays_to_string_list
+
+
+class NodeTable(object):
+    """
+    Table of the nodes of a conduction system, indexed by matrix index
+
+    :param arrays: {name: numpy array} dict, as returned by NodeTable.to_arrays(). Arrays can
+        be memory-mapped.
+    """
+
+    layout = 'node_table'
+    string_columns = ('display_name', 'legacy_id')
+    categorical_columns = ('node_type', 'localization')
+
+    def __init__(self, arrays: dict):
+        self._arrays = arrays
+        self.neo4j_ids = arrays['neo4j_ids']
+        self.sorted_neo4j_ids = arrays['sorted_neo4j_ids']
+        self.sorted_neo4j_ids_matrix_index = arrays['sorted_neo4j_ids_matrix_index']
+        self.categories = {name: arrays_to_string_list(arrays, name + '_categories')
+                           for name in self.categorical_columns}
+
+        self.id_2_index = _IdToIndexView(self)
+        self.index_2_id = _IndexToIdView(self)
+        self.column_views = {name: _ColumnView(self, name)
+                             for name in self.string_columns + self.categorical_columns}
+
+    @classmethod
+    def from_columns(cls,
+                     neo4j_ids: Iterable[int],
+                     display_names: List[Union[str, None]],
+                     legacy_ids: List[Union[str, None]],
+                     node_types: List[Union[str, None]],
+                     localizations: List[Union[str, None]]) -> 'NodeTable':
+        """
+        Builds a node table from columns in the matrix index order
+
+        :param neo4j_ids: neo4j ids of nodes
+        :param display_names: display names of nodes
+        :param legacy_ids: legacy ids of nodes
+        :param node_types: types of nodes
+        :param localizations: localizations of nodes
+        :return: node table
+        """
+        neo4j_ids = np.asarray(list(neo4j_ids), dtype=np.int64)
+        id_order = np.argsort(neo4j_ids, kind='stable')
+
+        if np.any(np.diff(neo4j_ids[id_order]) == 0):
+            raise Exception('duplicate neo4j ids in the node table')
+
+        arrays = {'neo4j_ids': neo4j_ids,
+                  'sorted_neo4j_ids': neo4j_ids[id_order],
+                  'sorted_neo4j_ids_matrix_index': id_order.astype(np.int64)}
+
+        arrays.update(string_table_to_arrays('display_name', display_names))
+        arrays.update(string_table_to_arrays('legacy_id', legacy_ids))
+
+        for name, values in zip(cls.categorical_columns, (node_types, localizations)):
+            categories = {}
+            codes = np.array([categories.setdefault(_value, len(categories))
+                              for _value in values], dtype=np.int32)
+            arrays[name + '_codes'] = codes
+            arrays.update(string_table_to_arrays(name + '_categories', list(categories.keys())))
+
+        return cls(arrays)
+
+    @classmethod
+    def from_dicts(cls,
+                   matrix_index_2_neo4j_id: dict,
+                   neo4j_id_2_display_name: dict,
+                   neo4j_id_2_legacy_id: dict,
+                   neo4j_id_2_node_type: dict,
+                   neo4j_id_2_localization: dict) -> 'NodeTable':
+        """
+        Builds a node table from the legacy id maps. Nodes absent from a property map get
+        a None value for that property.
+
+        :param matrix_index_2_neo4j_id: {matrix index: neo4j id}
+        :param neo4j_id_2_display_name: {neo4j id: display name}
+        :param neo4j_id_2_legacy_id: {neo4j id: legacy id}
+        :param neo4j_id_2_node_type: {neo4j id: node type}
+        :param neo4j_id_2_localization: {neo4j id: localization}
+        :return: node table
+        """
+        neo4j_ids = [matrix_index_2_neo4j_id[_i] for _i in range(len(matrix_index_2_neo4j_id))]
+
+        return cls.from_columns(neo4j_ids,
+                                [neo4j_id_2_display_name.get(_id) for _id in neo4j_ids],
+                                [neo4j_id_2_legacy_id.get(_id) for _id in neo4j_ids],
+                                [neo4j_id_2_node_type.get(_id) for _id in neo4j_ids],
+                                [neo4j_id_2_localization.get(_id) for _id in neo4j_ids])
+
+    def to_arrays(self) -> dict:
+        """
+        :return: {name: numpy array} dict from which the table can be rebuilt, for dump_arrays
+        """
+        return dict(self._arrays)
+
+    def __len__(self):
+        return self.neo4j_ids.shape[0]
+
+    def _positions(self, neo4j_ids) -> Tuple[np.ndarray, np.ndarray]:
+        neo4j_ids = np.asarray(neo4j_ids)
+
+        if neo4j_ids.dtype.kind == 'f':
+            integral = np.mod(neo4j_ids, 1) == 0
+            neo4j_ids = np.where(integral, neo4j_ids, -1)
+        elif neo4j_ids.dtype.kind not in 'iub':
+            neo4j_ids = neo4j_ids.astype(np.int64)
+
+        neo4j_ids = neo4j_ids.astype(np.int64)
+        positions = np.searchsorted(self.sorted_neo4j_ids, neo4j_ids)
+        positions = np.minimum(positions, max(len(self) - 1, 0))
+
+        if len(self) == 0:
+            return positions, np.zeros(neo4j_ids.shape, dtype=bool)
+
+        return positions, self.sorted_neo4j_ids[positions] == neo4j_ids
+
+    def contains(self, neo4j_ids) -> np.ndarray:
+        """
+        :param neo4j_ids: neo4j ids, possibly as integral floats
+        :return: boolean mask of the ids that are in the table
+        """
+        return self._positions(neo4j_ids)[1]
+
+    def ids_to_indexes(self, neo4j_ids) -> np.ndarray:
+        """
+        :param neo4j_ids: neo4j ids, possibly as integral floats
+        :return: matrix indexes of the nodes
+        :raise KeyError: if some of the ids are not in the table
+        """
+        positions, found = self._positions(neo4j_ids)
+
+        if not np.all(found):
+            raise KeyError(np.asarray(neo4j_ids)[~found].tolist())
+
+        return self.sorted_neo4j_ids_matrix_index[positions]
+
+    def indexes_to_ids(self, indexes) -> np.ndarray:
+        """
+        :param indexes: matrix indexes
+        :return: neo4j ids of the nodes
+        """
+        return self.neo4j_ids[indexes]
+
+    def id_to_index(self, neo4j_id) -> int:
+        """
+        :param neo4j_id: neo4j id
+        :return: matrix index of the node
+        :raise KeyError: if the id is not in the table
+        """
+        if not isinstance(neo4j_id, numbers.Real) or \
+                not float(neo4j_id).is_integer() or not len(self):
+            raise KeyError(neo4j_id)
+
+        position = int(np.searchsorted(self.sorted_neo4j_ids, int(neo4j_id)))
+
+        if position == len(self) or self.sorted_neo4j_ids[position] != int(neo4j_id):
+            raise KeyError(neo4j_id)
+
+        return int(self.sorted_neo4j_ids_matrix_index[position])
+
+    def value(self, column: str, index: int) -> Union[str, None]:
+        """
+        :param column: column name, among string_columns and categorical_columns
+        :param index: matrix index of the node
+        :return: value of the column for the node
+        """
+        if column in self.categories:
+            return self.categories[column][self._arrays[column + '_codes'][index]]
+
+        if self._arrays[column + '_null'][index]:
+            return None
+
+        start, stop = self._arrays[column + '_offsets'][index:index + 2]
+        return self._arrays[column + '_bytes'][start:stop].tobytes().decode('utf-8')
+
+    def values(self, column: str, indexes) -> list:
+        """
+        :param column: column name, among string_columns and categorical_columns
+        :param indexes: matrix indexes of the nodes
+        :return: values of the column for the nodes
+        """
+        if column in self.categories:
+            categories = self.categories[column]
+            return [categories[_code] for _code
+                    in self._arrays[column + '_codes'][indexes].tolist()]
+
+        return [self.value(column, _index) for _index in np.asarray(indexes).tolist()]
+
+
+class _IdToIndexView(Mapping):
+    """
+    Read-only {neo4j id: matrix index} view of a node table
+    """
+
+    def __init__(self, table: NodeTable):
+        self._table = table
+
+    def __getitem__(self, neo4j_id):
+        return self._table.id_to_index(neo4j_id)
+
+    def __iter__(self):
+        return iter(self._table.neo4j_ids.tolist())
+
+    def __len__(self):
+        return len(self._table)
+
+
+class _IndexToIdView(Mapping):
+    """
+    Read-only {matrix index: neo4j id} view of a node table
+    """
+
+    def __init__(self, table: NodeTable):
+        self._table = table
+
+    def __getitem__(self, index):
+        if not isinstance(index, numbers.Integral) or not 0 <= index < len(self._table):
+            raise KeyError(index)
+
+        return int(self._table.neo4j_ids[index])
+
+    def __iter__(self):
+        return iter(range(len(self._table)))
+
+    def __len__(self):
+        return len(self._table)
+
+
+class _ColumnView(Mapping):
+    """
+    Read-only {neo4j id: value} view of a column of a node table
+    """
+
+    def __init__(self, table: NodeTable, column: str):
+        self._table = table
+        self._column = column
+
+    def __getitem__(self, neo4j_id):
+        return self._table.value(self._column, self._table.id_to_index(neo4j_id))
+
+    def __iter__(self):
+        return iter(self._table.neo4j_ids.tolist())
+
+    def __len__(self):
+        return len(self._table)
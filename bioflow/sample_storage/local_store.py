@@ -0,0 +1,257 @@
+"""
+Embedded file-backed backend for the sample storage, for machines without a MongoDB server.
+
+Each collection is a directory holding a SQLite database with the scalar fields of the samples,
+used for filtering, and a sub-directory per sample with its binary fields (pickled bytes and
+numpy arrays) as .npy files, memory-mapped upon retrieval.
+"""
+import os
+import json
+import shutil
+import sqlite3
+from uuid import uuid4
+import numpy as np
+
+from bioflow.configs.main_configs import sample_storage_location, pymongo_prefix, \
+    pymongo_suffix
+from bioflow.utils.log_behavior import get_logger
+
+log = get_logger(__name__)
+
+annotome_collection = pymongo_prefix + "UP_r_samples" + pymongo_suffix
+interactome_collection = pymongo_prefix + "Interactome_samples" + pymongo_suffix
+
+# SQLite connections can't be shared with forked processes, so they are pooled per process:
+# {(pid, collection): connection}
+_connections = {}
+
+
+def _collection_location(collection):
+    return os.path.join(sample_storage_location, collection)
+
+
+def _get_connection(collection) -> sqlite3.Connection:
+    """
+    Recovers the connection of the current process to the collection database, creating the
+    database on first use
+
+    :param collection: collection name
+    :return: connection
+    """
+    key = (os.getpid(), collection)
+
+    if key not in _connections:
+        location = _collection_location(collection)
+        if not os.path.isdir(location):
+            os.makedirs(location)
+
+        connection = sqlite3.connect(os.path.join(location, 'samples.sqlite'), timeout=60)
+        connection.execute('CREATE TABLE IF NOT EXISTS samples '
+                           '(sample_id TEXT PRIMARY KEY, fields TEXT NOT NULL)')
+        for field in ['sys_hash', 'active_sample_hash']:
+            connection.execute("CREATE INDEX IF NOT EXISTS samples_%s ON samples "
+                               "(json_extract(fields, '$.%s'))" % (field, field))
+        connection.commit()
+        _connections[key] = connection
+
+    return _connections[key]
+
+
+def _where_clause(filter_dict):
+    """
+    Translates an equality filter into a SQL where clause on the scalar fields. Lists and
+    tuples are matched against the JSON-encoded list fields
+
+    :param filter_dict: {field: value} dict
+    :return: where clause, parameters
+    """
+    clauses = []
+    parameters = []
+
+    for field, value in filter_dict.items():
+        if not field.isidentifier() or isinstance(value, dict):
+            raise Exception('local sample storage only supports equality filters on fields, '
+                            'got %s: %s' % (field, value))
+
+        if value is None:
+            clauses.append("json_extract(fields, '$.%s') IS NULL" % field)
+        elif isinstance(value, (list, tuple)):
+            # json_extract returns arrays as minified JSON text
+            clauses.append("(json_type(fields, '$.%s') = 'array' AND "
+                           "json_extract(fields, '$.%s') = json(?))" % (field, field))
+            parameters.append(json.dumps(value, default=lambda _value: _value.item()))
+        else:
+            clauses.append("json_extract(fields, '$.%s') = ?" % field)
+            parameters.append(value.item() if isinstance(value, np.generic) else value)
+
+    if not clauses:
+        return '', parameters
+
+    return ' WHERE ' + ' AND '.join(clauses), parameters
+
+
+def insert_sample(collection, payload_dict):
+    """
+    Adds a sample. Binary fields are written first, so that a sample is never visible with
+    partial contents.
+
+    :param collection: collection name
+    :param payload_dict: sample contents
+    """
+    sample_id = uuid4().hex
+    sample_location = os.path.join(_collection_location(collection), sample_id)
+    temporary_location = sample_location + '.tmp'
+    os.makedirs(temporary_location)
+
+    fields = {}
+    binary_fields = {}
+
+    for field, value in payload_dict.items():
+        if isinstance(value, (bytes, bytearray)):
+            binary_fields[field] = 'bytes'
+            value = np.frombuffer(value, dtype=np.uint8)
+        elif isinstance(value, np.ndarray):
+            binary_fields[field] = 'array'
+        else:
+            fields[field] = value.item() if isinstance(value, np.generic) else value
+            continue
+
+        np.save(os.path.join(temporary_location, field + '.npy'), value, allow_pickle=False)
+
+    fields['_binary_fields'] = binary_fields
+    os.replace(temporary_location, sample_location)
+
+    connection = _get_connection(collection)
+    with connection:
+        connection.execute('INSERT INTO samples (sample_id, fields) VALUES (?, ?)',
+                           (sample_id, json.dumps(fields)))
+
+
+def find_samples(collection, filter_dict, projection=None):
+    """
+    Finds the samples matching the filter. Scalar fields are always retrieved.
+
+    :param collection: collection name
+    :param filter_dict: {field: value} dict of the values the samples must have
+    :param projection: names of the binary fields to retrieve. All fields are retrieved if None
+    :return: iterator over the matching samples
+    """
+    where_clause, parameters = _where_clause(filter_dict)
+    rows = _get_connection(collection).execute(
+        'SELECT sample_id, fields FROM samples' + where_clause, parameters).fetchall()
+
+    for sample_id, fields in rows:
+        sample = json.loads(fields)
+        sample_location = os.path.join(_collection_location(collection), sample_id)
+
+        for field, kind in sample.pop('_binary_fields').items():
+            if projection is not None and field not in projection:
+                continue
+
+            array = np.load(os.path.join(sample_location, field + '.npy'), mmap_mode='r',
+                            allow_pickle=False)
+            sample[field] = array.tobytes() if kind == 'bytes' else array
+
+        sample['_id'] = sample_id
+        yield sample
+
+
+def count_samples(collection, filter_dict):
+    """
+    Number of samples matching the filter
+
+    :param collection: collection name
+    :param filter_dict: {field: value} dict of the values the samples must have
+    :return: number of samples
+    """
+    where_clause, parameters = _where_clause(filter_dict)
+    return _get_connection(collection).execute(
+        'SELECT COUNT(*) FROM samples' + where_clause, parameters).fetchone()[0]
+
+
+def drop_samples(collection):
+    """
+    Drops all the samples of the collection
+
+    :param collection: collection name
+    """
+    connection = _connections.pop((os.getpid(), collection), None)
+    if connection is not None:
+        connection.close()
+
+    location = _collection_location(collection)
+    if os.path.isdir(location):
+        log.info('dropping local samples in %s', location)
+        shutil.rmtree(location)
+
+
+def drop_all_annotome_rand_samp():
+    """ drops all annotome samples"""
+    drop_samples(annotome_collection)
+
+
+def drop_all_interactome_rand_samp():
+    "drops all interactome samples"
+    drop_samples(interactome_collection)
+
+
+def insert_annotome_rand_samp(payload_dict):
+    """
+    Adds a sample from annotome run
+
+    :param payload_dict:  sample contents
+    :return:
+    """
+    insert_sample(annotome_collection, payload_dict)
+
+
+def insert_interactome_rand_samp(payload_dict):
+    """
+    Adds a sample from the interactome run
+
+    :param payload_dict: sample contents
+    :return:
+    """
+    insert_sample(interactome_collection, payload_dict)
+
+
+def find_annotome_rand_samp(filter_dict, projection=None):
+    """
+    Finds a sample in the annotome database
+
+    :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
+    :return:
+    """
+    return find_samples(annotome_collection, filter_dict, projection)
+
+
+def find_interactome_rand_samp(filter_dict, projection=None):
+    """
+    Finds a sample in the interactome database
+
+    :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
+    :return:
+    """
+    return find_samples(interactome_collection, filter_dict, projection)
+
+
+def count_annotome_rand_samp(filter_dict):
+    """
+    Number of samples in the annotome that satisfy the filtering conditions
+
+    :param filter_dict: arguments dict according to which perform the filtering
+    :return:
+    """
+    return count_samples(annotome_collection, filter_dict)
+
+
+def count_interactome_rand_samp(filter_dict):
+    """
+    Number of samples in the interactome that satisfy the filtering conditions
+
+    :param filter_dict: arguments dict according to which perform the filtering
+    :return:
+    """
+    return count_samples(interactome_collection, filter_dict)
@@ -1,32 +1,62 @@
 """
 thinly wrapped MongoDB backend for the sample storage
 """
+import os
+import numpy as np
 from pymongo import MongoClient
 from bioflow.configs.main_configs import mongo_db_url, pymongo_prefix, pymongo_suffix
 
-
-# Original module ported from main_configs
-client = MongoClient(mongo_db_url)
-db = client.BioFlow_database
 # REFACTOR: [Better database]: change mongoDB names to something more intuitive
 
-annotome_rand_samp = db[pymongo_prefix + "UP_r_samples" + pymongo_suffix]
-interactome_rand_samp_db = db[pymongo_prefix + "Interactome_samples" + pymongo_suffix]
+# MongoClient is not fork-safe, so a client can't be created at import and shared with the
+# sampling processes. Instead, each process lazily creates its own client, whose connection
+# pool is then re-used by all the calls in that process: {pid: client}
+_clients = {}
+
+
+def get_client() -> MongoClient:
+    """recovers the client of the current process, creating it upon the first call"""
+    pid = os.getpid()
 
+    if pid not in _clients:
+        _clients[pid] = MongoClient(mongo_db_url)
+
+    return _clients[pid]
 
-# This refactoring is done to avoid problems with forks in python multithreading. Given writes
-# and reads are relatively rare in our architecture, the performance penalty should be reasonable.
 
 def loc_annotome_rand_samp():
     """loads a session for database connection for annotome samples"""
-    client = MongoClient(mongo_db_url)
-    return client.BioFlow_database[pymongo_prefix + "UP_r_samples" + pymongo_suffix]
+    return get_client().BioFlow_database[pymongo_prefix + "UP_r_samples" + pymongo_suffix]
 
 
 def loc_interactome_rand_samp():
     """loads a session for database connection for interactome samples"""
-    client = MongoClient(mongo_db_url)
-    return client.BioFlow_database[pymongo_prefix + "Interactome_samples" + pymongo_suffix]
+    return get_client().BioFlow_database[pymongo_prefix + "Interactome_samples" + pymongo_suffix]
+
+
+def _encode_arrays(payload_dict):
+    """numpy arrays are stored as raw bytes along with their dtype and shape"""
+    return {field: {'__ndarray__': True, 'dtype': value.dtype.str, 'shape': list(value.shape),
+                    'data': value.tobytes()}
+            if isinstance(value, np.ndarray) else value
+            for field, value in payload_dict.items()}
+
+
+def _decode_arrays(document):
+    """reverts _encode_arrays"""
+    for field, value in document.items():
+        if isinstance(value, dict) and value.get('__ndarray__'):
+            document[field] = np.frombuffer(value['data'], dtype=np.dtype(value['dtype'])
+                                            ).reshape(value['shape'])
+    return document
+
+
+def _find(collection, filter_dict, projection):
+    if projection is not None:
+        projection = {field: 1 for field in projection}
+
+    # => iterating through the cursor closes it
+    return (_decode_arrays(document) for document in collection.find(filter_dict, projection))
 
 
 def drop_all_annotome_rand_samp():
@@ -46,7 +76,7 @@ def insert_annotome_rand_samp(payload_dict):
     :param payload_dict:  sample contents
     :return:
     """
-    loc_annotome_rand_samp().insert_one(payload_dict)
+    loc_annotome_rand_samp().insert_one(_encode_arrays(payload_dict))
 
 
 def insert_interactome_rand_samp(payload_dict):
@@ -56,29 +86,29 @@ def insert_interactome_rand_samp(payload_dict):
     :param payload_dict: sample contents
     :return:
     """
-    loc_interactome_rand_samp().insert_one(payload_dict)
+    loc_interactome_rand_samp().insert_one(_encode_arrays(payload_dict))
 
 
-def find_annotome_rand_samp(filter_dict):
+def find_annotome_rand_samp(filter_dict, projection=None):
     """
     Finds a sample in the annotome database
 
     :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
     :return:
     """
-    return loc_annotome_rand_samp().find(filter_dict)
-    # => iterate through the cursor to close the connection
+    return _find(loc_annotome_rand_samp(), filter_dict, projection)
 
 
-def find_interactome_rand_samp(filter_dict):
+def find_interactome_rand_samp(filter_dict, projection=None):
     """
     Finds a sample in the interactome database
 
     :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
     :return:
     """
-    return loc_interactome_rand_samp().find(filter_dict)
-    # => iterate through the cursor to close the connection
+    return _find(loc_interactome_rand_samp(), filter_dict, projection)
 
 
 def count_annotome_rand_samp(filter_dict):
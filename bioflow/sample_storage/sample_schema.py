@@ -0,0 +1,165 @@
+"""
+Columnar schema of the stored random samples. Instead of pickled dicts and current matrices,
+node currents are stored as a float32 vector aligned to the matrix indexes and the potential
+differences between the sample nodes as parallel index/value arrays. The full edge current
+matrix is only stored if the `store_sample_current_matrices` config is set.
+
+Samples stored before the columnar schema (without a schema_version) are still decoded.
+"""
+import pickle
+import numpy as np
+import scipy.sparse as spmat
+from typing import Union, List, Tuple, Iterable, Iterator
+
+from bioflow.configs.main_configs import store_sample_current_matrices
+
+sample_schema_version = 2
+
+# fields to project upon retrieval, for each use of the samples
+node_currents_fields = ['schema_version', 'node_currents', 'currents']
+voltages_fields = ['schema_version', 'voltage_indexes', 'voltage_values', 'voltages']
+
+
+def encode_rand_sample(metadata: dict,
+                       active_up_sample: List[int],
+                       active_weighted_sample: List[Tuple[int, float]],
+                       secondary_weighted_sample: Union[List[Tuple[int, float]], None],
+                       node_currents: np.ndarray,
+                       voltage_indexes: np.ndarray,
+                       voltage_values: np.ndarray,
+                       current_matrix: Union[spmat.spmatrix, None] = None) -> dict:
+    """
+    Builds the payload of a random sample for storage
+
+    :param metadata: scalar fields used to retrieve the sample (hashes, sampling policy, ...)
+    :param active_up_sample: ids of the nodes in the sample
+    :param active_weighted_sample: (id, weight) of the primary sample nodes
+    :param secondary_weighted_sample: (id, weight) of the secondary sample nodes or None
+    :param node_currents: current through each node, aligned to the matrix indexes
+    :param voltage_indexes: (pairs, 2) matrix indexes of the sample node pairs
+    :param voltage_values: potential difference between the nodes of each pair
+    :param current_matrix: edge current matrix, stored only if configured
+    :return: payload dict
+    """
+    payload = dict(metadata)
+    payload.update({
+        'schema_version': sample_schema_version,
+        'UPs': np.array(active_up_sample, dtype=np.int64),
+        'sample': np.array(active_weighted_sample, dtype=np.float64).reshape(-1, 2),
+        'sec_sample': None if secondary_weighted_sample is None
+        else np.array(secondary_weighted_sample, dtype=np.float64).reshape(-1, 2),
+        'node_currents': np.asarray(node_currents, dtype=np.float32),
+        'voltage_indexes': np.asarray(voltage_indexes, dtype=np.int32).reshape(-1, 2),
+        'voltage_values': np.asarray(voltage_values, dtype=np.float64)})
+
+    if store_sample_current_matrices and current_matrix is not None:
+        current_matrix = spmat.csr_matrix(current_matrix)
+        payload.update({'current_data': current_matrix.data.astype(np.float32),
+                        'current_indices': current_matrix.indices.astype(np.int32),
+                        'current_indptr': current_matrix.indptr.astype(np.int64),
+                        'current_shape': list(current_matrix.shape)})
+
+    return payload
+
+
+def _labels(index_2_label, indexes: np.ndarray) -> np.ndarray:
+    if isinstance(index_2_label, np.ndarray):
+        return index_2_label[indexes]
+
+    return np.array([index_2_label[_index] for _index in indexes.ravel().tolist()]
+                    ).reshape(indexes.shape)
+
+
+def decode_node_currents(sample: dict, index_2_label) -> dict:
+    """
+    Recovers the node currents of a stored sample
+
+    :param sample: stored sample, with at least the node_currents_fields
+    :param index_2_label: array or mapping from matrix indexes to node ids
+    :return: {node id: current}
+    """
+    if sample.get('schema_version', 1) < 2:
+        return pickle.loads(sample['currents'])[1]
+
+    node_currents = np.asarray(sample['node_currents'], dtype=np.float64)
+    node_ids = _labels(index_2_label, np.arange(node_currents.shape[0]))
+
+    return dict(zip(node_ids.tolist(), node_currents.tolist()))
+
+
+def decode_node_current_vector(sample: dict, label_2_index, node_count: int) -> np.ndarray:
+    """
+    Recovers the node currents of a stored sample as a vector aligned to the matrix indexes
+
+    :param sample: stored sample, with at least the node_currents_fields
+    :param label_2_index: mapping from node ids to matrix indexes, used for legacy samples
+    :param node_count: number of nodes in the matrix
+    :return: (node_count, ) currents
+    """
+    if sample.get('schema_version', 1) < 2:
+        node_currents = pickle.loads(sample['currents'])[1]
+        vector = np.zeros(node_count)
+        vector[[label_2_index[_id] for _id in node_currents.keys()]] = \
+            list(node_currents.values())
+        return vector
+
+    return np.asarray(sample['node_currents'], dtype=np.float64)
+
+
+def node_current_chunks(samples: Iterable[dict], label_2_index, node_count: int,
+                        chunk_size: int) -> Iterator[np.ndarray]:
+    """
+    Streams the node currents of stored samples, retrieved from any sample storage backend,
+    as chunks of aligned vectors
+
+    :param samples: stored samples, with at least the node_currents_fields
+    :param label_2_index: mapping from node ids to matrix indexes, used for legacy samples
+    :param node_count: number of nodes in the matrix
+    :param chunk_size: max number of samples per chunk
+    :return: iterator over (samples, node_count) arrays of currents
+    """
+    chunk = []
+
+    for sample in samples:
+        chunk.append(decode_node_current_vector(sample, label_2_index, node_count))
+
+        if len(chunk) == chunk_size:
+            yield np.vstack(chunk)
+            chunk = []
+
+    if chunk:
+        yield np.vstack(chunk)
+
+
+def decode_voltages(sample: dict, index_2_label) -> dict:
+    """
+    Recovers the potential differences between the node pairs of a stored sample
+
+    :param sample: stored sample, with at least the voltages_fields
+    :param index_2_label: array or mapping from matrix indexes to node ids
+    :return: {(node id, node id): potential difference}, with sorted node id pairs
+    """
+    if sample.get('schema_version', 1) < 2:
+        return pickle.loads(sample['voltages'])
+
+    pair_ids = np.sort(_labels(index_2_label, np.asarray(sample['voltage_indexes'])), axis=1)
+
+    return dict(zip(map(tuple, pair_ids.tolist()),
+                    np.asarray(sample['voltage_values']).tolist()))
+
+
+def decode_current_matrix(sample: dict) -> Union[spmat.csr_matrix, None]:
+    """
+    Recovers the edge current matrix of a stored sample, if it was stored
+
+    :param sample: stored sample
+    :return: edge current matrix or None
+    """
+    if sample.get('schema_version', 1) < 2:
+        return pickle.loads(sample['currents'])[0]
+
+    if 'current_data' not in sample:
+        return None
+
+    return spmat.csr_matrix((sample['current_data'], sample['current_indices'],
+                             sample['current_indptr']), shape=tuple(sample['current_shape']))
@@ -0,0 +1,97 @@
+"""
+Interface to the sample storage, dispatching to the backend selected by the `sample_storage`
+server config: 'mongodb' (MongoDB server) or 'local' (embedded SQLite and .npy files).
+Backends are modules implementing the functions below.
+"""
+import importlib
+from bioflow.configs.main_configs import sample_storage_backend
+
+
+storage_backends = {'mongodb': 'bioflow.sample_storage.mongodb',
+                    'local': 'bioflow.sample_storage.local_store'}
+
+
+def get_backend():
+    """
+    Imports the configured backend module. The import is delayed, so that the MongoDB driver
+    is only needed when it is used.
+
+    :return: backend module
+    """
+    if sample_storage_backend not in storage_backends:
+        raise Exception('sample storage backend %s is not supported. Supported backends: %s'
+                        % (sample_storage_backend, list(storage_backends.keys())))
+
+    return importlib.import_module(storage_backends[sample_storage_backend])
+
+
+def drop_all_annotome_rand_samp():
+    """ drops all annotome samples"""
+    get_backend().drop_all_annotome_rand_samp()
+
+
+def drop_all_interactome_rand_samp():
+    "drops all interactome samples"
+    get_backend().drop_all_interactome_rand_samp()
+
+
+def insert_annotome_rand_samp(payload_dict):
+    """
+    Adds a sample from annotome run
+
+    :param payload_dict:  sample contents
+    :return:
+    """
+    get_backend().insert_annotome_rand_samp(payload_dict)
+
+
+def insert_interactome_rand_samp(payload_dict):
+    """
+    Adds a sample from the interactome run
+
+    :param payload_dict: sample contents
+    :return:
+    """
+    get_backend().insert_interactome_rand_samp(payload_dict)
+
+
+def find_annotome_rand_samp(filter_dict, projection=None):
+    """
+    Finds a sample in the annotome database
+
+    :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
+    :return:
+    """
+    return get_backend().find_annotome_rand_samp(filter_dict, projection)
+
+
+def find_interactome_rand_samp(filter_dict, projection=None):
+    """
+    Finds a sample in the interactome database
+
+    :param filter_dict: arguments dict according to which perform the search
+    :param projection: names of the fields to retrieve. All fields are retrieved if None
+    :return:
+    """
+    return get_backend().find_interactome_rand_samp(filter_dict, projection)
+
+
+def count_annotome_rand_samp(filter_dict):
+    """
+    Number of samples in the annotome that satisfy the filtering conditions
+
+    :param filter_dict: arguments dict according to which perform the filtering
+    :return:
+    """
+    return get_backend().count_annotome_rand_samp(filter_dict)
+
+
+def count_interactome_rand_samp(filter_dict):
+    """
+    Number of samples in the interactome that satisfy the filtering conditions
+
+    :param filter_dict: arguments dict according to which perform the filtering
+    :return:
+    """
+    return get_backend().count_interactome_rand_samp(filter_dict)
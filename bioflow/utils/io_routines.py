@@ -5,8 +5,14 @@ from pickle import load, dump
 from csv import reader
 from bioflow.configs.main_configs import Dumps
 from time import time
+import os
+import json
 import subprocess
 import numpy as np
+import scipy.sparse as spmat
+
+# version of the binary dumps layout. Dumps with a different version are ignored
+binary_dump_version = 1
 
 
 def _get_git_revision_hash():
@@ -60,6 +66,123 @@ def undump_object(dump_filename):
     # print(dump_filename)
     return load(dump_file)
 
+def dump_arrays(dump_directory, arrays, metadata=None):
+    """
+    Dumps a set of named numpy arrays as .npy files in a directory, along with a versioned
+    manifest. The manifest is written last, so that partial dumps are never loaded.
+
+    :param dump_directory: directory where the arrays will be dumped
+    :param arrays: {name: numpy array} dict
+    :param metadata: json-serializable metadata to store in the manifest
+    """
+    if not os.path.isdir(dump_directory):
+        os.makedirs(dump_directory)
+
+    manifest_location = os.path.join(dump_directory, 'manifest.json')
+    if os.path.isfile(manifest_location):
+        os.remove(manifest_location)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(dump_directory, name + '.npy'), np.asarray(array),
+                allow_pickle=False)
+
+    with open(manifest_location, 'wt') as manifest_file:
+        json.dump({'version': binary_dump_version,
+                   'arrays': sorted(arrays.keys()),
+                   'metadata': metadata}, manifest_file)
+
+
+def undump_arrays(dump_directory, mmap_mode='r'):
+    """
+    Loads a set of named numpy arrays dumped with dump_arrays, memory-mapping them
+
+    :param dump_directory: directory where the arrays were dumped
+    :param mmap_mode: numpy memory map mode ('r' read-only, 'c' copy-on-write, None to read)
+    :return: {name: numpy array} dict and metadata, or None if there is no dump with the
+        current layout version
+    """
+    manifest_location = os.path.join(dump_directory, 'manifest.json')
+
+    if not os.path.isfile(manifest_location):
+        return None
+
+    with open(manifest_location, 'rt') as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get('version') != binary_dump_version:
+        return None
+
+    arrays = {name: np.load(os.path.join(dump_directory, name + '.npy'),
+                            mmap_mode=mmap_mode, allow_pickle=False)
+              for name in manifest['arrays']}
+
+    return arrays, manifest['metadata']
+
+
+def sparse_matrix_to_arrays(name, matrix):
+    """
+    Converts a sparse matrix into named CSR arrays, for dump_arrays
+
+    :param name: name of the matrix
+    :param matrix: sparse matrix
+    :return: {name: numpy array} dict
+    """
+    matrix = spmat.csr_matrix(matrix)
+    return {name + '_data': matrix.data,
+            name + '_indices': matrix.indices,
+            name + '_indptr': matrix.indptr,
+            name + '_shape': np.array(matrix.shape, dtype=np.int64)}
+
+
+def arrays_to_sparse_matrix(arrays, name):
+    """
+    Re-assembles a CSR matrix from named arrays, without copying them
+
+    :param arrays: {name: numpy array} dict
+    :param name: name of the matrix
+    :return: CSR matrix
+    """
+    return spmat.csr_matrix((arrays[name + '_data'],
+                             arrays[name + '_indices'],
+                             arrays[name + '_indptr']),
+                            shape=tuple(arrays[name + '_shape'].tolist()),
+                            copy=False)
+
+
+def string_table_to_arrays(name, strings):
+    """
+    Converts a list of strings into an offset-indexed table of utf-8 bytes, for dump_arrays.
+    None values are preserved.
+
+    :param name: name of the string table
+    :param strings: list of strings or None
+    :return: {name: numpy array} dict
+    """
+    encoded = [b'' if _string is None else str(_string).encode('utf-8') for _string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(_bytes) for _bytes in encoded])
+
+    return {name + '_bytes': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            name + '_offsets': offsets,
+            name + '_null': np.array([_string is None for _string in strings], dtype=bool)}
+
+
+def arrays_to_string_list(arrays, name):
+    """
+    Decodes an offset-indexed string table
+
+    :param arrays: {name: numpy array} dict
+    :param name: name of the string table
+    :return: list of strings or None
+    """
+    raw_bytes = arrays[name + '_bytes'].tobytes()
+    offsets = arrays[name + '_offsets'].tolist()
+    nulls = arrays[name + '_null'].tolist()
+
+    return [None if _null else raw_bytes[_start:_stop].decode('utf-8')
+            for _start, _stop, _null in zip(offsets[:-1], offsets[1:], nulls)]
+
+
 def get_source_bulbs_ids():
     """ retrieves bulbs ids for the elements for the analyzed group """
     return undump_object(Dumps.analysis_set_bulbs_ids)
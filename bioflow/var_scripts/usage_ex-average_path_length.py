@@ -12,7 +12,8 @@ from csv import reader as csv_reader
 # from bioflow.configs.main_configs import interactome_rand_samp_db  # deprecated
 from bioflow.utils.log_behavior import get_logger
 from bioflow.molecular_network.InteractomeInterface import InteractomeInterface
-from bioflow.sample_storage.mongodb import find_interactome_rand_samp, count_interactome_rand_samp
+from bioflow.sample_storage.sample_store import find_interactome_rand_samp, count_interactome_rand_samp
+from bioflow.sample_storage.sample_schema import decode_node_currents, decode_voltages
 from bioflow.algorithms_bank.deprecated_clustering_routines import deprecated_perform_clustering
 from bioflow.configs.main_configs import Dumps
 from bioflow.utils.top_level import map_and_save_gene_ids
@@ -66,8 +67,9 @@ for i, sample in enumerate(background_samples):
     # if i > 10:
     #     break
 
-    _, nodes_current_dict = pickle.loads(sample['currents'])
-    tensions = pickle.loads(sample['voltages'])
+    nodes_current_dict = decode_node_currents(sample,
+                                              interactome_interface_instance.node_table.neo4j_ids)
+    tensions = decode_voltages(sample, interactome_interface_instance.node_table.neo4j_ids)
 
     io_nodes, tension = (tensions.keys()[0], tensions.values()[0])
     # this actually should be a multiplication - we divide to normalize to 1 volt, after counting for 1 amp
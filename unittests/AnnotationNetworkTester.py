@@ -0,0 +1,69 @@
+"""
+Tests the propagation of the UP annotations through the GO terms hierarchy
+"""
+import unittest
+from collections import defaultdict
+from scipy.sparse import lil_matrix
+
+from bioflow.annotation_network.BioKnowledgeInterface import GeneOntologyInterface
+
+
+class GoReachTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # terms 10 <- 11 <- 12 <- 14 and 11 <- 13, with 11 regulating 13: a 11 <-> 13 cycle
+        go_terms = [10, 11, 12, 13, 14]
+        cls.go_interface = GeneOntologyInterface(correction_factor=(1, 1))
+        cls.go_interface.node_id_2_mat_idx = dict((term, idx) for idx, term in enumerate(go_terms))
+        cls.go_interface.mat_idx_2_note_id = dict(enumerate(go_terms))
+        cls.go_interface._limiter_reachable_nodes_dict = dict((term, ([], [], [], []))
+                                                              for term in go_terms)
+
+        # dir_adj_matrix[i, j] is set if j is more general than i
+        dir_adj_matrix = lil_matrix((5, 5))
+        for more_specific, more_general in [(1, 0), (2, 1), (3, 1), (1, 3), (4, 2)]:
+            dir_adj_matrix[more_specific, more_general] = 1
+        cls.go_interface.dir_adj_matrix = dir_adj_matrix
+
+        cls.go_interface.term_2_entities_neo4j_ids = defaultdict(list, {14: [100], 13: [101],
+                                                                        12: [102]})
+        entity_2_terms_neo4j_ids = {100: [14], 101: [13], 102: [12]}
+        cls.go_interface.entity_2_terms_neo4j_ids = defaultdict(list, entity_2_terms_neo4j_ids)
+        cls.go_interface.known_up_ids = cls.go_interface.entity_2_terms_neo4j_ids.keys()
+
+        cls.go_interface.get_go_reach()
+
+    @staticmethod
+    def _sorted_steps(step_reach):
+        return dict((key, dict((step, sorted(reached)) for step, reached in steps.items()))
+                    for key, steps in step_reach.items())
+
+    def test_go_2_up_step_reach(self):
+        self.assertDictEqual(
+            self._sorted_steps(self.go_interface._limiter_go_2_up_step_reachable_nodes),
+            {10: {3: [100], 2: [101, 102]},
+             11: {2: [100], 1: [101, 102]},
+             12: {1: [100], 0: [102]},
+             13: {3: [100], 0: [101], 2: [102]},
+             14: {0: [100]}})
+
+    def test_up_2_go_step_reach(self):
+        self.assertDictEqual(
+            self._sorted_steps(self.go_interface._limiter_up_2_go_step_reachable_nodes),
+            {100: {0: [14], 1: [12], 2: [11], 3: [10, 13]},
+             101: {0: [13], 1: [11], 2: [10]},
+             102: {0: [12], 1: [11], 2: [10, 13]}})
+
+    def test_reach(self):
+        go_2_up = self.go_interface._limiter_go_2_up_reachable_nodes
+        self.assertDictEqual(dict((term, sorted(ups)) for term, ups in go_2_up.items()),
+                             {10: [100, 101, 102], 11: [100, 101, 102], 12: [100, 102],
+                              13: [100, 101, 102], 14: [100]})
+        up_2_go = self.go_interface._limiter_up_2_go_reachable_nodes
+        self.assertDictEqual(dict((up, sorted(terms)) for up, terms in up_2_go.items()),
+                             {100: [10, 11, 12, 13, 14], 101: [10, 11, 13], 102: [10, 11, 12, 13]})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,16 @@
 import os
 import unittest
 import numpy as np
-from scipy.sparse import csc_matrix, triu
+from scipy.sparse import csc_matrix, lil_matrix, triu, coo_matrix, diags
 import warnings
 from bioflow.algorithms_bank import conduction_routines as cr
+from bioflow.algorithms_bank import parallel_conduction_routines as pcr
+from bioflow.algorithms_bank import flow_calculation_methods as fcm
+from bioflow.algorithms_bank.solver_caches import NodePotentialCache, potential_cache, \
+    ReachFactorCache, reach_factor_cache, LowRankUpdatedSolver, get_shared_solver, \
+    clear_factor_cache
+from bioflow.configs.main_configs import line_loss
+import scikits.sparse.cholmod as chmd
 
 
 class ConductionRoutinesTester(unittest.TestCase):
@@ -21,6 +28,13 @@ class ConductionRoutinesTester(unittest.TestCase):
             cls.test_laplacian[0, 2] = -1
             cls.test_laplacian[2, 0] = -1
 
+        # GO chain 0-1-2, UPs 3, 4, 5 annotated to it
+        annotome_laplacian = np.zeros((6, 6))
+        for i, j in [(0, 1), (1, 2), (3, 0), (4, 1), (5, 2), (5, 1)]:
+            annotome_laplacian[i, j] = annotome_laplacian[j, i] = -1
+        annotome_laplacian -= np.diag(annotome_laplacian.sum(axis=1))
+        cls.annotome_laplacian = csc_matrix(annotome_laplacian)
+
     def test_sparse_abs(self):
         ref = np.abs(self.test_laplacian.toarray())
         calc = cr.sparse_abs(self.test_laplacian).toarray()
@@ -83,6 +97,35 @@ class ConductionRoutinesTester(unittest.TestCase):
     #     calc = memoizer[(0, 2)]
     #     self.assertTrue(np.mean(np.abs(calc - chm3)) < 1e-9)
 
+    def test_build_adjacency_and_laplacian(self):
+        # duplicate (0, 1), reversed (1, 0) and (3, 2) edges
+        edges = [(0, 1, 1., 2.), (1, 2, 0.5, 1.), (0, 1, 2., 0.5), (1, 0, 1., 1.),
+                 (2, 3, 3., 4.), (3, 2, 1., 1.), (4, 0, 0.25, 0.1)]
+        from_indexes, to_indexes, adjacency_weights, laplacian_weights = \
+            [np.array(column) for column in zip(*edges)]
+
+        # per-edge loop the matrices used to be built with
+        reference_adjacency = lil_matrix((6, 6))
+        reference_laplacian = lil_matrix((6, 6))
+        for from_idx, to_idx, adj_weight, lapl_weight in edges:
+            reference_adjacency[from_idx, to_idx] += adj_weight
+            reference_adjacency[to_idx, from_idx] += adj_weight
+            reference_laplacian[from_idx, to_idx] -= lapl_weight
+            reference_laplacian[to_idx, from_idx] -= lapl_weight
+            reference_laplacian[from_idx, from_idx] += lapl_weight
+            reference_laplacian[to_idx, to_idx] += lapl_weight
+
+        adjacency, laplacian = cr.build_adjacency_and_laplacian(
+            6, from_indexes.astype(int), to_indexes.astype(int),
+            adjacency_weights, laplacian_weights)
+
+        self.assertEqual(adjacency.format, 'csr')
+        self.assertEqual(laplacian.format, 'csr')
+        self.assertListEqual(adjacency.toarray().tolist(), reference_adjacency.toarray().tolist())
+        self.assertListEqual(laplacian.toarray().tolist(), reference_laplacian.toarray().tolist())
+        self.assertEqual(adjacency.nnz, reference_adjacency.nnz)
+        self.assertEqual(laplacian.nnz, reference_laplacian.nnz)
+
     def test_laplacian_reachable_filter(self):
         chm = np.zeros((4, 4))
         chm[0, 0] = 1
@@ -102,6 +145,210 @@ class ConductionRoutinesTester(unittest.TestCase):
         calc_m = calc_m.toarray()
         self.assertTrue(np.mean(np.abs(calc_m - chm)) < 1e-9)  # FAILING
 
+    def test_reach_factor_cache(self):
+        ref, ref_diff = cr.group_edge_current_with_limitations(self.test_laplacian, (0, 1),
+                                                               [0, 1, 2])
+        misses = reach_factor_cache.misses
+        for _ in range(2):
+            calc, diff = cr.group_edge_current_with_limitations(self.test_laplacian, (0, 1),
+                                                                [2, 1, 0, 2],
+                                                                reach_cache_key=('test', 0))
+            self.assertTrue(np.max(np.abs(calc.toarray() - ref.toarray())) < 1e-9)
+            self.assertAlmostEqual(diff, ref_diff)
+        self.assertEqual(reach_factor_cache.misses - misses, 1)
+
+        bounded_cache = ReachFactorCache(10)
+        bounded_cache.get_factor(('test', 0), np.array([0, 1]),
+                                 lambda: (csc_matrix(np.eye(2)), None))
+        self.assertEqual(bounded_cache.current_bytes, 0)
+        reach_factor_cache.clear()
+
+    def test_reach_factor_cache_shared_reach(self):
+        misses, hits = reach_factor_cache.misses, reach_factor_cache.hits
+        for pair in [(3, 4), (3, 5), (5, 4)]:
+            ref, ref_diff = cr.group_edge_current_with_limitations(self.annotome_laplacian, pair,
+                                                                   [0, 1, 2])
+            calc, diff = cr.group_edge_current_with_limitations(self.annotome_laplacian, pair,
+                                                                [0, 1, 2],
+                                                                reach_cache_key=('test', 1))
+            self.assertTrue(np.max(np.abs(calc.toarray() - ref.toarray())) < 1e-9)
+            self.assertAlmostEqual(diff, ref_diff)
+        self.assertEqual(reach_factor_cache.misses - misses, 1)
+        self.assertEqual(reach_factor_cache.hits - hits, 2)
+        reach_factor_cache.clear()
+
+    def test_parallel_reach_limited_flow_calc(self):
+        laplacian = self.annotome_laplacian
+        reach_matrix = csc_matrix((np.ones(7), ([0, 1, 2, 1, 2, 1, 2], [3, 3, 3, 4, 4, 5, 5])),
+                                  shape=(6, 6))
+        index_pairs = fcm.as_pair_array([((3, 1.), (4, 1.)), ((3, 1.), (5, 2.)),
+                                         ((4, 1.), (5, 0.5))])
+
+        ref_rows, ref_cols, ref_values, ref_voltages = \
+            cr.reach_limited_flow_calc(laplacian, index_pairs, reach_matrix)
+        rows, cols, values, voltages = \
+            pcr.parallel_reach_limited_flow_calc(laplacian, index_pairs, reach_matrix, 2)
+
+        ref = csc_matrix((ref_values, (ref_rows, ref_cols)), shape=(6, 6)).toarray()
+        calc = csc_matrix((values, (rows, cols)), shape=(6, 6)).toarray()
+        self.assertTrue(np.max(np.abs(calc - ref)) < 1e-9)
+        self.assertListEqual(sorted(voltages.keys()), sorted(ref_voltages.keys()))
+        for key, value in ref_voltages.items():
+            self.assertAlmostEqual(voltages[key], value)
+
+    def test_batched_flow_calc(self):
+        pairs = [((0, 1.), (1, 1.)), ((0, 2.), (2, 1.)), ((1, 1.), (2, 0.5))]
+        ref = np.zeros((4, 4))
+        for (i, w_i), (j, w_j) in pairs:
+            potential_diff, current_upper = cr.edge_current_iteration(self.test_laplacian, (i, j))
+            ref += cr.sparse_abs(current_upper / potential_diff).toarray() * (w_i + w_j) / 2.
+        ref = np.triu(ref)
+
+        calc, voltages = cr.batched_flow_calc(self.test_laplacian, pairs, None,
+                                              potential_diffs_remembered=True, batch_size=2)
+        self.assertTrue(np.max(np.abs(calc.toarray() - ref)) < 1e-9)
+        self.assertListEqual(sorted(voltages.keys()), [(0, 1), (0, 2), (1, 2)])
+
+        # pairs streamed in chunks, as main_flow_calc_loop passes them
+        chunks = fcm.flow_pair_chunks(fcm.general_flow, [(0, 1.), (1, 1.), (2, 0.5)], chunk_size=2)
+        streamed, voltages = cr.batched_flow_calc(self.test_laplacian, chunks, None,
+                                                  potential_diffs_remembered=True, batch_size=2)
+        reference, _ = cr.batched_flow_calc(self.test_laplacian,
+                                            fcm.general_flow([(0, 1.), (1, 1.), (2, 0.5)]),
+                                            None, batch_size=2)
+        self.assertTrue(np.max(np.abs(streamed.toarray() - reference.toarray())) < 1e-9)
+        self.assertListEqual(sorted(voltages.keys()), [(0, 1), (0, 2), (1, 2)])
+
+    def test_general_flow_pairs(self):
+        sample = [(3, 1.), (5, 0.5), (3, 1.), (7, 2.)]
+        pairs = fcm.general_flow(sample)
+        self.assertListEqual(pairs.tolist(), [(3, 5, 1.25), (3, 7, 2.), (5, 7, 1.25)])
+        chunks = list(fcm.general_flow_chunks(sample, [(1, 1.), (2, 3.)], chunk_size=4))
+        self.assertListEqual([chunk.shape[0] for chunk in chunks], [4, 2])
+        self.assertListEqual(np.concatenate(chunks)[['i', 'j']].tolist(),
+                             [(3, 1), (3, 2), (5, 1), (5, 2), (7, 1), (7, 2)])
+        self.assertListEqual(fcm.as_pair_array([((0, 1.), (2, 0.5))]).tolist(), [(0, 2, 0.75)])
+        custom_chunks = list(fcm.flow_pair_chunks(lambda *args: [((0, 1.), (2, 0.5))],
+                                                  sample))
+        self.assertListEqual(fcm.concatenate_pair_chunks(custom_chunks).tolist(), [(0, 2, 0.75)])
+        self.assertEqual(fcm.concatenate_pair_chunks([]).shape, (0,))
+
+    def test_edge_current_accumulator(self):
+        potentials = cr.get_potentials(self.test_laplacian, (0, 1), shared_solver=None)
+        _, currents = cr.get_current_matrix(self.test_laplacian, potentials)
+        from_matrix = cr.EdgeCurrentAccumulator(self.test_laplacian)
+        from_matrix.add_current_matrix(currents, 0.5)
+        from_potentials = cr.EdgeCurrentAccumulator(self.test_laplacian)
+        from_potentials.add_potentials(potentials.toarray(), 0.5)
+        ref = np.triu(currents.toarray()) * 0.5
+        self.assertTrue(np.max(np.abs(from_matrix.current_matrix().toarray() - ref)) < 1e-9)
+        self.assertTrue(np.max(np.abs(from_potentials.current_matrix().toarray() - ref)) < 1e-9)
+
+    def test_shared_laplacian(self):
+        handles, descriptor = pcr.share_csc_matrix(self.test_laplacian)
+        try:
+            shared, attached_handles = pcr.attach_csc_matrix(descriptor)
+            self.assertListEqual(shared.toarray().tolist(), self.test_laplacian.toarray().tolist())
+            del shared
+            pcr.release_shared_blocks(attached_handles)
+        finally:
+            pcr.release_shared_blocks(handles, unlink=True)
+
+    def test_superposition_flow_calc(self):
+        pairs = [((0, 1.), (1, 1.)), ((2, 2.), (0, 1.)), ((1, 1.), (2, 0.5))]
+        ref, ref_voltages = cr.batched_flow_calc(self.test_laplacian, pairs, None,
+                                                 potential_diffs_remembered=True)
+        # max_potentials=2 forces the tiled path
+        calc, voltages = cr.superposition_flow_calc(self.test_laplacian, pairs, None,
+                                                    potential_diffs_remembered=True,
+                                                    max_potentials=2)
+        self.assertTrue(np.max(np.abs(calc.toarray() - ref.toarray())) < 1e-6)
+        for key, value in ref_voltages.items():
+            self.assertAlmostEqual(voltages[key], value, places=6)
+
+    @staticmethod
+    def _scale_free_laplacian(node_count, links, random_state):
+        # preferential attachment: each new node links to `links` nodes picked by degree
+        targets, repeated, edges = list(range(links)), [], []
+        for new_node in range(links, node_count):
+            edges.extend((new_node, target) for target in set(targets))
+            repeated.extend(targets + [new_node] * links)
+            targets = random_state.choice(repeated, links).tolist()
+        i, j = np.array(edges).T
+        adjacency = coo_matrix((np.ones(i.shape[0]), (i, j)), shape=(node_count, node_count))
+        adjacency = (adjacency + adjacency.T).tocsc()
+        adjacency.data[:] = 1.
+        return csc_matrix(diags(np.asarray(adjacency.sum(axis=1)).ravel()) - adjacency)
+
+    def test_superposition_flow_calc_scale_free(self):
+        random_state = np.random.RandomState(42)
+        laplacian = self._scale_free_laplacian(2000, 2, random_state)
+        sample = list(zip(random_state.choice(2000, 30, replace=False).tolist(),
+                          random_state.uniform(0.5, 2., 30).tolist()))
+        pairs = fcm.general_flow(sample)
+
+        ref, ref_voltages = cr.batched_flow_calc(laplacian, pairs, None,
+                                                 potential_diffs_remembered=True)
+        ref = ref.toarray()
+        # the line loss offset cancels in the single-node potentials: ~1e-7 relative agreement
+        for max_potentials in [cr.max_cached_potentials, 16]:
+            calc, voltages = cr.superposition_flow_calc(laplacian, pairs, None,
+                                                        potential_diffs_remembered=True,
+                                                        max_potentials=max_potentials)
+            self.assertTrue(np.max(np.abs(calc.toarray() - ref)) / np.max(ref) < 1e-6)
+            self.assertListEqual(sorted(voltages.keys()), sorted(ref_voltages.keys()))
+            self.assertTrue(max(abs(voltages[key] - value) / abs(value)
+                                for key, value in ref_voltages.items()) < 1e-6)
+
+    def test_low_rank_reweight(self):
+        # hub 0 linked to a ring of 80 nodes, more neighbours than low_rank_max_nodes
+        ring = np.arange(1, 81)
+        adjacency = np.zeros((81, 81))
+        adjacency[0, ring] = adjacency[ring, 0] = 1 + ring / 80.
+        adjacency[ring, np.roll(ring, 1)] = adjacency[np.roll(ring, 1), ring] = 1
+        base_laplacian = np.diag(adjacency.sum(axis=1)) - adjacency
+        io_array = np.zeros((81, 1))
+        io_array[[5, 40], 0] = [1, -1]
+
+        for weight in [0.5, 0]:
+            # as done by InteractomeInterface.apply_reweight_dict
+            laplacian = base_laplacian.copy()
+            laplacian[0, :] *= weight
+            laplacian[:, 0] *= weight
+            laplacian[0, 0] = base_laplacian[0, 0] * weight
+            laplacian = csc_matrix(laplacian)
+
+            clear_factor_cache()
+            solver = get_shared_solver(laplacian, None, base_laplacian=csc_matrix(base_laplacian))
+            self.assertIsInstance(solver, LowRankUpdatedSolver)
+            self.assertListEqual(solver.modified_nodes.tolist(), [0])
+
+            ref = chmd.cholesky(laplacian, line_loss)(io_array)
+            ref -= ref[40]
+            calc = solver(io_array)
+            calc -= calc[40]
+            # an ablated hub is isolated and carries no current
+            connected = ring if weight == 0 else np.arange(81)
+            self.assertTrue(np.max(np.abs(calc[connected] - ref[connected])) < 1e-9)
+
+        clear_factor_cache()
+
+    def test_node_potential_cache(self):
+        pairs = [((0, 1.), (1, 1.)), ((2, 2.), (0, 1.)), ((1, 1.), (2, 0.5))]
+        ref, _ = cr.superposition_flow_calc(self.test_laplacian, pairs, None)
+        misses = potential_cache.misses
+        for _ in range(2):
+            calc, _ = cr.superposition_flow_calc(self.test_laplacian, pairs, None,
+                                                 potential_cache_key=('test', 0))
+            self.assertTrue(np.max(np.abs(calc.toarray() - ref.toarray())) < 1e-9)
+        self.assertEqual(potential_cache.misses - misses, 3)
+
+        bounded_cache = NodePotentialCache(2 * 4 * 8)
+        bounded_cache.get_block(('test', 0), np.array([0, 1, 2]), lambda _idx: np.eye(4)[:, _idx])
+        self.assertEqual(bounded_cache.evictions, 1)
+        self.assertEqual(bounded_cache.current_bytes, 2 * 4 * 8)
+        potential_cache.clear()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,71 @@
+"""
+Tests the modifications of the interactome laplacian
+"""
+import unittest
+import warnings
+import numpy as np
+from scipy.sparse import csr_matrix, SparseEfficiencyWarning
+
+from bioflow.molecular_network.InteractomeInterface import InteractomeInterface
+from bioflow.molecular_network.node_table import NodeTable
+
+
+class LaplacianReweightTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # star around node 10, with a 11-12-13 chain
+        adjacency = np.zeros((5, 5))
+        for i, j in [(0, 1), (0, 2), (0, 3), (0, 4), (1, 2), (2, 3)]:
+            adjacency[i, j] = adjacency[j, i] = 1.
+        cls.laplacian = np.diag(adjacency.sum(axis=1)) - adjacency
+        cls.ids = [10, 11, 12, 13, 14]
+
+    def setUp(self):
+        self.interactome_interface = InteractomeInterface()
+        self.interactome_interface.node_table = NodeTable.from_dicts(
+            dict(enumerate(self.ids)), dict((_id, str(_id)) for _id in self.ids),
+            dict((_id, 'UNIPROT:%s' % _id) for _id in self.ids),
+            dict((_id, 'UNIPROT') for _id in self.ids), dict((_id, 'NA') for _id in self.ids))
+        self.interactome_interface.laplacian_matrix = csr_matrix(self.laplacian)
+
+    def _reweight(self, lapl_reweight_dict):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', SparseEfficiencyWarning)
+            self.interactome_interface.apply_reweight_dict(lapl_reweight_dict)
+
+        return self.interactome_interface.laplacian_matrix
+
+    def test_node_ablation(self):
+        laplacian = self._reweight({10: 0})
+
+        reference = self.laplacian.copy()
+        reference[0, :] = 0
+        reference[:, 0] = 0
+
+        self.assertEqual(laplacian.format, 'csr')
+        self.assertListEqual(laplacian.toarray().tolist(), reference.tolist())
+        self.assertEqual(laplacian.nnz, np.count_nonzero(reference))
+
+    def test_node_reweight(self):
+        laplacian = self._reweight({12: 0.5})
+
+        reference = self.laplacian.copy()
+        reference[2, :] *= 0.5
+        reference[:, 2] *= 0.5
+        reference[2, 2] /= 0.5
+
+        self.assertListEqual(laplacian.toarray().tolist(), reference.tolist())
+        self.assertEqual(laplacian.nnz, np.count_nonzero(reference))
+
+    def test_edge_reweight(self):
+        laplacian = self._reweight({(11, 12): -2.})
+
+        reference = self.laplacian.copy()
+        reference[1, 2] = reference[2, 1] = -2.
+
+        self.assertListEqual(laplacian.toarray().tolist(), reference.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
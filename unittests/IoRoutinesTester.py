@@ -0,0 +1,63 @@
+"""
+Tests the binary array dumps of the interactome matrices and eigenvectors
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from bioflow.utils.io_routines import dump_arrays, undump_arrays, sparse_matrix_to_arrays, \
+    arrays_to_sparse_matrix
+
+
+class BinaryDumpTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.adjacency = csr_matrix(np.array([[0, 1, 2], [1, 0, 0], [2, 0, 0]], dtype=float))
+        cls.laplacian = csr_matrix(np.diag([3., 1., 2.])) - cls.adjacency
+
+    def setUp(self):
+        self.dump_directory = os.path.join(tempfile.mkdtemp(), 'binary_dump')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.dump_directory))
+
+    def test_matrices_roundtrip(self):
+        arrays = sparse_matrix_to_arrays('adjacency', self.adjacency)
+        arrays.update(sparse_matrix_to_arrays('laplacian', self.laplacian))
+        dump_arrays(self.dump_directory, arrays)
+
+        loaded, metadata = undump_arrays(self.dump_directory, mmap_mode='c')
+        self.assertIsNone(metadata)
+        for name, matrix in [('adjacency', self.adjacency), ('laplacian', self.laplacian)]:
+            self.assertListEqual(arrays_to_sparse_matrix(loaded, name).toarray().tolist(),
+                                 matrix.toarray().tolist())
+
+        # copy-on-write matrices can be modified in place without touching the dump
+        laplacian = arrays_to_sparse_matrix(loaded, 'laplacian')
+        laplacian.data *= 2
+        read_only, _ = undump_arrays(self.dump_directory, mmap_mode='r')
+        self.assertListEqual(arrays_to_sparse_matrix(read_only, 'laplacian').toarray().tolist(),
+                             self.laplacian.toarray().tolist())
+
+    def test_eigen_roundtrip(self):
+        eigenvals, eigenvects = np.linalg.eigh(self.laplacian.toarray())
+        dump_arrays(self.dump_directory, {'cond_eigenvals': eigenvals,
+                                          'cond_eigenvects': eigenvects},
+                    metadata={'layout': 1})
+
+        loaded, metadata = undump_arrays(self.dump_directory)
+        self.assertDictEqual(metadata, {'layout': 1})
+        self.assertListEqual(sorted(loaded.keys()), ['cond_eigenvals', 'cond_eigenvects'])
+        self.assertListEqual(loaded['cond_eigenvals'].tolist(), eigenvals.tolist())
+        self.assertListEqual(loaded['cond_eigenvects'].tolist(), eigenvects.tolist())
+
+    def test_missing_dump(self):
+        self.assertIsNone(undump_arrays(self.dump_directory))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Tests the node table backing the interactome id maps
+"""
+import unittest
+import numpy as np
+
+from bioflow.molecular_network.node_table import NodeTable
+
+
+class NodeTableTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.node_table = NodeTable.from_dicts(
+            {0: 42, 1: 7, 2: 19},
+            {42: 'RAD51', 7: 'BRCA1', 19: None},
+            {42: 'UNIPROT:Q06609', 7: 'UNIPROT:P38398', 19: 'R-HSA-1'},
+            {42: 'UNIPROT', 7: 'UNIPROT', 19: 'Complex'},
+            {42: 'NA', 7: 'NA', 19: 'nucleoplasm'})
+
+    def test_id_index_translation(self):
+        self.assertListEqual(self.node_table.ids_to_indexes([19, 42., 7]).tolist(), [2, 0, 1])
+        self.assertListEqual(self.node_table.indexes_to_ids([1, 2]).tolist(), [7, 19])
+        self.assertListEqual(self.node_table.contains([7, 8, 19.5, 19.]).tolist(),
+                             [True, False, False, True])
+        self.assertRaises(KeyError, self.node_table.ids_to_indexes, [7, 8])
+
+    def test_views(self):
+        self.assertEqual(self.node_table.id_2_index[19.], 2)
+        self.assertNotIn(8, self.node_table.id_2_index)
+        self.assertNotIn('7', self.node_table.id_2_index)
+        self.assertDictEqual(dict(self.node_table.index_2_id), {0: 42, 1: 7, 2: 19})
+        self.assertDictEqual(dict(self.node_table.column_views['display_name']),
+                             {42: 'RAD51', 7: 'BRCA1', 19: None})
+        self.assertEqual(self.node_table.column_views['node_type'][19], 'Complex')
+        self.assertListEqual(self.node_table.values('localization', np.arange(3)),
+                             ['NA', 'NA', 'nucleoplasm'])
+
+    def test_arrays_roundtrip(self):
+        rebuilt = NodeTable(self.node_table.to_arrays())
+        for column in NodeTable.string_columns + NodeTable.categorical_columns:
+            self.assertDictEqual(dict(rebuilt.column_views[column]),
+                                 dict(self.node_table.column_views[column]))
+
+
+if __name__ == "__main__":
+    unittest.main()
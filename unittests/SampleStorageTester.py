@@ -0,0 +1,189 @@
+"""
+Tests the embedded sample storage backend
+"""
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from bioflow.sample_storage import local_store, sample_schema
+
+
+class LocalStoreTester(unittest.TestCase):
+
+    collection = 'test_samples'
+
+    def setUp(self):
+        self.sample_storage_location = local_store.sample_storage_location
+        local_store.sample_storage_location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        local_store.drop_samples(self.collection)
+        shutil.rmtree(local_store.sample_storage_location)
+        local_store.sample_storage_location = self.sample_storage_location
+
+    def _insert(self, sys_hash, sampling_policy_options, currents):
+        local_store.insert_sample(self.collection, {
+            'sys_hash': sys_hash,
+            'sampling_policy_options': sampling_policy_options,
+            'size': np.int64(currents.shape[0]),
+            'voltages': b'\x00\x01\x02',
+            'currents': currents})
+
+    def test_roundtrip(self):
+        self._insert('a', 'exact', np.arange(3, dtype=np.float64))
+        self._insert('a', ('distro', 10), np.ones(2))
+        self._insert('b', None, np.zeros(1))
+
+        self.assertEqual(local_store.count_samples(self.collection, {}), 3)
+        self.assertEqual(local_store.count_samples(self.collection, {'sys_hash': 'a'}), 2)
+        self.assertEqual(local_store.count_samples(self.collection,
+                                                   {'sys_hash': 'a', 'size': np.int64(3)}), 1)
+        self.assertEqual(local_store.count_samples(self.collection,
+                                                   {'sampling_policy_options': None}), 1)
+
+        sample, = local_store.find_samples(self.collection, {'sys_hash': 'a', 'size': 3})
+        self.assertEqual(sample['sampling_policy_options'], 'exact')
+        self.assertEqual(sample['voltages'], b'\x00\x01\x02')
+        self.assertListEqual(sample['currents'].tolist(), [0., 1., 2.])
+
+        projected, = local_store.find_samples(self.collection, {'sys_hash': 'b'},
+                                              projection=['currents'])
+        self.assertNotIn('voltages', projected)
+        self.assertListEqual(projected['currents'].tolist(), [0.])
+        self.assertEqual(projected['size'], 1)
+
+        local_store.drop_samples(self.collection)
+        self.assertEqual(local_store.count_samples(self.collection, {}), 0)
+
+    def test_non_scalar_filters(self):
+        self._insert('a', ['distro', 10], np.ones(2))
+        self._insert('a', 'exact', np.ones(2))
+
+        for options in [('distro', 10), ['distro', 10], ['distro', np.int64(10)]]:
+            self.assertEqual(local_store.count_samples(
+                self.collection, {'sampling_policy_options': options}), 1)
+
+        self.assertEqual(local_store.count_samples(
+            self.collection, {'sampling_policy_options': ['distro', 11]}), 0)
+
+        with self.assertRaises(Exception):
+            local_store.count_samples(self.collection, {'sampling_policy_options': {'$ne': 1}})
+
+
+class SampleSchemaTester(unittest.TestCase):
+
+    collection = 'test_schema_samples'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ids = [10, 11, 12, 13]
+        cls.index_2_label = np.array(cls.ids)
+        cls.label_2_index = dict((_id, _idx) for _idx, _id in enumerate(cls.ids))
+        cls.current_matrix = csr_matrix(np.array([[0., 1., 0., 0.],
+                                                  [1., 0., 0.5, 0.],
+                                                  [0., 0.5, 0., 0.25],
+                                                  [0., 0., 0.25, 0.]]))
+        cls.node_currents = np.array([1., 1.5, 0.75, 0.25])
+        cls.voltage_indexes = np.array([[1, 0], [0, 3]])
+        cls.voltage_values = np.array([0.5, 1.25])
+
+    def setUp(self):
+        self.sample_storage_location = local_store.sample_storage_location
+        local_store.sample_storage_location = tempfile.mkdtemp()
+
+    def tearDown(self):
+        local_store.drop_samples(self.collection)
+        shutil.rmtree(local_store.sample_storage_location)
+        local_store.sample_storage_location = self.sample_storage_location
+
+    def _encode(self, scale=1.):
+        return sample_schema.encode_rand_sample(
+            {'sys_hash': 'a', 'sparse_rounds': False},
+            [10, 13], [(10, 1.), (13, 2.)], None,
+            self.node_currents * scale, self.voltage_indexes, self.voltage_values * scale,
+            current_matrix=self.current_matrix * scale)
+
+    def _legacy(self, scale=1.):
+        node_currents = dict(zip(self.ids, (self.node_currents * scale).tolist()))
+        voltages = {(10, 11): 0.5 * scale, (10, 13): 1.25 * scale}
+        return {'sys_hash': 'a', 'sparse_rounds': False,
+                'UPs': pickle.dumps([10, 13]),
+                'sample': pickle.dumps([(10, 1.), (13, 2.)]),
+                'sec_sample': pickle.dumps(None),
+                'currents': pickle.dumps((self.current_matrix * scale, node_currents)),
+                'voltages': pickle.dumps(voltages)}
+
+    def test_encode_rand_sample(self):
+        sample = self._encode()
+
+        self.assertEqual(sample['schema_version'], sample_schema.sample_schema_version)
+        self.assertEqual(sample['sys_hash'], 'a')
+        self.assertEqual(sample['UPs'].dtype, np.int64)
+        self.assertEqual(sample['sample'].shape, (2, 2))
+        self.assertIsNone(sample['sec_sample'])
+        self.assertEqual(sample['node_currents'].dtype, np.float32)
+        self.assertEqual(sample['voltage_indexes'].dtype, np.int32)
+        self.assertEqual(sample['voltage_indexes'].shape, (2, 2))
+        self.assertNotIn('current_data', sample)
+        self.assertIsNone(sample_schema.decode_current_matrix(sample))
+
+    def test_decode(self):
+        sample = self._encode()
+        node_currents = dict(zip(self.ids, self.node_currents.tolist()))
+        voltages = {(10, 11): 0.5, (10, 13): 1.25}
+
+        for index_2_label in [self.index_2_label, dict(enumerate(self.ids))]:
+            self.assertDictEqual(sample_schema.decode_node_currents(sample, index_2_label),
+                                 node_currents)
+            self.assertDictEqual(sample_schema.decode_voltages(sample, index_2_label), voltages)
+
+        self.assertListEqual(
+            sample_schema.decode_node_current_vector(sample, self.label_2_index, 4).tolist(),
+            self.node_currents.tolist())
+
+    def test_current_matrix(self):
+        store_sample_current_matrices = sample_schema.store_sample_current_matrices
+        sample_schema.store_sample_current_matrices = True
+        try:
+            sample = self._encode()
+        finally:
+            sample_schema.store_sample_current_matrices = store_sample_current_matrices
+
+        current_matrix = sample_schema.decode_current_matrix(sample)
+        self.assertEqual(current_matrix.format, 'csr')
+        self.assertListEqual(current_matrix.toarray().tolist(),
+                             self.current_matrix.toarray().tolist())
+
+    def test_legacy_roundtrip(self):
+        local_store.insert_sample(self.collection, self._legacy())
+        sample, = local_store.find_samples(self.collection, {'sys_hash': 'a'})
+
+        self.assertDictEqual(sample_schema.decode_node_currents(sample, self.index_2_label),
+                             dict(zip(self.ids, self.node_currents.tolist())))
+        self.assertListEqual(
+            sample_schema.decode_node_current_vector(sample, self.label_2_index, 4).tolist(),
+            self.node_currents.tolist())
+        self.assertDictEqual(sample_schema.decode_voltages(sample, self.index_2_label),
+                             {(10, 11): 0.5, (10, 13): 1.25})
+        self.assertListEqual(sample_schema.decode_current_matrix(sample).toarray().tolist(),
+                             self.current_matrix.toarray().tolist())
+
+    def test_node_current_chunks(self):
+        local_store.insert_sample(self.collection, self._legacy())
+        local_store.insert_sample(self.collection, self._encode(2.))
+        local_store.insert_sample(self.collection, self._legacy(3.))
+
+        samples = local_store.find_samples(self.collection, {'sys_hash': 'a'},
+                                           projection=sample_schema.node_currents_fields)
+        chunks = list(sample_schema.node_current_chunks(samples, self.label_2_index, 4, 2))
+
+        self.assertListEqual([chunk.shape for chunk in chunks], [(2, 4), (1, 4)])
+        self.assertListEqual(np.vstack(chunks).tolist(),
+                             [(self.node_currents * scale).tolist() for scale in [1., 2., 3.]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Tests the random sampling policies used to build the null models
+"""
+import unittest
+import numpy as np
+
+from bioflow.algorithms_bank import sampling_policies
+
+
+class SamplingPoliciesTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.floats = np.array([0.5, 1., 2., 4., 8.])
+        cls.background = [(_id, float(_id % 3 + 1)) for _id in range(100, 120)]
+
+    def setUp(self):
+        np.random.seed(42)
+
+    def test_weighted_sampling_batch(self):
+        weights = np.array([1., 2., 3., 4., 0.])
+        selected = sampling_policies.weighted_sampling_batch(weights, 2, 20000)
+
+        self.assertEqual(selected.shape, (20000, 2))
+        self.assertTrue(np.all(selected[:, 0] != selected[:, 1]))
+        self.assertFalse(np.any(selected == 4))
+
+        first_draws = np.bincount(selected[:, 0], minlength=5) / 20000.
+        self.assertTrue(np.max(np.abs(first_draws - weights / weights.sum())) < 0.02)
+
+    def test_weighted_sampling_batch_full_background(self):
+        selected = sampling_policies.weighted_sampling_batch(np.array([1., 1., 5.]), 3, 10)
+        self.assertListEqual(np.sort(selected, axis=1).tolist(), [[0, 1, 2]] * 10)
+
+    def test_not_enough_weights(self):
+        with self.assertRaises(ValueError):
+            sampling_policies.weighted_sampling_batch(np.array([1., 0., 0., 2.]), 3, 10)
+
+    def test_sample_floats_batch(self):
+        exact = sampling_policies._sample_floats_batch(self.floats, 7, 'exact')
+        self.assertEqual(exact.shape, (7, 5))
+        self.assertListEqual(np.sort(exact, axis=1).tolist(), [self.floats.tolist()] * 7)
+
+        for method in ['distro', 'logdistro']:
+            sampled = sampling_policies._sample_floats_batch(self.floats, 7, method,
+                                                             matched_distro_precision=10)
+            self.assertEqual(sampled.shape, (7, 5))
+            self.assertTrue(np.all(sampled >= self.floats.min() * (1 - 1e-9)))
+            self.assertTrue(np.all(sampled <= self.floats.max() * (1 + 1e-9)))
+
+        self.assertEqual(sampling_policies._sample_floats(self.floats, 'logdistro').shape, (5,))
+
+        with self.assertRaises(Exception):
+            sampling_policies._sample_floats_batch(self.floats, 7, 'uniform')
+
+    def test_matched_sample_distribution(self):
+        floats = np.random.lognormal(size=1000)
+        samples = sampling_policies.matched_sample_distribution(floats, 20000, granularity=50)
+        self.assertEqual(samples.shape, (20000,))
+        self.assertAlmostEqual(np.median(samples), np.median(floats), delta=0.1)
+
+        log_samples = sampling_policies.matched_sample_distribution(floats, 20000,
+                                                                    granularity=50, logmode=True)
+        self.assertTrue(np.all(log_samples > 0))
+        self.assertAlmostEqual(np.median(np.log(log_samples)), np.median(np.log(floats)),
+                               delta=0.1)
+
+    def test_matched_sampling_split(self):
+        sample = [(100, 1.), (101, 2.), (102, 3.)]
+        secondary_sample = [(103, 0.5), (104, 4.)]
+        background_ids = set(_id for _id, _ in self.background)
+
+        for method in ['exact', 'distro', 'logdistro']:
+            draws = list(sampling_policies.matched_sampling(sample, secondary_sample,
+                                                            self.background, 50, method))
+            self.assertEqual(len(draws), 50)
+
+            for i, (counter, primary, secondary) in enumerate(draws):
+                self.assertEqual(counter, i)
+                self.assertEqual(len(primary), 3)
+                self.assertEqual(len(secondary), 2)
+                primary_ids = set(_id for _id, _ in primary)
+                secondary_ids = set(_id for _id, _ in secondary)
+                self.assertEqual(len(primary_ids | secondary_ids), 5)
+                self.assertTrue(primary_ids | secondary_ids <= background_ids)
+
+    def test_matched_sampling_ids(self):
+        draws = list(sampling_policies.matched_sampling([1, 2, 3, 4], None,
+                                                        list(range(10)), 5))
+        self.assertListEqual([len(primary) for _, primary, _ in draws], [4] * 5)
+        self.assertTrue(all(secondary is None for _, _, secondary in draws))
+
+
+if __name__ == "__main__":
+    unittest.main()
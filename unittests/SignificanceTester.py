@@ -0,0 +1,104 @@
+"""
+Tests the aggregation of the random samples into the null model and the significance evaluation
+"""
+import os
+import shutil
+import unittest
+import tempfile
+import numpy as np
+
+from bioflow.configs.main_configs import Dumps
+import bioflow.algorithms_bank.flow_significance_evaluation as significance
+from bioflow.algorithms_bank.flow_significance_evaluation import NullModelAccumulator, \
+    GumbelSignificanceEngine, p_values_settled
+
+
+class NullModelTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.degrees = np.array([1., 1., 2., 2., 3.])
+        cls.currents = np.array([[0.1, 0.3, 0.2, 0., 0.5],
+                                 [0.4, 0.2, 0., 0.6, 0.],
+                                 [0., 0., 0., 0., 0.]])
+
+        cls.null_model = NullModelAccumulator(cls.degrees, cls.degrees)
+        cls.null_model.add_samples(cls.currents[:2])
+        cls.null_model.add_samples(cls.currents[2:])
+
+    def test_run_maxima(self):
+        self.assertEqual(self.null_model.runs, 2)
+        self.assertListEqual(self.null_model.max_array().T.tolist(),
+                             [[0.3, 1.], [0.2, 2.], [0.5, 3.], [0.4, 1.], [0.6, 2.]])
+
+    def test_windowed_statistics(self):
+        means, stds = self.null_model.windowed_mean_std(np.array([1., 2., 5.]))
+        background = self.currents[:2, :2][self.currents[:2, :2] > 0]
+        self.assertAlmostEqual(means[0], background.mean())
+        self.assertAlmostEqual(stds[0], background.std())
+        self.assertAlmostEqual(means[1], 0.4)
+        self.assertTrue(np.isnan(means[2]))
+
+    def test_histogram(self):
+        counts, edges = self.null_model.histogram(1.5)
+        self.assertEqual(counts.sum(), 7)
+        self.assertGreater(edges[-1], 1.5)
+        self.assertEqual(self.null_model.scatter().shape, (2, 7))
+
+    def test_limit_relaxation(self):
+        null_model = NullModelAccumulator(self.degrees, self.degrees, limit=0.01)
+        null_model.add_samples(np.array([[100., 0.5, 0., 0., 0.]]))
+        self.assertEqual(null_model.window_counts.sum(), 2)
+
+
+class GumbelSignificanceTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.gumbel_fit_cache = Dumps.gumbel_fit_cache
+        Dumps.gumbel_fit_cache = tempfile.mkdtemp()
+        random_state = np.random.RandomState(42)
+        degrees = random_state.randint(1, 20, 500).astype(np.float64)
+        cls.max_array = np.vstack((random_state.gumbel(0.3, 0.05, 500) + degrees * 0.01,
+                                   degrees))
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(Dumps.gumbel_fit_cache)
+        Dumps.gumbel_fit_cache = cls.gumbel_fit_cache
+
+    def test_matches_per_degree_evaluation(self):
+        degrees = np.array([1., 2., 7., 19.])
+        entries = np.array([0.3, 0.4, 0.5, 0.6])
+        engine = GumbelSignificanceEngine(self.max_array, min_nodes=40)
+
+        for degree, entry, p_value in zip(degrees, entries, engine.p_values(entries, degrees)):
+            max_set = significance.get_neighboring_degrees(degree, self.max_array, min_nodes=40)
+            start, stop = engine.neighbor_windows(np.array([degree]))
+            self.assertListEqual(sorted(max_set), sorted(engine.maxima[start[0]:stop[0]]))
+            self.assertAlmostEqual(
+                p_value, significance.get_p_val_by_gumbel(np.array([entry]), max_set)[0])
+
+    def test_fits_reused(self):
+        engine = GumbelSignificanceEngine(self.max_array, min_nodes=10)
+        p_values = engine.p_values([0.4, 0.5], [3., 3.])
+        significance._gumbel_fit_cache.clear()
+
+        reloaded = GumbelSignificanceEngine(self.max_array[:, ::-1], min_nodes=10)
+        self.assertEqual(reloaded.null_model_hash, engine.null_model_hash)
+        self.assertListEqual(reloaded.p_values([0.4, 0.5], [3., 3.]).tolist(), p_values.tolist())
+        self.assertIn((engine.null_model_hash, 3.), significance._gumbel_fit_cache)
+
+    def test_transient_fits_not_saved(self):
+        engine = GumbelSignificanceEngine(self.max_array[:, :300], min_nodes=10, persistent=False)
+        engine.p_values([0.4], [3.])
+        self.assertIn((engine.null_model_hash, 3.), engine._fits)
+        self.assertNotIn((engine.null_model_hash, 3.), significance._gumbel_fit_cache)
+        self.assertFalse(os.path.isfile(significance._gumbel_fit_location(engine.null_model_hash)))
+
+    def test_sampling_depth_settled(self):
+        p_values = np.array([1e-4, 0.06, 0.9])
+        self.assertFalse(p_values_settled(p_values, None, 100, 0.05))
+        self.assertFalse(p_values_settled(p_values, p_values + [0., 0.1, 0.], 100, 0.05))
+        self.assertTrue(p_values_settled(p_values, p_values + [0.1, 0.01, 0.1], 100, 0.05))
+        self.assertTrue(p_values_settled(p_values, None, 100000, 0.05))
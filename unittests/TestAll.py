@@ -6,6 +6,14 @@ from unittests.LoggerTester import TestLogs
 from unittests.UtilitiesTester import GdfExportTester, LinalgRoutinesTester, SanerFilesystemTester
 from unittests.ParserTester import GoParserTester, UniprotParserTester
 from unittests.ConductionTester import ConductionRoutinesTester
+from unittests.NodeTableTester import NodeTableTester
+from unittests.IoRoutinesTester import BinaryDumpTester
+from unittests.SignificanceTester import NullModelTester, GumbelSignificanceTester
+from unittests.SamplingPoliciesTester import SamplingPoliciesTester
+from unittests.AnnotationNetworkTester import GoReachTester
+from unittests.InteractomeInterfaceTester import LaplacianReweightTester
+from unittests.WeightingPoliciesTester import WeightingPoliciesTester
+from unittests.SampleStorageTester import LocalStoreTester, SampleSchemaTester
 
 
 class HooksConfigTest(unittest.TestCase):
@@ -19,5 +27,10 @@ if __name__ == "__main__":
         TestRnaCountsProcessor.__doc__, TestLogs.__doc__, GdfExportTester.__doc__,
         LinalgRoutinesTester.__doc__, SanerFilesystemTester.__doc__, GoParserTester.__doc__,
         UniprotParserTester.__doc__,
-        ConductionRoutinesTester.__doc__]
+        ConductionRoutinesTester.__doc__, NodeTableTester.__doc__, BinaryDumpTester.__doc__,
+        NullModelTester.__doc__,
+        GumbelSignificanceTester.__doc__, SamplingPoliciesTester.__doc__,
+        GoReachTester.__doc__, LaplacianReweightTester.__doc__,
+        WeightingPoliciesTester.__doc__, LocalStoreTester.__doc__,
+        SampleSchemaTester.__doc__]
     unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests the array versions of the edge weighting policies against the scalar ones
+"""
+import unittest
+from collections import defaultdict
+import numpy as np
+
+import bioflow.configs.main_configs as confs
+from bioflow.algorithms_bank import weigting_policies as wp
+
+
+class _Node(object):
+
+    def __init__(self, _id):
+        self.id = _id
+
+
+class _Edge(dict):
+    # mimics the neo4j relationships: missing properties are None
+
+    def __init__(self, start_node, end_node, _type, **properties):
+        super(_Edge, self).__init__(**properties)
+        self.start_node = start_node
+        self.end_node = end_node
+        self.type = _type
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+
+class WeightingPoliciesTester(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.node_dict = dict((_id, _Node(_id)) for _id in [5, 6, 7, 8])
+        cls.node_id_2_mat_idx = dict((_id, _idx) for _idx, _id in enumerate(cls.node_dict))
+        nodes = cls.node_dict
+        cls.edge_list = [
+            _Edge(nodes[5], nodes[6], 'is_interacting', source='BioGRID', confidence=0.9),
+            _Edge(nodes[6], nodes[7], 'is_part_of_collection', source='Reactome'),
+            _Edge(nodes[7], nodes[8], 'is_same', source=None),
+            _Edge(nodes[8], nodes[5], 'is_weakly_interacting'),
+            _Edge(nodes[5], nodes[7], 'is_interacting', source='HINT'),
+            _Edge(nodes[6], nodes[5], 'is_catalysant', source='BioGRID'),
+        ]
+        cls.edge_table = wp.build_edge_table(cls.node_dict, cls.edge_list, cls.node_id_2_mat_idx)
+
+    def _scalar_weights(self, policy):
+        return [policy(self.node_dict[_edge.start_node.id], self.node_dict[_edge.end_node.id],
+                       _edge) for _edge in self.edge_list]
+
+    def test_edge_table(self):
+        self.assertListEqual(self.edge_table['start_idx'].tolist(), [0, 1, 2, 3, 0, 1])
+        self.assertListEqual(self.edge_table['source'].tolist(),
+                             ['BioGRID', 'Reactome', None, None, 'HINT', 'BioGRID'])
+        self.assertTrue(np.isnan(self.edge_table['confidence'][1]))
+        self.assertListEqual(self.edge_table['start_degree'].tolist(), [4, 3, 3, 2, 4, 3])
+
+    def test_default_array_policies(self):
+        for scalar_policy, array_policy in [
+                (wp.default_lapl_source_x_type_policy, wp.default_lapl_source_x_type_array_policy),
+                (wp.default_adj_source_x_type_policy, wp.default_adj_source_x_type_array_policy),
+                (wp.flat_policy, wp.flat_array_policy)]:
+            self.assertIs(wp.get_array_policy(scalar_policy), array_policy)
+            self.assertIs(wp.get_array_policy(array_policy), array_policy)
+            self.assertListEqual(array_policy(self.edge_table).tolist(),
+                                 self._scalar_weights(scalar_policy))
+
+    def test_source_maps(self):
+        source_weights = defaultdict(lambda: 1., {'BioGRID': 0., None: 0.25, 'HINT': 2.})
+        weights = wp.source_x_type_array_policy(self.edge_table, source_weights,
+                                                confs.laplacian_default_type_edge_weighting,
+                                                drop_chance=0)
+        reference = [wp.source_x_type_policy(None, None, _edge, source_weights,
+                                             confs.laplacian_default_type_edge_weighting,
+                                             drop_chance=0)
+                     for _edge in self.edge_list]
+        self.assertListEqual(weights.tolist(), reference)
+        self.assertListEqual(weights.tolist(), [0., 0.5, 25., 0.125, 2., 0.])
+
+    def test_register_array_policy(self):
+        def confidence_policy(start_node, end_node, edge):
+            return edge['confidence'] or 0.5
+
+        def confidence_array_policy(edge_table):
+            return np.nan_to_num(edge_table['confidence'], nan=0.5)
+
+        wp.register_array_policy(confidence_policy, confidence_array_policy)
+        try:
+            self.assertIs(wp.get_array_policy(confidence_policy), confidence_array_policy)
+            self.assertListEqual(wp.get_array_policy(confidence_policy)(self.edge_table).tolist(),
+                                 self._scalar_weights(confidence_policy))
+        finally:
+            del wp._array_policies[confidence_policy]
+
+    def test_scalar_fallback(self):
+        def degree_policy(start_node, end_node, edge):
+            return start_node.id * 0.5 + end_node.id
+
+        fallback = wp.get_array_policy(degree_policy)
+        self.assertEqual(fallback.__name__, 'scalar_fallback')
+        self.assertListEqual(fallback(self.edge_table).tolist(),
+                             self._scalar_weights(degree_policy))
+
+
+if __name__ == "__main__":
+    unittest.main()